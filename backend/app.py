@@ -3,26 +3,47 @@
 # ------------------------------
 
 # 1️⃣ Load environment variables from .env
+import time
+PROCESS_START = time.perf_counter()
+
 from dotenv import load_dotenv
 import os
 
 load_dotenv()  # loads .env file in backend folder
 
-# Optional: Test if keys are loaded
-print("Spoonacular Key:", os.getenv("SPOONACULAR_API_KEY"))
-print("Roboflow Key:", os.getenv("ROBOFLOW_API_KEY"))
+# Report which keys are configured (never the values themselves)
+print("Spoonacular key configured:", bool(os.getenv("SPOONACULAR_API_KEY")))
+print("Roboflow key configured:", bool(os.getenv("ROBOFLOW_API_KEY")))
 
 # 2️⃣ Import other modules
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import shutil
+from starlette.background import BackgroundTask
+import asyncio
+import json
+import logging
+import threading
+import traceback
 import uuid
-from services import YoloService, SpoonacularService
+from concurrent.futures import Future, ThreadPoolExecutor
+from services import YoloService, SpoonacularService, columnar_detections
+from batching import BatchingQueue
+from worker_pool import YoloWorkerPool
+from uploads import UploadLimitMiddleware, UploadStore
+from preprocess import ImageTooLarge, open_image
+from local_recipes import load_local_recipes
+from camera import FrameDiffer, InventoryTracker
+from metrics import REQUESTS, STAGE_SECONDS, UPSTREAM_ATTEMPTS, UPSTREAM_RESPONSES, counter_lines, log_event
 
 # 3️⃣ Initialize FastAPI
 app = FastAPI(title="VisionChef API")
 
+# Oversized uploads get a 413 before they are read (added first so CORS headers still apply)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+app.add_middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
+
 # 4️⃣ Allow CORS for local frontend development
 app.add_middleware(
     CORSMiddleware,
@@ -33,71 +54,494 @@ app.add_middleware(
 )
 
 # 5️⃣ Initialize services
-yolo_service = YoloService()
+# Heavy work (model load + warmup, local recipe index) happens on a background
+# thread after startup so the server accepts connections immediately;
+# /ready reports when it is done.
 spoonacular_service = SpoonacularService()
+recipe_service = spoonacular_service
+RECIPE_BACKEND = os.getenv("RECIPE_BACKEND", "spoonacular")
+
+# Inference never runs on the event loop. Modes, in order of precedence:
+# - YOLO_WORKERS > 0: a pool of model processes fed through shared memory
+# - YOLO_BATCH_MAX_SIZE > 1: concurrent uploads share one forward pass on the batcher thread
+# - otherwise: each image runs on a small bounded thread pool
+YOLO_WORKERS = int(os.getenv("YOLO_WORKERS", "0"))
+YOLO_BATCH_MAX_SIZE = int(os.getenv("YOLO_BATCH_MAX_SIZE", "8"))
+yolo_service = None
+yolo_pool = None
+yolo_batcher = None
+yolo_executor = None
+
+startup_state = {"ready": False, "stage": "starting", "error": None, "timings": {}}
+
+def _initialize():
+    global yolo_service, yolo_pool, yolo_batcher, yolo_executor, recipe_service
+    timings = startup_state["timings"]
+    try:
+        startup_state["stage"] = "loading_recipes"
+        start = time.perf_counter()
+        local_recipes = load_local_recipes()
+        # Local index (if a corpus is present) is Spoonacular's fallback;
+        # RECIPE_BACKEND=local serves from the index only.
+        spoonacular_service.fallback = local_recipes
+        if RECIPE_BACKEND == "local":
+            if local_recipes is None:
+                raise RuntimeError("RECIPE_BACKEND=local but no recipe corpus found (set RECIPE_CORPUS_PATH)")
+            recipe_service = local_recipes
+        timings["recipes_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if YOLO_WORKERS > 0:
+            startup_state["stage"] = "starting_workers"
+            pool = YoloWorkerPool(
+                YOLO_WORKERS,
+                pin_cores=os.getenv("YOLO_PIN_CORES", "1") == "1",
+            )
+            pool.start()
+            yolo_pool = pool
+            timings["workers_s"] = time.perf_counter() - start
+        else:
+            startup_state["stage"] = "loading_model"
+            service = YoloService()  # loads the model and runs a warmup inference
+            timings.update({f"model_{k}": v for k, v in service.startup_timings.items()})
+            if YOLO_BATCH_MAX_SIZE > 1:
+                batcher = BatchingQueue(
+                    service,
+                    max_batch_size=YOLO_BATCH_MAX_SIZE,
+                    max_wait_ms=float(os.getenv("YOLO_BATCH_MAX_WAIT_MS", "10")),
+                )
+                batcher.start()
+                yolo_batcher = batcher
+            else:
+                yolo_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("YOLO_EXECUTOR_WORKERS", "2")),
+                    thread_name_prefix="yolo",
+                )
+            yolo_service = service
+
+        timings["total_s"] = time.perf_counter() - PROCESS_START
+        startup_state["stage"] = "ready"
+        startup_state["ready"] = True
+        breakdown = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items())
+        print(f"VisionChef ready ({breakdown})")
+    except Exception as e:
+        startup_state["stage"] = "failed"
+        startup_state["error"] = str(e)
+        print(f"Error during startup: {e}")
+        traceback.print_exc()
+
+def submit_detection(image) -> Future:
+    if yolo_pool is not None:
+        return yolo_pool.submit(image)
+    if yolo_batcher is not None:
+        return yolo_batcher.submit(image)
+    return yolo_executor.submit(yolo_service.detect, image)
+
+# Backpressure: reject with 503 instead of queueing without limit
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "32"))
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+@app.on_event("startup")
+def start_background_init():
+    startup_state["timings"]["imports_s"] = time.perf_counter() - PROCESS_START
+    threading.Thread(target=_initialize, name="startup", daemon=True).start()
 
-# 6️⃣ Ensure temporary uploads folder exists
-os.makedirs("temp_uploads", exist_ok=True)
+@app.on_event("shutdown")
+async def stop_services():
+    if yolo_pool is not None:
+        yolo_pool.stop()
+    if yolo_batcher is not None:
+        yolo_batcher.stop()
+    if yolo_executor is not None:
+        yolo_executor.shutdown(wait=False)
+    await spoonacular_service.aclose()
+
+# 6️⃣ Uploads are decoded in memory; writing them to disk is an opt-in debug mode
+upload_store = None
+if os.getenv("DEBUG_SAVE_UPLOADS", "0") == "1":
+    upload_store = UploadStore(
+        directory=os.getenv("UPLOAD_DIR", "temp_uploads"),
+        max_bytes=int(os.getenv("UPLOAD_MAX_BYTES", str(500 * 1024 * 1024))),
+        max_age_seconds=float(os.getenv("UPLOAD_MAX_AGE_SECONDS", str(24 * 3600))),
+    )
 
 # 7️⃣ Root endpoint
 @app.get("/")
 def read_root():
     return {"message": "VisionChef API is running"}
 
+# Readiness: 200 only once the model is loaded and warmed up
+@app.get("/ready")
+def ready():
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content=startup_state)
+    return startup_state
+
+# Batch size / queue wait histograms for tuning the batching window
+@app.get("/stats/batching")
+def batching_stats():
+    if yolo_batcher is None:
+        return {"enabled": False}
+    return yolo_batcher.stats()
+
+# Per-process health of the YOLO worker pool
+@app.get("/stats/workers")
+def worker_stats():
+    if yolo_pool is None:
+        return {"enabled": False}
+    return yolo_pool.stats()
+
+def _detection_cache_stats():
+    # In pool mode the detection cache sits in front of the worker processes
+    owner = yolo_pool if yolo_pool is not None else yolo_service
+    return owner.cache_stats() if owner is not None else None
+
+# Detection and recipe cache hit/miss counters
+@app.get("/stats/cache")
+def cache_stats():
+    return {
+        "detections": _detection_cache_stats() or {"enabled": False},
+        "recipes": spoonacular_service.cache.stats(),
+    }
+
+# Spoonacular circuit breaker, rate limiter and stale-cache counters
+@app.get("/stats/upstream")
+def upstream_stats():
+    return spoonacular_service.upstream_stats()
+
+# Prometheus text format: per-stage latency histograms, request and upstream
+# status counters, cache hit/miss counters and the batching histograms
+@app.get("/metrics")
+def metrics():
+    lines = (STAGE_SECONDS.prometheus() + REQUESTS.prometheus() + UPSTREAM_RESPONSES.prometheus()
+             + UPSTREAM_ATTEMPTS.prometheus())
+    circuit = spoonacular_service.breaker.state
+    lines += counter_lines("visionchef_upstream_circuit_state", "Spoonacular circuit breaker state (1 = current)",
+                           [({"state": state}, int(state == circuit)) for state in ("closed", "open", "half_open")],
+                           kind="gauge")
+
+    caches = []
+    detections = _detection_cache_stats()
+    if detections is not None and detections["mode"] != "off":
+        caches += [({"cache": "detections", "result": "hit"}, detections["hits"]),
+                   ({"cache": "detections", "result": "miss"}, detections["misses"])]
+    for name, stats in spoonacular_service.cache.stats().items():
+        if isinstance(stats, dict) and "hits" in stats:
+            caches += [({"cache": f"recipe_{name}", "result": "hit"}, stats["hits"]),
+                       ({"cache": f"recipe_{name}", "result": "miss"}, stats["misses"])]
+    lines += counter_lines("visionchef_cache_lookups_total", "Cache lookups by cache and result", caches)
+
+    if yolo_batcher is not None:
+        lines += ["# HELP visionchef_batch_size Images per YOLO forward pass",
+                  "# TYPE visionchef_batch_size histogram"]
+        lines += yolo_batcher.batch_sizes.prometheus("visionchef_batch_size")
+        lines += ["# HELP visionchef_queue_wait_ms Time images waited in the batching queue",
+                  "# TYPE visionchef_queue_wait_ms histogram"]
+        lines += yolo_batcher.queue_wait_ms.prometheus("visionchef_queue_wait_ms")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+# Fridge-camera stream counters
+@app.get("/stats/camera")
+def camera_stats_endpoint():
+    return camera_stats
+
 # 8️⃣ Analyze fridge endpoint
+def _check_available(endpoint: str):
+    if not startup_state["ready"]:
+        REQUESTS.inc(endpoint, "503")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model is not ready yet ({startup_state['stage']})",
+            headers={"Retry-After": "5"},
+        )
+    if request_slots.locked():
+        REQUESTS.inc(endpoint, "503")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
 @app.post("/analyze_fridge")
-async def analyze_fridge(file: UploadFile = File(...)):
-    # Save uploaded file
+async def analyze_fridge(
+    response: Response,
+    file: UploadFile = File(...),
+    # "columnar" returns raw_detections as {labels, boxes, confidences} lists
+    detections_format: str = Query("objects", alias="format", pattern="^(objects|columnar)$"),
+):
+    _check_available("analyze_fridge")
+    timings = {}
+    async with request_slots:
+        result = await _analyze_fridge(file, detections_format, timings)
+    # Per-stage durations in ms (shown in browser dev tools, parsed by benchmarks/load_test.py)
+    response.headers["Server-Timing"] = ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items())
+    return result
+
+async def _read_upload(file: UploadFile):
+    # Read the upload into memory; YOLO decodes it from bytes
     file_extension = file.filename.split(".")[-1]
     filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = f"temp_uploads/{filename}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    with STAGE_SECONDS.time("upload_read"):
+        contents = await file.read()
+
+    # Header-only check, so a bad or oversized image is rejected before it reaches a batch
+    try:
+        open_image(contents)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a supported image")
+
+    if upload_store is not None:
+        await asyncio.to_thread(upload_store.save, filename, contents)
+    return filename, contents
+
+async def _detect(contents: bytes):
+    detection_result = await asyncio.wrap_future(submit_detection(contents))
+    detected_ingredients = detection_result.get("ingredients", [])
+    detections = detection_result.get("detections", [])
+    return detected_ingredients, detections
+
+async def _analyze_fridge(file: UploadFile, detections_format: str = "objects", timings: dict = None):
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    filename, contents = await _read_upload(file)
+    timings["read"] = (time.perf_counter() - start) * 1000
     
     try:
-        print(f"Processing image: {filename}")
-        
         # Detect Ingredients
-        print("Running YOLO detection...")
-        detection_result = yolo_service.detect(file_path)
-        detected_ingredients = detection_result.get("ingredients", [])
-        detections = detection_result.get("detections", [])
-        
-        print(f"Detected ingredients: {detected_ingredients}")
+        start = time.perf_counter()
+        detected_ingredients, detections = await _detect(contents)
+        timings["detect"] = (time.perf_counter() - start) * 1000
         
         # Fetch Recipes
         recipes = []
+        start = time.perf_counter()
         if detected_ingredients:
-            print("Fetching recipes from Spoonacular API...")
-            recipes = spoonacular_service.find_recipes_by_ingredients(detected_ingredients)
-            print(f"Retrieved {len(recipes)} recipes")
-        else:
-            print("No ingredients detected")
+            recipes = await recipe_service.find_recipes_by_ingredients(detected_ingredients)
+        timings["recipes"] = (time.perf_counter() - start) * 1000
         
+        if detections_format == "columnar":
+            detections = columnar_detections(detections)
+
         response_data = {
             "detected_ingredients": detected_ingredients,
             "raw_detections": detections,  # Frontend can use this to draw boxes
             "recipes": recipes,
             "image_id": filename
         }
-        
-        print(f"Response: {len(detected_ingredients)} ingredients, {len(recipes)} recipes")
+
+        REQUESTS.inc("analyze_fridge", "200")
+        log_event("analyze_fridge", image_id=filename, ingredients=len(detected_ingredients), recipes=len(recipes),
+                  **{f"{stage}_ms": round(ms, 1) for stage, ms in timings.items()})
         return response_data
     
     except Exception as e:
-        import traceback
-        print(f"Error during analysis: {str(e)}")
-        traceback.print_exc()
+        REQUESTS.inc("analyze_fridge", "500")
+        log_event("analyze_fridge_failed", logging.ERROR, image_id=filename, error=repr(e),
+                  traceback=traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
-    
+
+# Same analysis as NDJSON, one event per line, sent as each stage finishes:
+#   {"event": "detections", "detected_ingredients": [...], "raw_detections": [...], "image_id": "..."}
+#   {"event": "recipes", "recipes": [...]}         basic data from findByIngredients
+#   {"event": "details", "id": ..., "sourceUrl": ..., "readyInMinutes": ..., "summary": ...}  per recipe
+#   {"event": "done"}                              or {"event": "error", "detail": "..."}
+@app.post("/analyze_fridge/stream")
+async def analyze_fridge_stream(
+    file: UploadFile = File(...),
+    detections_format: str = Query("objects", alias="format", pattern="^(objects|columnar)$"),
+):
+    _check_available("analyze_fridge_stream")
+    # Take the slot before streaming, like /analyze_fridge: it is free after the
+    # check (nothing awaited in between), so a busy server answers 503 instead of
+    # queueing streams. The generator releases it; the background task covers a
+    # client that disconnects before the stream starts.
+    await request_slots.acquire()
+    release = _slot_releaser()
+    try:
+        # The upload is closed once this handler returns, so read it before streaming
+        filename, contents = await _read_upload(file)
+    except BaseException:
+        release()
+        raise
+    return StreamingResponse(
+        _analyze_fridge_events(filename, contents, detections_format, release),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release),
+    )
+
+def _slot_releaser():
+    """A function that releases one request slot, however many times it is called."""
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            request_slots.release()
+    return release
+
+def _ndjson(event: str, payload: dict = None) -> bytes:
+    return (json.dumps({"event": event, **(payload or {})}) + "\n").encode("utf-8")
+
+async def _analyze_fridge_events(filename: str, contents: bytes, detections_format: str, release_slot):
+    try:
+        start = time.perf_counter()
+        detected_ingredients, detections = await _detect(contents)
+        if detections_format == "columnar":
+            detections = columnar_detections(detections)
+        yield _ndjson("detections", {
+            "detected_ingredients": detected_ingredients,
+            "raw_detections": detections,
+            "image_id": filename,
+        })
+
+        if detected_ingredients:
+            async for event, payload in recipe_service.stream_recipes(detected_ingredients):
+                yield _ndjson(event, payload)
+        else:
+            yield _ndjson("recipes", {"recipes": []})
+        yield _ndjson("done")
+        REQUESTS.inc("analyze_fridge_stream", "200")
+        log_event("analyze_fridge_stream", image_id=filename, ingredients=len(detected_ingredients),
+                  total_ms=round((time.perf_counter() - start) * 1000, 1))
+
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        REQUESTS.inc("analyze_fridge_stream", "500")
+        log_event("analyze_fridge_failed", logging.ERROR, image_id=filename, error=repr(e),
+                  traceback=traceback.format_exc())
+        yield _ndjson("error", {"detail": f"Error: {str(e)}"})
     finally:
-        # Optional: Clean up file after processing,
-        # but might want to keep it if we serve it back.
-        # For now, let's keep it to verify.
+        release_slot()
+
+# Fridge-camera stream: the client sends one JPEG frame per binary WebSocket message
+# and gets JSON events back:
+#   {"event": "inventory", "frame": n, "items": [...], "added": [...], "removed": [...], "ingredients": [...]}
+#   {"event": "recipes", "ingredients": [...], "recipes": [...]}   only when the ingredient set changes
+#   {"event": "error", "frame": n, "detail": "..."}                 bad frame; the stream stays open
+# Frames that look like the last processed one are skipped without running YOLO, and
+# frames that arrive while one is being processed are superseded by the newest.
+CAMERA_DIFF_THRESHOLD = float(os.getenv("CAMERA_DIFF_THRESHOLD", "4"))
+CAMERA_MIN_HITS = int(os.getenv("CAMERA_MIN_HITS", "2"))
+CAMERA_MAX_MISSED = int(os.getenv("CAMERA_MAX_MISSED", "3"))
+MAX_CAMERA_STREAMS = int(os.getenv("MAX_CAMERA_STREAMS", "64"))
+camera_stats = {"streams": 0, "frames": 0, "processed": 0, "skipped": 0, "superseded": 0, "recipe_queries": 0}
+
+@app.websocket("/camera/stream")
+async def camera_stream(websocket: WebSocket):
+    await websocket.accept()
+    if not startup_state["ready"] or camera_stats["streams"] >= MAX_CAMERA_STREAMS:
+        # 1013: try again later
+        await websocket.close(code=1013)
+        return
+
+    camera_stats["streams"] += 1
+    latest = {"frame": None, "closed": False}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        try:
+            while True:
+                frame = await websocket.receive_bytes()
+                camera_stats["frames"] += 1
+                if latest["frame"] is not None:
+                    camera_stats["superseded"] += 1
+                latest["frame"] = frame
+                frame_ready.set()
+        except (WebSocketDisconnect, RuntimeError, KeyError):
+            # KeyError: a text message instead of a frame
+            latest["closed"] = True
+            frame_ready.set()
+
+    reader = asyncio.create_task(receive_frames())
+    try:
+        await _process_camera_frames(websocket, latest, frame_ready)
+    except WebSocketDisconnect:
         pass
+    finally:
+        reader.cancel()
+        camera_stats["streams"] -= 1
+
+async def _process_camera_frames(websocket: WebSocket, latest: dict, frame_ready: asyncio.Event):
+    differ = FrameDiffer(threshold=CAMERA_DIFF_THRESHOLD)
+    # Same precomputed label -> ingredient table the detector output uses
+    labels = yolo_pool.labels if yolo_pool is not None else yolo_service.labels
+    tracker = InventoryTracker(labels, min_hits=CAMERA_MIN_HITS, max_missed=CAMERA_MAX_MISSED)
+    send_lock = asyncio.Lock()
+    recipe_task = None
+    last_ingredients = []
+    frame_number = 0
+
+    async def send(event: dict):
+        async with send_lock:
+            await websocket.send_json(event)
+
+    async def send_inventory(added, removed):
+        await send({
+            "event": "inventory",
+            "frame": frame_number,
+            "items": [t.to_dict() for t in tracker.inventory()],
+            "added": [t.to_dict() for t in added],
+            "removed": [t.to_dict() for t in removed],
+            "ingredients": tracker.ingredients(),
+        })
+
+    async def send_recipes(ingredients):
+        camera_stats["recipe_queries"] += 1
+        try:
+            recipes = await recipe_service.find_recipes_by_ingredients(ingredients) if ingredients else []
+            await send({"event": "recipes", "ingredients": ingredients, "recipes": recipes})
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if latest["closed"]:
+                break
+            frame, latest["frame"] = latest["frame"], None
+            frame_number += 1
+
+            try:
+                if len(frame) > MAX_UPLOAD_BYTES:
+                    raise ImageTooLarge(f"Frame too large (limit {MAX_UPLOAD_BYTES} bytes)")
+                open_image(frame)
+                changed, thumb = await asyncio.to_thread(differ.changed, frame)
+            except Exception as e:
+                detail = str(e) if isinstance(e, ImageTooLarge) else "Frame is not a supported image"
+                await send({"event": "error", "frame": frame_number, "detail": detail})
+                continue
+
+            if not changed:
+                camera_stats["skipped"] += 1
+                added = tracker.repeat()
+                if not added:
+                    continue
+                removed = []
+            else:
+                # Wait for a slot instead of failing: frames queue up behind single requests
+                async with request_slots:
+                    result = await asyncio.wrap_future(submit_detection(frame))
+                camera_stats["processed"] += 1
+                differ.accept(thumb)
+                added, removed = tracker.update(result["detections"])
+            await send_inventory(added, removed)
+
+            ingredients = tracker.ingredients()
+            if ingredients != last_ingredients:
+                last_ingredients = ingredients
+                if recipe_task is not None:
+                    recipe_task.cancel()
+                recipe_task = asyncio.create_task(send_recipes(ingredients))
+    finally:
+        if recipe_task is not None:
+            recipe_task.cancel()
 
 # 9️⃣ Serve uploaded images if needed (though client has the original)
+# Only meaningful with DEBUG_SAVE_UPLOADS=1
 # app.mount("/files", StaticFiles(directory="temp_uploads"), name="files")
 
 # 🔟 Run the app
@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+from metrics import Histogram
+
+
+class BatchingQueue:
+    """
+    Collects images from concurrent requests and runs them through
+    YoloService.detect_batch() as a single forward pass.
+
+    A batch is flushed as soon as it reaches max_batch_size, or when the
+    oldest queued image has waited max_wait_ms, whichever comes first.
+    """
+    def __init__(self, yolo_service, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.yolo_service = yolo_service
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._thread = None
+        self._running = False
+
+        # Tuning stats
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_wait_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 250, 500, 1000])
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="yolo-batcher", daemon=True)
+        self._thread.start()
+        print(f"Batching queue started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.1f})")
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)  # wake up the worker
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, image) -> Future:
+        """
+        Queue an image (path or anything YoloService.detect accepts).
+        Returns a Future resolving to that image's detection result.
+        """
+        future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError("Batching queue is not running"))
+            return future
+        self._queue.put((image, future, time.monotonic()))
+        return future
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        """Block for the first item, then gather more until the window closes."""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Once the window has closed, still take whatever is already queued
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown requested; finish what we already have
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            # Skip callers that gave up (e.g. cancelled request)
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.yolo_service.detect_batch([image for image, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+        # Fail anything left behind after shutdown
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("Batching queue stopped"))
@@ -0,0 +1,69 @@
+"""
+Lookup latency of the local recipe index as the corpus grows.
+
+Builds synthetic corpora (ingredient popularity is skewed, like real recipes)
+and times LocalRecipeService.search() for random fridge-sized queries.
+
+    python benchmarks/bench_local_recipes.py --sizes 1000 5000 20000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+# Allow importing backend modules when run from anywhere
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_recipes import LocalRecipeService
+
+
+def make_corpus(size: int, vocabulary_size: int, rng: random.Random):
+    vocabulary = [f"ingredient {i}" for i in range(vocabulary_size)]
+    # Zipf-like weights: a few staples appear in many recipes
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+    recipes = []
+    for recipe_id in range(size):
+        count = rng.randint(5, 15)
+        names = set(rng.choices(vocabulary, weights=weights, k=count))
+        recipes.append({"id": recipe_id, "title": f"Recipe {recipe_id}", "ingredients": sorted(names)})
+    return vocabulary, recipes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 100000])
+    parser.add_argument("--vocabulary", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--number", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'recipes':>8} {'build ms':>9} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        vocabulary, recipes = make_corpus(size, args.vocabulary, rng)
+
+        start = time.perf_counter()
+        service = LocalRecipeService(recipes=recipes)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # Typical fridge photo: 3-10 detected ingredients
+        queries = [rng.sample(vocabulary[:200], rng.randint(3, 10)) for _ in range(args.queries)]
+        for q in queries[:50]:
+            service.search(q, args.number)
+
+        timings = []
+        for q in queries:
+            start = time.perf_counter()
+            service.search(q, args.number)
+            timings.append((time.perf_counter() - start) * 1e6)
+
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+        print(f"{size:>8} {build_ms:>9.1f} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
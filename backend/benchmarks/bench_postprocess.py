@@ -0,0 +1,86 @@
+"""
+Detection post-processing cost against box count: the old per-box loop over
+ultralytics Boxes versus the bulk numpy path in services.format_detections.
+
+    python benchmarks/bench_postprocess.py --boxes 1 10 50 100 300
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Boxes
+
+# Allow importing backend modules when run from anywhere
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import format_detections
+from taxonomy import LabelTable
+
+
+def clean_labels(labels):
+    """Reference: the original per-request regex label cleanup."""
+    import re
+    cleaned = set()
+    for label in labels:
+        l = label.lower().strip()
+        l = l.replace("_", " ")
+        l = re.sub(r'\s*-.*$', '', l)
+        cleaned.add(l)
+    return list(cleaned)
+
+
+def per_box(boxes: Boxes, names):
+    """Reference: the original box-by-box post-processing."""
+    detected_items = []
+    labels_raw = []
+    for box in boxes:
+        cls_id = int(box.cls[0])
+        label = names[cls_id]
+        detected_items.append({
+            "label": label,
+            "bbox": box.xyxy[0].tolist(),
+            "confidence": float(box.conf[0])
+        })
+        labels_raw.append(label)
+    return {"detections": detected_items, "ingredients": clean_labels(labels_raw)}
+
+
+def timeit(fn, repeats: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 10, 50, 100, 300])
+    parser.add_argument("--classes", type=int, default=198)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    names = {i: f"Class_{i}" for i in range(args.classes)}
+    labels = LabelTable(names)
+
+    print(f"{'boxes':>6} {'per-box us':>11} {'bulk us':>9} {'speedup':>8}")
+    for n in args.boxes:
+        xy = rng.uniform(0, 600, size=(n, 2))
+        data = np.hstack([
+            xy, xy + rng.uniform(5, 40, size=(n, 2)),
+            rng.uniform(0.25, 1.0, size=(n, 1)),
+            rng.integers(0, args.classes, size=(n, 1)),
+        ]).astype(np.float32)
+        boxes = Boxes(torch.from_numpy(data), orig_shape=(640, 640))
+
+        loop_us = timeit(lambda: per_box(boxes, names), args.repeats)
+        bulk_us = timeit(lambda: format_detections(boxes.data.cpu().numpy(), labels), args.repeats)
+        print(f"{n:>6} {loop_us:>11.1f} {bulk_us:>9.1f} {loop_us / bulk_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
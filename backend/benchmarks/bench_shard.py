@@ -0,0 +1,114 @@
+"""
+Images/sec of the training data pipeline: JPEG files versus a packed shard.
+
+Builds the same split twice, as the stock ultralytics YOLODataset (decode +
+resize every JPEG) and as shards.ShardYOLODataset (slices of a memory-mapped
+shard), and measures
+
+    load_image    raw image loading, one worker, no augmentation
+    dataloader    full batches through a DataLoader with the training
+                  augmentations (mosaic etc.) and --workers processes
+
+The shard is packed first if it does not exist yet.
+
+    python benchmarks/bench_shard.py --data merged_data/data.yaml
+    python benchmarks/bench_shard.py --data merged_data/data.yaml --split test --workers 4 --batches 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Allow importing backend modules when run from anywhere
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shards import SPLIT_KEYS, build_shard_dataset, find_shard, pack_dataset
+
+
+def build_datasets(data_yaml: str, split: str, imgsz: int, batch: int, mode: str):
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_yolo_dataset
+    from ultralytics.data.utils import check_det_dataset
+
+    cfg = get_cfg(overrides={"imgsz": imgsz, "task": "detect", "split": split})
+    data = check_det_dataset(data_yaml)
+    img_path = data[split]
+    shard = find_shard(img_path, imgsz)
+    if shard is None:
+        pack_dataset(data_yaml, imgsz, splits=(split,))
+        shard = find_shard(img_path, imgsz)
+    return (build_yolo_dataset(cfg, img_path, batch, data, mode=mode),
+            build_shard_dataset(cfg, img_path, batch, data, shard, mode=mode))
+
+
+def bench_load_image(dataset, count: int) -> float:
+    count = min(count, len(dataset))
+    start = time.perf_counter()
+    for i in range(count):
+        dataset.load_image(i)
+        dataset.ims[i] = None  # no RAM buffer hits
+    return count / (time.perf_counter() - start)
+
+
+def bench_dataloader(dataset, batch: int, workers: int, batches: int) -> float:
+    from ultralytics.data import build_dataloader
+
+    loader = build_dataloader(dataset, batch, workers, shuffle=True)
+    iterator = iter(loader)
+    next(iterator)  # worker start-up
+    images, start = 0, time.perf_counter()
+    for _ in range(batches):
+        try:
+            images += len(next(iterator)["img"])
+        except StopIteration:
+            break
+    return images / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join("merged_data", "data.yaml"))
+    parser.add_argument("--split", default="train", choices=list(SPLIT_KEYS))
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--images", type=int, default=500, help="Images for the load_image benchmark")
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--batches", type=int, default=30, help="Batches for the DataLoader benchmark")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--output", default=os.path.join("runs", "benchmarks", "shard.json"))
+    args = parser.parse_args()
+
+    jpeg, shard = build_datasets(args.data, args.split, args.imgsz, args.batch, mode="val")
+    # Same pixels and labels as the JPEG path, so training results do not change
+    for i in range(min(5, len(jpeg))):
+        a, b = jpeg.load_image(i), shard.load_image(i)
+        assert a[1:] == b[1:] and np.array_equal(a[0], b[0]), f"image {i} differs"
+        assert np.allclose(jpeg.labels[i]["bboxes"], shard.labels[i]["bboxes"], atol=1e-6), f"labels {i} differ"
+
+    report = {"data": args.data, "split": args.split, "imgsz": args.imgsz, "workers": args.workers,
+              "shard": str(shard.shard.bin_path), "results": {}}
+    report["results"]["load_image"] = {
+        "jpeg": bench_load_image(jpeg, args.images),
+        "shard": bench_load_image(shard, args.images),
+    }
+    jpeg, shard = build_datasets(args.data, args.split, args.imgsz, args.batch, mode="train")
+    report["results"]["dataloader"] = {
+        "jpeg": bench_dataloader(jpeg, args.batch, args.workers, args.batches),
+        "shard": bench_dataloader(shard, args.batch, args.workers, args.batches),
+    }
+
+    print(f"\n{'stage':<11} {'jpeg img/s':>11} {'shard img/s':>12} {'speedup':>8}")
+    for stage, r in report["results"].items():
+        print(f"{stage:<11} {r['jpeg']:>11.1f} {r['shard']:>12.1f} {r['shard'] / r['jpeg']:>7.2f}x")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
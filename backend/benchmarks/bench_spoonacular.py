@@ -0,0 +1,138 @@
+"""
+Spoonacular client behaviour under upstream trouble, against the local mock
+(benchmarks/mock_spoonacular.py, started here). Each scenario reconfigures
+the mock and runs cold-cache lookups through a fresh SpoonacularService:
+
+    healthy       normal latency
+    tail          10% of calls take --tail-ms longer; hedging off vs on
+    errors        20% of calls answer 500; retries off vs on
+    outage        every call answers 402: the circuit opens and later
+                  lookups fail fast, with and without stale cached results
+
+    python benchmarks/bench_spoonacular.py
+    python benchmarks/bench_spoonacular.py --lookups 200 --concurrency 16 --tail-ms 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+# Allow importing backend modules when run from anywhere
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_test import start_process, stop_process, wait_until
+from recipe_cache import RecipeCache
+from resilience import CircuitBreaker, TokenBucket
+from services import SpoonacularService
+
+
+def make_service(base_url: str, hedge_ms: float = 0, retries: int = 0, search_ttl: float = 3600,
+                 stale_ttl: float = 0) -> SpoonacularService:
+    service = SpoonacularService(cache=RecipeCache(db_path=None, search_ttl=search_ttl, detail_ttl=search_ttl,
+                                                   stale_ttl=stale_ttl))
+    service.base_url = base_url
+    service.api_key = "mock"
+    service.hedge_delay = hedge_ms / 1000
+    service.max_retries = retries
+    service.rate_limit = TokenBucket(0)  # no plan limit against the mock
+    service.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    return service
+
+
+async def run_lookups(service: SpoonacularService, lookups: int, concurrency: int, offset: int = 0):
+    """Distinct ingredient sets, so every lookup misses the cache (unless primed with the same offset)."""
+    records = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(i):
+        async with semaphore:
+            start = time.perf_counter()
+            recipes = await service.find_recipes_by_ingredients(["tomato", f"item{offset + i}"])
+            outcome = "empty" if not recipes else ("full" if recipes[0].get("sourceUrl") else "basic")
+            records.append({"latency_ms": (time.perf_counter() - start) * 1000, "outcome": outcome})
+
+    await asyncio.gather(*(lookup(i) for i in range(lookups)))
+    latencies = [r["latency_ms"] for r in records]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    outcomes = {}
+    for r in records:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    return {"lookups": lookups, "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "max_ms": float(np.max(latencies)), "outcomes": outcomes, "upstream": service.upstream_stats()}
+
+
+async def run(args):
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    log_dir = os.path.dirname(args.output) or "."
+    mock = start_process([sys.executable, os.path.join("benchmarks", "mock_spoonacular.py"),
+                          "--port", str(args.mock_port), "--seed", "0"],
+                         os.environ.copy(), os.path.join(log_dir, "bench_spoonacular_mock.log"))
+    results = {}
+    try:
+        await wait_until(f"{mock_url}/_stats", 30, mock)
+        async with httpx.AsyncClient() as control:
+            async def scenario(name, mock_config, lookups=args.lookups, offset=0, service=None, **options):
+                await control.post(f"{mock_url}/_config", params={
+                    "latency_ms": args.latency_ms, "jitter_ms": args.latency_ms / 3, "error_rate": 0,
+                    "quota_rate": 0, "tail_rate": 0, "tail_ms": args.tail_ms, **mock_config})
+                own = service is None
+                service = service or make_service(mock_url, **options)
+                try:
+                    results[name] = await run_lookups(service, lookups, args.concurrency, offset)
+                finally:
+                    if own:
+                        await service.aclose()
+                results[name]["mock_calls"] = (await control.get(f"{mock_url}/_stats")).json()["calls"]
+
+            await scenario("healthy", {})
+            await scenario("tail_no_hedge", {"tail_rate": 0.1})
+            await scenario("tail_hedged", {"tail_rate": 0.1}, hedge_ms=args.hedge_ms)
+            await scenario("errors_no_retry", {"error_rate": 0.2})
+            await scenario("errors_retried", {"error_rate": 0.2}, retries=2)
+            await scenario("outage", {"quota_rate": 1.0})
+
+            # Same ingredient sets cached just before, already expired but within the stale window
+            service = make_service(mock_url, search_ttl=0.001, stale_ttl=3600)
+            try:
+                await scenario("outage_primed", {}, service=service, offset=10_000)
+                await scenario("outage_stale", {"quota_rate": 1.0}, service=service, offset=10_000)
+            finally:
+                await service.aclose()
+            del results["outage_primed"]
+    finally:
+        stop_process(mock)
+
+    print(f"\n{'scenario':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  outcomes / circuit")
+    for name, r in results.items():
+        circuit, stale = r["upstream"]["circuit"], r["upstream"]["served_stale"]
+        print(f"{name:<16} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['p99_ms']:>8.0f} {r['max_ms']:>8.0f}  "
+              f"{r['outcomes']} circuit={circuit['state']} refused={circuit['refused']} stale={stale}")
+    return {"config": vars(args), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=200, help="Lookups per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="Mock mean latency")
+    parser.add_argument("--tail-ms", type=float, default=3000.0, help="Extra latency of the slow 10%%")
+    parser.add_argument("--hedge-ms", type=float, default=500.0, help="Hedge delay in the hedged scenario")
+    parser.add_argument("--mock-port", type=int, default=8767)
+    parser.add_argument("--output", default=os.path.join("runs", "benchmarks", "spoonacular.json"))
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
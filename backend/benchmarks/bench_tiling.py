@@ -0,0 +1,159 @@
+"""
+Latency against recall for sliced inference versus a single 1280 pass.
+
+Runs each setup end to end through YoloService.detect() (decode included,
+detection cache off) on a labelled YOLO split and reports per-image latency
+and recall at IoU 0.5, overall and for small objects:
+
+    1280          one full-image pass at imgsz=1280 (the train_model_local setup)
+    640           one full-image pass at imgsz=640
+    640+auto      640 pass, tiles only when tiling.needs_tiling() says so
+    640+tiles     640 pass plus all tiles, every image
+
+    python benchmarks/bench_tiling.py --weights runs/detect/train/weights/best.pt
+    python benchmarks/bench_tiling.py --weights big.pt --weights-640 small.pt --upscale 3
+
+The merged test images are 640x640; --upscale re-encodes them larger to
+mimic phone uploads, which is what tiling is for.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow importing backend modules when run from anywhere
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import YoloService, find_model_path
+
+SETUPS = {
+    "1280": (1280, "off"),
+    "640": (640, "off"),
+    "640+auto": (640, "auto"),
+    "640+tiles": (640, "always"),
+}
+
+
+def load_split(split_dir: str, limit: int, upscale: float):
+    """(jpeg bytes, (M, 5) class + xyxy ground truth in pixels) per image."""
+    from PIL import Image
+
+    samples = []
+    for path in sorted(glob.glob(os.path.join(split_dir, "images", "*")))[:limit]:
+        img = Image.open(path).convert("RGB")
+        if upscale != 1:
+            img = img.resize((round(img.width * upscale), round(img.height * upscale)), Image.BICUBIC)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=92)
+
+        label_path = os.path.join(split_dir, "labels", os.path.splitext(os.path.basename(path))[0] + ".txt")
+        rows = []
+        if os.path.exists(label_path):
+            with open(label_path) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 5:
+                        cls, cx, cy, w, h = map(float, parts)
+                        rows.append([cls, (cx - w / 2) * img.width, (cy - h / 2) * img.height,
+                                     (cx + w / 2) * img.width, (cy + h / 2) * img.height])
+        samples.append((buf.getvalue(), np.array(rows, dtype=np.float32).reshape(-1, 5), img.size))
+    return samples
+
+
+def match(gt: np.ndarray, pred: np.ndarray, iou: float = 0.5) -> np.ndarray:
+    """Boolean per ground-truth box: found by a same-class prediction with IoU >= iou."""
+    found = np.zeros(len(gt), dtype=bool)
+    used = np.zeros(len(pred), dtype=bool)
+    for i, (cls, x1, y1, x2, y2) in enumerate(gt):
+        candidates = np.where((pred[:, 0] == cls) & ~used)[0] if len(pred) else []
+        best, best_iou = -1, iou
+        for j in candidates:
+            px1, py1, px2, py2 = pred[j, 1:]
+            inter = max(0, min(x2, px2) - max(x1, px1)) * max(0, min(y2, py2) - max(y1, py1))
+            union = (x2 - x1) * (y2 - y1) + (px2 - px1) * (py2 - py1) - inter
+            if union > 0 and inter / union >= best_iou:
+                best, best_iou = j, inter / union
+        if best >= 0:
+            found[i] = used[best] = True
+    return found
+
+
+def run_setup(service: YoloService, samples, small_fraction: float):
+    class_ids = {label: i for i, label in enumerate(service.labels.labels.tolist())}
+    service.detect(samples[0][0])
+
+    latencies, found, small = [], [], []
+    for data, gt, (width, height) in samples:
+        start = time.perf_counter()
+        result = service.detect(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        pred = np.array([[class_ids[d["label"]], *d["bbox"]] for d in result["detections"]],
+                        dtype=np.float32).reshape(-1, 5)
+        found.append(match(gt, pred))
+        area = (gt[:, 3] - gt[:, 1]) * (gt[:, 4] - gt[:, 2])
+        small.append(area < small_fraction * width * height)
+
+    found = np.concatenate(found) if found else np.zeros(0, dtype=bool)
+    small = np.concatenate(small) if small else np.zeros(0, dtype=bool)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(np.mean(latencies)),
+        "recall": float(found.mean()) if len(found) else None,
+        "small_recall": float(found[small].mean()) if small.any() else None,
+        "gt_boxes": int(len(found)),
+        "small_gt_boxes": int(small.sum()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=None, help="Weights for the 1280 setup (default: same search as the API)")
+    parser.add_argument("--weights-640", default=None, help="Weights for the 640 setups (default: --weights)")
+    parser.add_argument("--split", default="merged_data/test", help="YOLO split with images/ and labels/")
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--upscale", type=float, default=2.0, help="Resize factor applied to the test images")
+    parser.add_argument("--tile-input-size", type=int, default=1152,
+                        help="Longest side the image is decoded at before tiling (1152 = 2x2 tiles of 640)")
+    parser.add_argument("--small-fraction", type=float, default=0.01,
+                        help="Ground-truth boxes under this fraction of the image area count as small")
+    parser.add_argument("--setups", nargs="+", default=list(SETUPS), choices=list(SETUPS))
+    parser.add_argument("--output", default=os.path.join("runs", "benchmarks", "tiling.json"))
+    args = parser.parse_args()
+
+    weights = args.weights or find_model_path()
+    samples = load_split(args.split, args.images, args.upscale)
+    if not samples:
+        raise FileNotFoundError(f"No images found in {args.split}/images")
+    print(f"{len(samples)} images at {samples[0][2][0]}x{samples[0][2][1]}")
+
+    report = {"weights": weights, "weights_640": args.weights_640 or weights, "split": args.split,
+              "upscale": args.upscale, "setups": {}}
+    for name in args.setups:
+        imgsz, tiling = SETUPS[name]
+        service = YoloService(args.weights_640 or weights if imgsz == 640 else weights,
+                              cache_mode="off", tiling=tiling)
+        service.imgsz = imgsz
+        service.tile_input_size = args.tile_input_size
+        report["setups"][name] = run_setup(service, samples, args.small_fraction)
+
+    print(f"\n{'setup':<11} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'small':>7}")
+    for name, r in report["setups"].items():
+        recall = f"{r['recall']:.3f}" if r["recall"] is not None else "-"
+        small = f"{r['small_recall']:.3f}" if r["small_recall"] is not None else "-"
+        print(f"{name:<11} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {recall:>7} {small:>7}")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
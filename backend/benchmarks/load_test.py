@@ -0,0 +1,341 @@
+"""
+End-to-end load test of the API.
+
+Starts benchmarks/mock_spoonacular.py and `uvicorn app:app` (pointed at the
+mock through SPOONACULAR_BASE_URL), waits for /ready, then replays the test
+images as uploads either open-loop at a fixed request rate or closed-loop
+with a fixed number of concurrent clients:
+
+    python benchmarks/load_test.py --rate 5 --duration 60
+    python benchmarks/load_test.py --concurrency 16 --duration 60 --mock-latency-ms 300 --mock-quota-rate 0.05
+    python benchmarks/load_test.py --concurrency 8 --app-env YOLO_WORKERS=2 --baseline runs/benchmarks/load.json
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 4   # an already running app
+
+Open-loop latency is measured from each request's scheduled start, so a
+backed-up server is not hidden by the client slowing down. Per-stage times
+come from the Server-Timing header of /analyze_fridge (read, detect,
+recipes) or, with --endpoint stream, from the arrival of each NDJSON event.
+Detection and recipe caches are cold unless --warm-caches is given.
+
+The JSON report (default runs/benchmarks/load.json) has the same layout for
+every run; --baseline prints the change against an earlier report.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_VERSION = 1
+
+
+def start_process(cmd, env, log_path):
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    log = open(log_path, "w")
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def wait_until(url: str, timeout: float, process=None, ready_field: str = None):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Process exited with code {process.returncode} before {url} was up")
+            try:
+                response = await client.get(url)
+                if response.status_code == 200 and (ready_field is None or response.json().get(ready_field)):
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+
+def load_images(pattern: str, limit: int):
+    paths = sorted(glob.glob(pattern))[:limit]
+    if not paths:
+        raise FileNotFoundError(f"No images match {pattern}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def parse_server_timing(header: str):
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(value)
+    return stages
+
+
+async def send(client: httpx.AsyncClient, base_url: str, endpoint: str, image, start: float):
+    """One upload; returns a record with latency from `start` (perf_counter) and per-stage times."""
+    name, data = image
+    files = {"file": (name, data, "image/jpeg")}
+    record = {"status": None, "error": None, "stages": {}}
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", f"{base_url}/analyze_fridge/stream", files=files) as response:
+                record["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)["event"]
+                    # Time to the first event of each kind, from the request start
+                    record["stages"].setdefault(event, (time.perf_counter() - start) * 1000)
+                    if event == "error":
+                        record["error"] = "stream error event"
+        else:
+            response = await client.post(f"{base_url}/analyze_fridge", files=files)
+            record["status"] = response.status_code
+            record["stages"] = parse_server_timing(response.headers.get("server-timing", ""))
+            if response.status_code == 200:
+                record["recipes"] = len(response.json().get("recipes", []))
+    except httpx.HTTPError as e:
+        record["error"] = type(e).__name__
+    record["latency_ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+
+async def run_fixed_rate(client, base_url, endpoint, images, rate: float, duration: float):
+    """Open loop: request i is scheduled at i / rate seconds, whatever the server is doing."""
+    tasks = []
+    t0 = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = t0 + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, base_url, endpoint, images[i % len(images)], scheduled)))
+    return await asyncio.gather(*tasks)
+
+
+async def run_concurrency(client, base_url, endpoint, images, concurrency: int, duration: float):
+    """Closed loop: `concurrency` clients, each sending its next upload when the last one returns."""
+    records = []
+    deadline = time.perf_counter() + duration
+    counter = iter(range(1 << 62))
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            image = images[next(counter) % len(images)]
+            records.append(await send(client, base_url, endpoint, image, time.perf_counter()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(samples)),
+            "max": float(np.max(samples))}
+
+
+def summarize(records, duration: float):
+    ok = [r for r in records if r["status"] == 200 and r["error"] is None]
+    statuses = {}
+    for r in records:
+        key = str(r["status"]) if r["error"] is None else f"{r['status'] or 'no response'} ({r['error']})"
+        statuses[key] = statuses.get(key, 0) + 1
+    stage_names = sorted({name for r in ok for name in r["stages"]})
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "duration_s": duration,
+        "rps": len(records) / duration if duration else 0.0,
+        "ok_rps": len(ok) / duration if duration else 0.0,
+        "error_rate": 1 - len(ok) / len(records) if records else 0.0,
+        "busy_503": sum(1 for r in records if r["status"] == 503),
+        "status_counts": statuses,
+        "latency_ms": _percentiles([r["latency_ms"] for r in ok]),
+        "stages_ms": {name: _percentiles([r["stages"][name] for r in ok if name in r["stages"]])
+                      for name in stage_names},
+    }
+
+
+def compare(report, baseline, baseline_path: str):
+    rows = [("ok_rps", lambda r: r["ok_rps"]), ("error_rate", lambda r: r["error_rate"])]
+    for q in ("p50", "p95", "p99"):
+        rows.append((f"latency {q}", lambda r, q=q: (r["latency_ms"] or {}).get(q)))
+    for stage in report["results"]["stages_ms"]:
+        rows.append((f"{stage} p95", lambda r, s=stage: (r["stages_ms"].get(s) or {}).get("p95")))
+
+    print(f"\nAgainst {baseline_path} ({baseline.get('git_commit') or '?'}):")
+    print(f"{'metric':<18} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, get in rows:
+        old, new = get(baseline["results"]), get(report["results"])
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+        print(f"{name:<18} {old:>10.3f} {new:>10.3f} {change:>8}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run(args):
+    images = load_images(os.path.join(args.images, "*"), args.max_images)
+    app_process = mock_process = None
+    base_url = args.url
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    log_dir = os.path.dirname(args.output) or "."
+    try:
+        if base_url is None:
+            mock_process = start_process(
+                [sys.executable, os.path.join("benchmarks", "mock_spoonacular.py"), "--port", str(args.mock_port),
+                 "--latency-ms", str(args.mock_latency_ms), "--jitter-ms", str(args.mock_jitter_ms),
+                 "--error-rate", str(args.mock_error_rate), "--quota-rate", str(args.mock_quota_rate),
+                 "--seed", "0"],
+                os.environ.copy(), os.path.join(log_dir, "load_mock.log"))
+            await wait_until(f"{mock_url}/_stats", 30, mock_process)
+
+            env = os.environ.copy()
+            env.update({
+                "SPOONACULAR_BASE_URL": mock_url,
+                "SPOONACULAR_API_KEY": "mock",  # never spend real quota
+                "RECIPE_BACKEND": "spoonacular",
+                "SPOONACULAR_RATE_LIMIT": "0",  # the plan's rate limit does not apply to the mock
+            })
+            if not args.warm_caches:
+                env.update({"DETECTION_CACHE_MODE": "off", "RECIPE_CACHE_PATH": "",
+                            "RECIPE_SEARCH_TTL": "0.001", "RECIPE_DETAIL_TTL": "0.001", "RECIPE_STALE_TTL": "0"})
+            for item in args.app_env:
+                key, _, value = item.partition("=")
+                env[key] = value
+            app_process = start_process(
+                [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.port),
+                 "--log-level", "warning"],
+                env, os.path.join(log_dir, "load_app.log"))
+            base_url = f"http://127.0.0.1:{args.port}"
+            print(f"Waiting for the app at {base_url} (log: {os.path.join(log_dir, 'load_app.log')})...")
+        await wait_until(f"{base_url}/ready", args.startup_timeout, app_process, ready_field="ready")
+
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            for i in range(args.warmup):
+                await send(client, base_url, args.endpoint, images[i % len(images)], time.perf_counter())
+            if mock_process is not None:
+                await client.post(f"{mock_url}/_config")  # reset the mock's counters after warmup
+
+            mode = f"{args.rate} req/s" if args.rate else f"{args.concurrency} concurrent clients"
+            print(f"Replaying {len(images)} images for {args.duration:.0f}s at {mode} ({args.endpoint})...")
+            start = time.perf_counter()
+            if args.rate:
+                records = await run_fixed_rate(client, base_url, args.endpoint, images, args.rate, args.duration)
+            else:
+                records = await run_concurrency(client, base_url, args.endpoint, images, args.concurrency,
+                                                args.duration)
+            elapsed = time.perf_counter() - start
+
+            server = {}
+            for name in ("batching", "cache", "workers", "upstream"):
+                try:
+                    server[name] = (await client.get(f"{base_url}/stats/{name}")).json()
+                except (httpx.HTTPError, ValueError):
+                    pass
+            mock = (await client.get(f"{mock_url}/_stats")).json() if mock_process is not None else None
+    finally:
+        stop_process(app_process)
+        stop_process(mock_process)
+
+    return {
+        "version": REPORT_VERSION,
+        "git_commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "endpoint": args.endpoint, "rate": args.rate, "concurrency": None if args.rate else args.concurrency,
+            "duration_s": args.duration, "images": len(images), "warm_caches": args.warm_caches,
+            "app_env": args.app_env, "mock_latency_ms": args.mock_latency_ms, "mock_jitter_ms": args.mock_jitter_ms,
+            "mock_error_rate": args.mock_error_rate, "mock_quota_rate": args.mock_quota_rate,
+        },
+        "results": summarize(records, elapsed),
+        "server": server,
+        "mock": mock,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rate", type=float, default=None, help="Open loop: requests per second")
+    load.add_argument("--concurrency", type=int, default=4, help="Closed loop: concurrent clients (default)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--endpoint", choices=["analyze", "stream"], default="analyze",
+                        help="/analyze_fridge or /analyze_fridge/stream")
+    parser.add_argument("--images", default=os.path.join("merged_data", "test", "images"))
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5, help="Uncounted requests before the run")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request")
+    parser.add_argument("--url", default=None, help="Test an already running app instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the app, e.g. YOLO_WORKERS=2 (repeatable)")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep the detection and recipe caches on")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--mock-port", type=int, default=8766)
+    parser.add_argument("--mock-latency-ms", type=float, default=150.0)
+    parser.add_argument("--mock-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="Fraction of upstream 500s")
+    parser.add_argument("--mock-quota-rate", type=float, default=0.0, help="Fraction of upstream 402s")
+    parser.add_argument("--output", default=os.path.join("runs", "benchmarks", "load.json"))
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    # Read the baseline first: it may be the file this run overwrites
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = asyncio.run(run(args))
+    r = report["results"]
+    latency = r["latency_ms"] or {}
+    print(f"\n{r['requests']} requests in {r['duration_s']:.1f}s: {r['rps']:.2f} req/s, {r['ok_rps']:.2f} ok/s, "
+          f"error rate {r['error_rate']:.1%} ({r['status_counts']})")
+    if latency:
+        print(f"latency ms: p50 {latency['p50']:.0f}, p95 {latency['p95']:.0f}, p99 {latency['p99']:.0f}, "
+              f"max {latency['max']:.0f}")
+    for stage, stats in r["stages_ms"].items():
+        print(f"  {stage:<11} p50 {stats['p50']:>8.1f}  p95 {stats['p95']:>8.1f}  p99 {stats['p99']:>8.1f}")
+    if report["mock"]:
+        print(f"upstream calls: {report['mock']['calls']}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Report saved to: {args.output}")
+    if baseline:
+        compare(report, baseline, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Local stand-in for the two Spoonacular endpoints the app uses, with
+configurable latency and failure rates, for load tests.
+
+    python benchmarks/mock_spoonacular.py --port 8766 --latency-ms 150 --jitter-ms 50
+    python benchmarks/mock_spoonacular.py --quota-rate 0.05 --error-rate 0.01
+    python benchmarks/mock_spoonacular.py --tail-rate 0.05 --tail-ms 3000
+
+Point the app at it with SPOONACULAR_BASE_URL=http://127.0.0.1:8766.
+Recipes are generated deterministically from the ingredient list, so the
+same fridge always gets the same recipe ids. GET /_stats returns call counts
+per endpoint and status; POST /_config changes the settings at runtime.
+"""
+import argparse
+import asyncio
+import random
+import zlib
+
+import uvicorn
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Mock Spoonacular")
+
+config = {"latency_ms": 150.0, "jitter_ms": 50.0, "error_rate": 0.0, "quota_rate": 0.0, "tail_rate": 0.0,
+          "tail_ms": 2000.0, "seed": None}
+stats = {}
+_rng = random.Random()
+
+
+def _count(endpoint: str, status: int):
+    key = f"{endpoint} {status}"
+    stats[key] = stats.get(key, 0) + 1
+
+
+async def _respond(endpoint: str, body):
+    delay = max(0.0, _rng.gauss(config["latency_ms"], config["jitter_ms"])) / 1000
+    if _rng.random() < config["tail_rate"]:
+        # A straggler, e.g. a slow upstream replica
+        delay += config["tail_ms"] / 1000
+    await asyncio.sleep(delay)
+    roll = _rng.random()
+    if roll < config["quota_rate"]:
+        _count(endpoint, 402)
+        return JSONResponse(status_code=402, content={
+            "status": "failure", "code": 402,
+            "message": "Your daily points limit of 150 has been reached.",
+        })
+    if roll < config["quota_rate"] + config["error_rate"]:
+        _count(endpoint, 500)
+        return JSONResponse(status_code=500, content={"status": "failure", "code": 500, "message": "Mock failure"})
+    _count(endpoint, 200)
+    return body
+
+
+def _recipe_ids(ingredients: str, number: int):
+    base = zlib.crc32(ingredients.encode("utf-8")) % 900_000 + 100_000
+    return [base + i for i in range(number)]
+
+
+@app.get("/recipes/findByIngredients")
+async def find_by_ingredients(ingredients: str, number: int = 10, ranking: int = 1, ignorePantry: bool = True,
+                              apiKey: str = None):
+    names = [name.strip() for name in ingredients.split(",") if name.strip()]
+    recipes = []
+    for i, recipe_id in enumerate(_recipe_ids(",".join(sorted(names)), number)):
+        used = names[: max(1, len(names) - i % 3)]
+        recipes.append({
+            "id": recipe_id,
+            "title": f"Mock {' & '.join(used[:2])} dish #{i + 1}",
+            "image": f"https://img.spoonacular.invalid/{recipe_id}-312x231.jpg",
+            "usedIngredientCount": len(used),
+            "missedIngredientCount": i % 4,
+            "usedIngredients": [{"name": name} for name in used],
+            "missedIngredients": [{"name": f"extra-{j}"} for j in range(i % 4)],
+            "likes": recipe_id % 100,
+        })
+    return await _respond("findByIngredients", recipes)
+
+
+@app.get("/recipes/informationBulk")
+async def information_bulk(ids: str, apiKey: str = None):
+    details = []
+    for recipe_id in (int(i) for i in ids.split(",") if i.strip()):
+        details.append({
+            "id": recipe_id,
+            "title": f"Mock recipe {recipe_id}",
+            "sourceUrl": f"https://recipes.invalid/{recipe_id}",
+            "readyInMinutes": 10 + recipe_id % 50,
+            "servings": 2 + recipe_id % 4,
+            "summary": f"A mock recipe ({recipe_id}) served by the load-test stand-in.",
+        })
+    return await _respond("informationBulk", details)
+
+
+@app.get("/_stats")
+def get_stats():
+    return {"config": config, "calls": stats}
+
+
+@app.post("/_config")
+def set_config(latency_ms: float = Query(None), jitter_ms: float = Query(None), error_rate: float = Query(None),
+               quota_rate: float = Query(None), tail_rate: float = Query(None), tail_ms: float = Query(None)):
+    for key, value in (("latency_ms", latency_ms), ("jitter_ms", jitter_ms), ("error_rate", error_rate),
+                       ("quota_rate", quota_rate), ("tail_rate", tail_rate), ("tail_ms", tail_ms)):
+        if value is not None:
+            config[key] = value
+    stats.clear()
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 500")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="Fraction of calls answered with 402")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of calls delayed by --tail-ms")
+    parser.add_argument("--tail-ms", type=float, default=2000.0, help="Extra latency of a tail call")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                  quota_rate=args.quota_rate, tail_rate=args.tail_rate, tail_ms=args.tail_ms, seed=args.seed)
+    _rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and (approximate) size in
+    bytes, with a per-entry TTL. Expired entries are dropped lazily on access,
+    or kept for another `stale_seconds` so get(allow_stale=True) can still
+    serve them when the source is unavailable.
+    """
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 600.0, stale_seconds: float = 0.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None, allow_stale: bool = False):
+        """With allow_stale, expired entries still within stale_seconds are returned (counted as stale_hits)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                if not allow_stale:
+                    self.misses += 1
+                return default
+            value, size, expires_at = entry
+            now = time.monotonic()
+            if expires_at and expires_at < now:
+                if expires_at + self.stale_seconds < now:
+                    self._remove(key)
+                elif allow_stale:
+                    self.stale_hits += 1
+                    return value
+                if not allow_stale:
+                    self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int = 0, ttl_seconds: Optional[float] = None):
+        """`ttl_seconds` overrides the cache TTL for this entry (e.g. the remaining lifetime of a copy)."""
+        if size > self.max_bytes:
+            return
+        if ttl_seconds is not None:
+            expires_at = time.monotonic() + ttl_seconds
+        else:
+            expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0.0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def find(self, predicate: Callable[[Hashable], bool]):
+        """
+        Return the most recently used live value whose key satisfies
+        `predicate`, counting a hit or a miss. Linear in the cache size.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key in reversed(self._data):
+                value, _, expires_at = self._data[key]
+                if expires_at and expires_at < now:
+                    continue
+                if predicate(key):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_hits": self.stale_hits,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
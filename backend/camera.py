@@ -0,0 +1,164 @@
+import io
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from taxonomy import LabelTable
+
+
+class FrameDiffer:
+    """
+    Cheap change detector for camera frames. Each frame is decoded to a tiny
+    grayscale thumbnail (JPEG draft mode decodes at 1/8 scale, so this costs
+    a few milliseconds even for 1080p frames) and compared with the thumbnail
+    of the last frame that was actually processed. Comparing against the last
+    processed frame, not the previous one, means slow drift still adds up to
+    a change eventually.
+    """
+    def __init__(self, threshold: float = 4.0, size: Tuple[int, int] = (64, 48)):
+        self.threshold = threshold
+        self.size = size
+        self.reference: Optional[np.ndarray] = None
+
+    def thumbnail(self, frame: bytes) -> np.ndarray:
+        from PIL import Image, ImageOps
+
+        img = Image.open(io.BytesIO(frame))
+        img.draft("L", (self.size[0] * 2, self.size[1] * 2))
+        img = ImageOps.exif_transpose(img).convert("L").resize(self.size, Image.BILINEAR)
+        return np.asarray(img, dtype=np.int16)
+
+    def changed(self, frame: bytes) -> Tuple[bool, np.ndarray]:
+        """(whether the frame differs from the reference, its thumbnail)."""
+        thumb = self.thumbnail(frame)
+        if self.reference is None or self.reference.shape != thumb.shape:
+            return True, thumb
+        # Mean absolute difference in gray levels (0-255)
+        return float(np.abs(thumb - self.reference).mean()) > self.threshold, thumb
+
+    def accept(self, thumb: np.ndarray):
+        """Make `thumb` the reference once its frame has been processed."""
+        self.reference = thumb
+
+
+class Track:
+    __slots__ = ("track_id", "label", "ingredient", "bbox", "confidence", "hits", "missed", "confirmed")
+
+    def __init__(self, track_id: int, detection: Dict, ingredient: str):
+        self.track_id = track_id
+        self.label = detection["label"]
+        self.ingredient = ingredient
+        self.bbox = detection["bbox"]
+        self.confidence = detection["confidence"]
+        self.hits = 1
+        self.missed = 0
+        self.confirmed = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.track_id,
+            "label": self.label,
+            "ingredient": self.ingredient,
+            "bbox": self.bbox,
+            "confidence": self.confidence,
+        }
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class InventoryTracker:
+    """
+    Greedy IoU tracker that turns per-frame detections into a stable inventory.
+
+    Detections are matched to existing tracks of the same canonical
+    ingredient (from the model's LabelTable, so "Apple" and "apple" are one
+    item) by highest IoU. A track enters the inventory after `min_hits` matched frames and
+    leaves it after `max_missed` processed frames without a match, so one
+    missed or spurious detection does not flip the ingredient list.
+    """
+    def __init__(self, labels: LabelTable, iou_threshold: float = 0.3, min_hits: int = 2, max_missed: int = 3):
+        self.labels = labels
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_missed = max_missed
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def update(self, detections: List[Dict]) -> Tuple[List[Track], List[Track]]:
+        """Feed one processed frame; returns (tracks added to, tracks removed from) the inventory."""
+        matched_tracks = set()
+        matched_detections = set()
+        ingredients = [self.labels.canonical(d["label"]) for d in detections]
+        if self.tracks and detections:
+            iou = _iou_matrix(
+                np.array([t.bbox for t in self.tracks], dtype=np.float32),
+                np.array([d["bbox"] for d in detections], dtype=np.float32),
+            )
+            same_ingredient = (np.array([t.ingredient for t in self.tracks], dtype=object)[:, None]
+                               == np.array(ingredients, dtype=object)[None, :])
+            iou[~same_ingredient] = 0
+            # Highest-IoU pairs first
+            for flat in np.argsort(-iou, axis=None):
+                ti, di = np.unravel_index(flat, iou.shape)
+                if iou[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di in matched_detections:
+                    continue
+                matched_tracks.add(ti)
+                matched_detections.add(di)
+                track, detection = self.tracks[ti], detections[di]
+                track.label = detection["label"]
+                track.bbox = detection["bbox"]
+                track.confidence = detection["confidence"]
+                track.hits += 1
+                track.missed = 0
+
+        added, removed, kept = [], [], []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    if track.confirmed:
+                        removed.append(track)
+                    continue
+            kept.append(track)
+        for i, detection in enumerate(detections):
+            if i not in matched_detections:
+                kept.append(Track(self._next_id, detection, ingredients[i]))
+                self._next_id += 1
+        for track in kept:
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                added.append(track)
+        self.tracks = kept
+        return added, removed
+
+    def repeat(self) -> List[Track]:
+        """
+        Count an unchanged (skipped) frame as seeing the last detections again,
+        so objects in a static scene still reach `min_hits`. Returns newly
+        confirmed tracks.
+        """
+        added = []
+        for track in self.tracks:
+            if track.missed == 0 and not track.confirmed:
+                track.hits += 1
+                if track.hits >= self.min_hits:
+                    track.confirmed = True
+                    added.append(track)
+        return added
+
+    def inventory(self) -> List[Track]:
+        return [t for t in self.tracks if t.confirmed]
+
+    def ingredients(self) -> List[str]:
+        return sorted({t.ingredient for t in self.inventory()})
@@ -0,0 +1,167 @@
+"""
+Near-duplicate image detection for merged datasets.
+
+Images are reduced to a difference hash (preprocess.dhash, the same hash the
+API's perceptual detection cache uses) and indexed in a BK-tree, so finding
+every image within `max_distance` bits of every other costs roughly
+O(n log n) Hamming comparisons instead of all pairs. That catches re-encoded
+copies and burst shots of the same shelf.
+
+Roboflow's crop / shear augmentations move a dHash too far to be matched
+reliably, but Roboflow names every variant `<source>.rf.<hash>.jpg`, so
+files of one dataset sharing a source name are grouped as well. Matches are
+grouped transitively (union-find).
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from preprocess import dhash, prepare_image
+
+HASH_SIZE = 16  # 256-bit hashes; 64-bit ones collide on the many look-alike fridge shots
+EVAL_SPLITS = ("valid", "test")
+_ROBOFLOW_SUFFIX = re.compile(r"\.rf\.[0-9a-f]+$")
+
+
+def image_hash(path, hash_size: int = HASH_SIZE) -> int:
+    # Draft-mode decode at a few times the hash grid is plenty for a dHash
+    return dhash(prepare_image(str(path), hash_size * 8).array, hash_size)
+
+
+def hash_images(paths: List, workers: Optional[int] = None, hash_size: int = HASH_SIZE) -> List[Optional[int]]:
+    """dHash every image in parallel; None for files that cannot be decoded."""
+    def safe_hash(path):
+        try:
+            return image_hash(path, hash_size)
+        except Exception as e:
+            print(f"  Could not hash {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(safe_hash, paths))
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+    def __init__(self):
+        # node = [hash, items, {distance: child}]
+        self.root = None
+
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = (value ^ node[0]).bit_count()
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """(distance, item) for every item within `radius` bits of `value`."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = (value ^ node[0]).bit_count()
+            if d <= radius:
+                found.extend((d, item) for item in node[1])
+            # Triangle inequality: only children at distance d +- radius can match
+            for child_d, child in node[2].items():
+                if d - radius <= child_d <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def roboflow_source(rel: str) -> Optional[str]:
+    """'train/images/ds0_x_jpg.rf.ab12.jpg' -> 'ds0_x_jpg'; None for files not named by Roboflow."""
+    stem = rel.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    source = _ROBOFLOW_SUFFIX.sub("", stem)
+    return source if source != stem else None
+
+
+def find_duplicate_groups(hashes: Dict[str, int], max_distance: int,
+                          same_source: bool = True) -> List[List[str]]:
+    """
+    Groups (2+ keys each, sorted) of image keys (paths relative to the merged
+    dataset) whose hashes chain within `max_distance` bits or, with
+    `same_source`, that are Roboflow variants of the same source image.
+    """
+    parent = {key: key for key in hashes}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    tree = BKTree()
+    for key, value in hashes.items():
+        if value is None:
+            continue
+        for _, other in tree.search(value, max_distance):
+            parent[find(key)] = find(other)
+        tree.add(value, key)
+
+    if same_source:
+        first = {}
+        for key in hashes:
+            source = roboflow_source(key)
+            if source is not None:
+                parent[find(key)] = find(first.setdefault(source, key))
+
+    groups = {}
+    for key in hashes:
+        groups.setdefault(find(key), []).append(key)
+    return sorted(sorted(g) for g in groups.values() if len(g) > 1)
+
+
+def split_of(rel: str) -> str:
+    """'train/images/x.jpg' -> 'train'."""
+    return rel.split("/", 1)[0]
+
+
+def plan_drops(groups: Iterable[List[str]]) -> List[str]:
+    """
+    Images to leave out of training: every train copy of an image that also
+    appears in valid/test (leakage), and all but one train copy otherwise.
+    Valid and test are never touched, so evaluation still sees (and the
+    report still lists) its own duplicates.
+    """
+    drops = []
+    for group in groups:
+        train = [rel for rel in group if split_of(rel) == "train"]
+        leaked = any(split_of(rel) in EVAL_SPLITS for rel in group)
+        drops.extend(train if leaked else train[1:])
+    return drops
+
+
+def duplicate_report(groups: List[List[str]], total: int, max_distance: int, dropped: List[str]) -> Dict:
+    """Summary plus the groups themselves, with cross-split (leaking) groups listed first."""
+    cross = [g for g in groups if len({split_of(rel) for rel in g}) > 1]
+    pairs = {}
+    for group in cross:
+        splits = sorted({split_of(rel) for rel in group})
+        for i, a in enumerate(splits):
+            for b in splits[i + 1:]:
+                pairs[f"{a}-{b}"] = pairs.get(f"{a}-{b}", 0) + 1
+    leaked = {split: sum(1 for g in cross for rel in g if split_of(rel) == split) for split in EVAL_SPLITS}
+    return {
+        "images": total,
+        "max_distance": max_distance,
+        "hash_bits": HASH_SIZE * HASH_SIZE,
+        "duplicate_groups": len(groups),
+        "duplicate_images": sum(len(g) for g in groups),
+        "redundant_images": sum(len(g) - 1 for g in groups),
+        "cross_split_groups": len(cross),
+        "cross_split_pairs": pairs,
+        "leaked_eval_images": leaked,
+        "dropped_train_images": len(dropped),
+        "groups": cross + [g for g in groups if len({split_of(rel) for rel in g}) == 1],
+    }
@@ -1,8 +1,27 @@
+"""
+Model evaluation.
+
+    # Download the Roboflow datasets, rebuild merged_data and run model.val() on the test split
+    python evaluate.py
+
+    # Offline: score against the existing merged_data/data.yaml, with per-class metrics,
+    # cached per-image predictions and per-backend latency / throughput, written to JSON
+    python evaluate.py --offline --weights runs/detect/train/weights/best.pt
+    python evaluate.py --offline --backends pytorch onnx openvino --batch-sizes 1 4 8
+"""
 from ultralytics import YOLO
 from roboflow import Roboflow
 from dotenv import load_dotenv
+import argparse
+import hashlib
+import json
 import os
 import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
 
 # Add current directory to path to allow importing from train.py if needed
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -37,7 +56,12 @@ def evaluate():
 
     print("\n2. Ensuring merged dataset is ready...")
     # We use the function from train.py to ensure consistency
-    data_yaml_path = merge_datasets([d1, d2], output_dir="merged_data")
+    data_yaml_path = merge_datasets(
+        [d1, d2], output_dir="merged_data",
+        canonicalize=os.getenv("CANONICAL_CLASSES", "0") == "1",
+        dedup=os.getenv("MERGE_DEDUP", "report"),
+        dedup_distance=int(os.getenv("MERGE_DEDUP_DISTANCE", "16")),
+    )
     
     # 3. Load Model
     # Look for the trained model in likely locations
@@ -67,7 +91,13 @@ def evaluate():
     # 4. Run Evaluation on Test Split
     print("\n4. Running evaluation on TEST split...")
     # We set split='test' to use the test set defined in data.yaml
-    metrics = model.val(data=data_yaml_path, split='test')
+    val_kwargs = {}
+    if os.getenv("PACKED_DATASET", "0") == "1":
+        from shards import ShardDetectionValidator, pack_dataset
+
+        pack_dataset(data_yaml_path, imgsz=640, splits=("test",))
+        val_kwargs["validator"] = ShardDetectionValidator
+    metrics = model.val(data=data_yaml_path, split='test', **val_kwargs)
     
     print("\n" + "="*40)
     print("       EVALUATION RESULTS (TEST SET)")
@@ -79,5 +109,330 @@ def evaluate():
     print("="*40)
     print(f"Detailed results saved to: {metrics.save_dir}")
 
+
+# Validation-style NMS settings: low confidence so the whole precision/recall curve is scored
+EVAL_CONF = 0.001
+EVAL_IOU = 0.7
+EVAL_MAX_DET = 300
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def load_local_dataset(data_yaml):
+    """
+    Read a merged data.yaml for offline use. Its `path` is whatever machine
+    merged it last (the committed one is a Windows path), so the yaml's own
+    directory is used whenever that path does not exist here.
+    """
+    with open(data_yaml, 'r') as f:
+        data = yaml.safe_load(f)
+    root = data.get('path')
+    if not root or not os.path.isdir(root):
+        root = os.path.dirname(os.path.abspath(data_yaml))
+    data['path'] = root
+    names = data.get('names', [])
+    data['names'] = [names[k] for k in sorted(names)] if isinstance(names, dict) else list(names)
+    return data
+
+
+def split_files(data, split):
+    """(image path, label path) pairs of a split: a directory or a .txt list of ./relative paths."""
+    from shards import resolve_split, split_images
+
+    # e.g. Roboflow's "../test/images", resolved as ultralytics does
+    source = resolve_split(data, data['path'], data.get(split) or f"{split}/images")
+    images = split_images(source.parent, source.name) if source is not None else None
+    if images is None:
+        raise FileNotFoundError(f"Split '{split}' not found under {data['path']}")
+    return [(str(p), str(p.parent.parent / 'labels' / (p.stem + '.txt'))) for p in images]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def prediction_settings(service, model_hash):
+    """Everything predict_split()'s output depends on; hashed into the cache file name."""
+    return {"model_sha256": model_hash, "imgsz": service.imgsz, "decode_size": service.decode_size,
+            "tiling": service.tiling, "conf": EVAL_CONF, "iou": EVAL_IOU, "max_det": EVAL_MAX_DET}
+
+
+def _image_key(path):
+    st = os.stat(path)
+    return f"{os.path.basename(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def load_prediction_cache(path):
+    """{image key: (N, 6) normalized x1, y1, x2, y2, conf, cls} from a cache file."""
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as cache:
+        bounds = np.concatenate([[0], np.cumsum(cache['counts'])])
+        preds = cache['preds']
+        return {key: preds[bounds[i]:bounds[i + 1]] for i, key in enumerate(cache['keys'].tolist())}
+
+
+def save_prediction_cache(path, predictions):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    keys = sorted(predictions)
+    preds = [predictions[k] for k in keys]
+    np.savez(path, keys=np.array(keys), counts=np.array([len(p) for p in preds], dtype=np.int64),
+             preds=np.concatenate(preds) if preds else np.zeros((0, 6), dtype=np.float32))
+
+
+def predict_split(service, images, cache_path, batch=8):
+    """
+    Predictions for every image, normalized to [0, 1] so they can be scored
+    without the image sizes. Only images missing from the cache (keyed by
+    file name, size and mtime) go through the model.
+    """
+    from preprocess import prepare_image, scale_boxes
+
+    cache = load_prediction_cache(cache_path)
+    keys = [_image_key(path) for path in images]
+    missing = [(key, path) for key, path in zip(keys, images) if key not in cache]
+    if missing:
+        print(f"Predicting {len(missing)} of {len(images)} images ({len(images) - len(missing)} cached)...")
+        for start in range(0, len(missing), batch):
+            chunk = missing[start:start + batch]
+            prepared = [prepare_image(path, service.decode_size) for _, path in chunk]
+            results = service.model([p.array for p in prepared], batch=len(chunk), imgsz=service.imgsz,
+                                    conf=EVAL_CONF, iou=EVAL_IOU, max_det=EVAL_MAX_DET, verbose=False)
+            for (key, _), p, r in zip(chunk, prepared, results):
+                data = scale_boxes(r.boxes.data.cpu().numpy(), p).astype(np.float32)
+                data[:, [0, 2]] /= p.original_size[0]
+                data[:, [1, 3]] /= p.original_size[1]
+                cache[key] = data
+        save_prediction_cache(cache_path, cache)
+    else:
+        print(f"All {len(images)} predictions loaded from {cache_path}")
+    return [cache[key] for key in keys]
+
+
+def match_predictions(pred, gt):
+    """(N, 10) correct flags per prediction at IoU 0.5:0.95, greedy by confidence like ultralytics."""
+    correct = np.zeros((len(pred), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred) == 0 or len(gt) == 0:
+        return correct
+    gxy = np.concatenate([gt[:, 1:3] - gt[:, 3:5] / 2, gt[:, 1:3] + gt[:, 3:5] / 2], axis=1)
+    x1 = np.maximum(gxy[:, None, 0], pred[None, :, 0])
+    y1 = np.maximum(gxy[:, None, 1], pred[None, :, 1])
+    x2 = np.minimum(gxy[:, None, 2], pred[None, :, 2])
+    y2 = np.minimum(gxy[:, None, 3], pred[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_g = (gxy[:, 2] - gxy[:, 0]) * (gxy[:, 3] - gxy[:, 1])
+    area_p = (pred[:, 2] - pred[:, 0]) * (pred[:, 3] - pred[:, 1])
+    iou = inter / np.maximum(area_g[:, None] + area_p[None, :] - inter, 1e-9)
+    iou *= gt[:, 0:1] == pred[None, :, 5]
+
+    matched = np.zeros((len(gt), len(IOU_THRESHOLDS)), dtype=bool)
+    columns = range(len(IOU_THRESHOLDS))
+    for j in np.argsort(-pred[:, 4], kind='stable'):
+        if not (iou[:, j] >= IOU_THRESHOLDS[0]).any():
+            continue
+        available = np.where(matched, 0, iou[:, j, None])
+        k = available.argmax(0)
+        correct[j] = available[k, columns] >= IOU_THRESHOLDS
+        matched[k, columns] |= correct[j]
+    return correct
+
+
+def score_predictions(predictions, labels, names):
+    """Overall and per-class precision / recall / mAP50 / mAP50-95 (ultralytics' AP computation)."""
+    from ultralytics.utils.metrics import ap_per_class
+
+    tp, conf, pred_cls, target_cls = [], [], [], []
+    for pred, gt in zip(predictions, labels):
+        tp.append(match_predictions(pred, gt))
+        conf.append(pred[:, 4])
+        pred_cls.append(pred[:, 5])
+        target_cls.append(gt[:, 0])
+    target_cls = np.concatenate(target_cls)
+    if len(target_cls) == 0:
+        raise ValueError("The split has no labelled objects")
+    _, _, p, r, _, ap, classes, *_ = ap_per_class(
+        np.concatenate(tp), np.concatenate(conf), np.concatenate(pred_cls), target_cls,
+        names=dict(enumerate(names)),
+    )
+    per_class = {}
+    for i, c in enumerate(classes.astype(int)):
+        name = names[c] if c < len(names) else str(c)
+        per_class[name] = {
+            "instances": int((target_cls == c).sum()),
+            "precision": float(p[i]),
+            "recall": float(r[i]),
+            "map50": float(ap[i, 0]),
+            "map50_95": float(ap[i].mean()),
+        }
+    return {
+        "images": len(labels),
+        "instances": int(len(target_cls)),
+        "precision": float(p.mean()),
+        "recall": float(r.mean()),
+        "map50": float(ap[:, 0].mean()),
+        "map50_95": float(ap.mean()),
+        "per_class": per_class,
+    }
+
+
+def _stage_stats(samples):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "mean_ms": float(np.mean(samples))}
+
+
+def benchmark_latency(service, images, batch_sizes, runs=3):
+    """
+    Per-batch latency split into decode (upload bytes -> prepared array),
+    inference (letterbox + forward pass) and post-processing (NMS + box
+    scaling + label formatting), plus end-to-end throughput, per batch size.
+    """
+    from preprocess import prepare_image, scale_boxes
+    from services import format_detections
+
+    payloads = []
+    for path in images:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    service.model(np.zeros((service.imgsz, service.imgsz, 3), dtype=np.uint8), imgsz=service.imgsz, verbose=False)
+
+    report = {}
+    for batch in batch_sizes:
+        stages = {"decode": [], "inference": [], "postprocess": [], "end_to_end": []}
+        processed, total = 0, 0.0
+        for _ in range(runs):
+            for start in range(0, len(payloads) - batch + 1, batch):
+                chunk = payloads[start:start + batch]
+                t0 = time.perf_counter()
+                prepared = [prepare_image(data, service.decode_size) for data in chunk]
+                t1 = time.perf_counter()
+                results = service.model([p.array for p in prepared], batch=len(chunk), imgsz=service.imgsz,
+                                        verbose=False)
+                t2 = time.perf_counter()
+                for p, r in zip(prepared, results):
+                    format_detections(scale_boxes(r.boxes.data.cpu().numpy(), p), service.labels)
+                t3 = time.perf_counter()
+                # ultralytics' own NMS timing (per image) moves from the model call to post-processing
+                nms = results[0].speed["postprocess"] * len(chunk) / 1000 if results else 0.0
+                stages["decode"].append((t1 - t0) * 1000)
+                stages["inference"].append((t2 - t1 - nms) * 1000)
+                stages["postprocess"].append((t3 - t2 + nms) * 1000)
+                stages["end_to_end"].append((t3 - t0) * 1000)
+                processed += len(chunk)
+                total += t3 - t0
+        if not processed:
+            print(f"  batch {batch}: not enough images, skipped")
+            continue
+        report[str(batch)] = {name: _stage_stats(samples) for name, samples in stages.items()}
+        report[str(batch)]["throughput_ips"] = processed / total
+        e2e = report[str(batch)]["end_to_end"]
+        print(f"  batch {batch}: p50 {e2e['p50_ms']:.1f} ms, p99 {e2e['p99_ms']:.1f} ms per batch, "
+              f"{report[str(batch)]['throughput_ips']:.1f} img/s")
+    return report
+
+
+def _offline_service(service, device=None, imgsz=None):
+    if imgsz:
+        service.imgsz = int(imgsz)
+    if device:
+        service.model.overrides["device"] = device
+        service.model.predictor = None  # set up again on `device` (warmup already placed it)
+    return service
+
+
+def evaluate_offline(data_yaml="merged_data/data.yaml", weights=None, split="test", backend="pytorch",
+                     latency_backends=("pytorch",), batch_sizes=(1, 8), latency_images=32, runs=3,
+                     cache_dir=os.path.join("runs", "eval", "cache"), output=None, device=None, imgsz=None):
+    """
+    Score cached predictions on a local split and benchmark the backends;
+    returns the report. `device` (e.g. "cpu") pins the PyTorch models and
+    `imgsz` overrides YOLO_IMGSZ (e.g. the size a model was trained at).
+    """
+    from services import BACKEND_SUFFIXES, YoloService, backend_model_path, find_model_path
+    from shards import read_labels
+
+    print("--- VisionChef Offline Evaluation ---")
+    data = load_local_dataset(data_yaml)
+    pairs = split_files(data, split)
+    images = [image for image, _ in pairs]
+    labels = [read_labels(Path(label)) for _, label in pairs]
+    weights = weights or find_model_path()
+
+    service = _offline_service(YoloService(weights, cache_mode="off", backend=backend, tiling="off"), device, imgsz)
+    model_hash = file_sha256(service.model_path)
+    # Any change to the model file or a prediction setting gets its own cache file
+    settings = prediction_settings(service, model_hash)
+    settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{model_hash[:16]}_{settings_hash[:12]}_{split}.npz")
+    start = time.perf_counter()
+    predictions = predict_split(service, images, cache_path)
+    metrics = score_predictions(predictions, labels, data['names'])
+    metrics["scoring_s"] = time.perf_counter() - start
+
+    report = {
+        "model": {"weights": weights, "path": service.model_path, "backend": service.backend,
+                  "sha256": model_hash, "imgsz": service.imgsz, "device": device},
+        "data": os.path.abspath(data_yaml),
+        "split": split,
+        "prediction_settings": settings,
+        "metrics": metrics,
+        "latency": {},
+    }
+    for name in latency_backends:
+        if name not in BACKEND_SUFFIXES:
+            raise ValueError(f"Unknown backend '{name}', expected one of {list(BACKEND_SUFFIXES)}")
+        if name != "pytorch" and not os.path.exists(backend_model_path(weights, name)):
+            print(f"- {name}: not exported (run export.py), skipping latency")
+            continue
+        print(f"\n⏱️  Latency for {name}...")
+        bench_service = service if name == service.backend else _offline_service(
+            YoloService(weights, cache_mode="off", backend=name, tiling="off"), device, imgsz)
+        report["latency"][name] = benchmark_latency(bench_service, images[:latency_images], batch_sizes, runs)
+
+    print("\n" + "=" * 60)
+    print(f"       OFFLINE RESULTS ({split.upper()} SET, {metrics['images']} images)")
+    print("=" * 60)
+    print(f"mAP50-95: {metrics['map50_95']:.4f}   mAP50: {metrics['map50']:.4f}   "
+          f"P: {metrics['precision']:.4f}   R: {metrics['recall']:.4f}")
+    worst = sorted(metrics["per_class"].items(), key=lambda item: item[1]["map50_95"])[:5]
+    print("Weakest classes: " + ", ".join(f"{name} ({m['map50_95']:.3f})" for name, m in worst))
+    print("=" * 60)
+
+    output = output or os.path.join("runs", "eval", f"{Path(weights).stem}-{model_hash[:12]}-{split}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Report saved to: {output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offline", action="store_true", help="Use the local dataset instead of Roboflow")
+    parser.add_argument("--data", default=os.path.join("merged_data", "data.yaml"))
+    parser.add_argument("--weights", default=None, help="PyTorch weights (default: same search as the API)")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--backend", default="pytorch", help="Backend whose predictions are scored")
+    parser.add_argument("--backends", nargs="*", default=["pytorch"],
+                        help="Backends to measure latency for (none to skip the latency benchmark)")
+    parser.add_argument("--device", default=None, help="e.g. cpu (default: ultralytics' choice)")
+    parser.add_argument("--imgsz", type=int, default=None, help="Inference size (default: YOLO_IMGSZ)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--latency-images", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the latency images per batch size")
+    parser.add_argument("--output", default=None, help="Report path (default: runs/eval/<weights>-<hash>-<split>.json)")
+    args = parser.parse_args()
+
+    if not args.offline:
+        evaluate()
+        return
+    evaluate_offline(args.data, weights=args.weights, split=args.split, backend=args.backend,
+                     latency_backends=args.backends, batch_sizes=args.batch_sizes,
+                     latency_images=args.latency_images, runs=args.runs, output=args.output, device=args.device,
+                     imgsz=args.imgsz)
+
+
 if __name__ == "__main__":
-    evaluate()
+    main()
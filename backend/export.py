@@ -0,0 +1,178 @@
+"""
+Export trained weights to optimized CPU inference backends and compare them.
+
+    # ONNX + OpenVINO (FP32), plus OpenVINO INT8 calibrated on merged_data/valid
+    python export.py --weights runs/detect/train/weights/best.pt --int8
+
+    # Latency / throughput / test mAP for every backend that has been exported
+    python export.py --weights runs/detect/train/weights/best.pt --compare
+
+Exported models are written next to the weights, where YoloService finds
+them when YOLO_BACKEND is set (onnx | openvino | openvino-int8).
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+from preprocess import decode_image
+from services import BACKEND_SUFFIXES, backend_model_path, find_model_path
+
+
+def local_data_yaml(data_yaml: str, out_dir: str = os.path.join("runs", "export")) -> str:
+    """
+    `data_yaml` with its `path` resolved by evaluate.load_local_dataset (the
+    committed merged_data/data.yaml carries a Windows path); ultralytics gets
+    a copy in `out_dir` when the path had to change.
+    """
+    from evaluate import load_local_dataset
+
+    with open(data_yaml, "r") as f:
+        path = yaml.safe_load(f).get("path")
+    data = load_local_dataset(data_yaml)
+    if path == data["path"]:
+        return data_yaml
+    os.makedirs(out_dir, exist_ok=True)
+    local_yaml = os.path.join(out_dir, "data.yaml")
+    with open(local_yaml, "w") as f:
+        yaml.dump(data, f, sort_keys=False)
+    return local_yaml
+
+
+def export_backends(weights: str, data_yaml: str, imgsz: int = 640, formats=("onnx", "openvino"),
+                    int8: bool = False):
+    """Export `weights` to each format; INT8 uses the dataset's val split for calibration."""
+    print("=" * 60)
+    print(f"📦 Exporting {weights} (imgsz={imgsz})")
+    print("=" * 60)
+    exported = {}
+    for fmt in formats:
+        start = time.perf_counter()
+        # dynamic=True keeps the batch dimension free for the batching queue
+        path = YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=True)
+        exported[fmt] = path
+        print(f"✓ {fmt}: {path} ({time.perf_counter() - start:.1f}s)")
+
+    if int8:
+        # Post-training quantization (NNCF) calibrated on merged_data/valid
+        start = time.perf_counter()
+        path = YOLO(weights).export(format="openvino", imgsz=imgsz, int8=True, data=local_data_yaml(data_yaml),
+                                    dynamic=True)
+        exported["openvino-int8"] = path
+        print(f"✓ openvino-int8: {path} ({time.perf_counter() - start:.1f}s)")
+    return exported
+
+
+def _percentiles(samples):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def benchmark_backend(model_path: str, images, imgsz: int = 640, batch: int = 8, runs: int = 50):
+    """Single-image latency percentiles and batched throughput for one backend."""
+    model = YOLO(model_path, task="detect")
+    arrays = [decode_image(p) for p in images]
+    for array in arrays[:3]:
+        model(array, imgsz=imgsz, verbose=False)
+
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        model(arrays[i % len(arrays)], imgsz=imgsz, verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    batches = [arrays[i:i + batch] for i in range(0, len(arrays), batch)]
+    model(batches[0], imgsz=imgsz, batch=len(batches[0]), verbose=False)
+    start = time.perf_counter()
+    count = 0
+    for chunk in batches:
+        model(chunk, imgsz=imgsz, batch=len(chunk), verbose=False)
+        count += len(chunk)
+    throughput = count / (time.perf_counter() - start)
+
+    stats = _percentiles(latencies)
+    stats["throughput_ips"] = throughput
+    stats["batch"] = batch
+    return stats
+
+
+def evaluate_backend(model_path: str, data_yaml: str, imgsz: int = 640):
+    metrics = YOLO(model_path, task="detect").val(data=data_yaml, split="test", imgsz=imgsz, batch=1,
+                                                   plots=False, verbose=False)
+    return {
+        "map50_95": float(metrics.box.map),
+        "map50": float(metrics.box.map50),
+        "precision": float(metrics.box.mp),
+        "recall": float(metrics.box.mr),
+    }
+
+
+def compare_backends(weights: str, data_yaml: str, imgsz: int = 640, batch: int = 8, runs: int = 50,
+                     num_images: int = 32, skip_map: bool = False, output: str = None):
+    from evaluate import load_local_dataset, split_files
+
+    images = [image for image, _ in split_files(load_local_dataset(data_yaml), "test")][:num_images]
+    if not images:
+        raise FileNotFoundError(f"No test images found for {data_yaml}")
+
+    report = {"weights": weights, "data": data_yaml, "imgsz": imgsz, "backends": {}}
+    val_yaml = local_data_yaml(data_yaml)
+    for backend in BACKEND_SUFFIXES:
+        model_path = backend_model_path(weights, backend)
+        if not os.path.exists(model_path):
+            print(f"- {backend}: not exported, skipping")
+            continue
+        print(f"\n⏱️  Benchmarking {backend} ({model_path})...")
+        result = {"model_path": model_path}
+        result.update(benchmark_backend(model_path, images, imgsz=imgsz, batch=batch, runs=runs))
+        if not skip_map:
+            print(f"🎯 Evaluating {backend} on the test split...")
+            result.update(evaluate_backend(model_path, val_yaml, imgsz=imgsz))
+        report["backends"][backend] = result
+
+    print("\n" + "=" * 78)
+    print(f"{'backend':<15} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'mAP50-95':>9} {'mAP50':>7} {'Δ mAP':>7}")
+    print("=" * 78)
+    baseline = report["backends"].get("pytorch", {}).get("map50_95")
+    for backend, r in report["backends"].items():
+        map_str = f"{r['map50_95']:>9.4f} {r['map50']:>7.4f}" if "map50_95" in r else f"{'-':>9} {'-':>7}"
+        delta = f"{r['map50_95'] - baseline:>+7.4f}" if baseline is not None and "map50_95" in r else f"{'-':>7}"
+        print(f"{backend:<15} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['throughput_ips']:>8.1f} {map_str} {delta}")
+    print("=" * 78)
+
+    output = output or os.path.join("runs", "export", "backend_report.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=None, help="PyTorch weights (default: same search as the API)")
+    parser.add_argument("--data", default="merged_data/data.yaml", help="Dataset yaml (valid split calibrates INT8)")
+    parser.add_argument("--imgsz", type=int, default=int(os.getenv("YOLO_IMGSZ", "640")))
+    parser.add_argument("--formats", nargs="+", default=["onnx", "openvino"], choices=["onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="Also export an INT8-quantized OpenVINO model")
+    parser.add_argument("--compare", action="store_true", help="Benchmark already exported backends instead of exporting")
+    parser.add_argument("--batch", type=int, default=8, help="Batch size for the throughput measurement")
+    parser.add_argument("--runs", type=int, default=50, help="Single-image latency samples per backend")
+    parser.add_argument("--skip-map", action="store_true", help="Only measure speed")
+    parser.add_argument("--output", default=None, help="Report path (default: runs/export/backend_report.json)")
+    args = parser.parse_args()
+
+    weights = args.weights or find_model_path()
+    if args.compare:
+        compare_backends(weights, args.data, imgsz=args.imgsz, batch=args.batch, runs=args.runs,
+                         skip_map=args.skip_map, output=args.output)
+    else:
+        export_backends(weights, args.data, imgsz=args.imgsz, formats=args.formats, int8=args.int8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import json
+import os
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from taxonomy import canonical_name
+
+
+def normalize_ingredient(name: str) -> str:
+    """
+    Same taxonomy as the detector output, so "Tomatoes" in a recipe matches "tomato".
+
+    >>> normalize_ingredient("Tomatoes"), normalize_ingredient("All-Purpose Flour")
+    ('tomato', 'all-purpose flour')
+    """
+    return canonical_name(name)
+
+
+class LocalRecipeService:
+    """
+    Offline recipe backend with the same interface as SpoonacularService.
+
+    Recipes are loaded from a JSONL file, one recipe per line:
+
+        {"id": 1, "title": "...", "image": "...", "ingredients": ["tomato", "onion"],
+         "sourceUrl": "...", "readyInMinutes": 20, "summary": "..."}
+
+    Spoonacular recipe information objects are accepted as well; their
+    `extendedIngredients[].name` is used when `ingredients` is missing.
+
+    Lookups go through an inverted index (ingredient -> sorted array of
+    recipe positions) and are ranked like findByIngredients with ranking=1:
+    most used ingredients first, then fewest missing ones.
+    """
+    DETAIL_FIELDS = ("sourceUrl", "readyInMinutes", "summary")
+
+    def __init__(self, corpus_path: str = None, recipes: Iterable[Dict] = None):
+        if recipes is None:
+            recipes = self._load_jsonl(corpus_path)
+        self._build_index(recipes)
+        print(f"Local recipe index: {len(self.recipes)} recipes, {len(self.vocabulary)} ingredients")
+
+    @staticmethod
+    def _load_jsonl(path: str) -> List[Dict]:
+        recipes = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    recipes.append(json.loads(line))
+        return recipes
+
+    def _build_index(self, recipes: Iterable[Dict]):
+        self.recipes: List[Dict] = []
+        self.recipe_ingredients: List[List[int]] = []
+        self.vocabulary: Dict[str, int] = {}
+        self.ingredient_names: List[str] = []
+        postings: List[List[int]] = []
+
+        for recipe in recipes:
+            names = recipe.get("ingredients")
+            if names is None:
+                names = [i.get("name", "") for i in recipe.get("extendedIngredients", [])]
+            ids = []
+            for name in names:
+                key = normalize_ingredient(name)
+                if not key:
+                    continue
+                ing_id = self.vocabulary.get(key)
+                if ing_id is None:
+                    ing_id = len(self.ingredient_names)
+                    self.vocabulary[key] = ing_id
+                    self.ingredient_names.append(key)
+                    postings.append([])
+                ids.append(ing_id)
+            ids = sorted(set(ids))
+
+            position = len(self.recipes)
+            for ing_id in ids:
+                postings[ing_id].append(position)
+            self.recipes.append(recipe)
+            self.recipe_ingredients.append(ids)
+
+        # Positions are appended in increasing order, so each list is already sorted
+        self.postings = [np.asarray(p, dtype=np.int32) for p in postings]
+        self.ingredient_counts = np.asarray([len(ids) for ids in self.recipe_ingredients], dtype=np.int32)
+
+    def search(self, ingredients: List[str], number: int = 5) -> List[Dict]:
+        """
+        Synchronous lookup; returns findByIngredients-shaped recipes.
+
+        >>> service = LocalRecipeService(recipes=[
+        ...     {"id": 1, "ingredients": ["all-purpose flour", "eggs", "half-and-half"]},
+        ...     {"id": 2, "ingredients": ["all-bran cereal", "milk"]}])
+        Local recipe index: 2 recipes, 5 ingredients
+        >>> [(r["id"], r["usedIngredientCount"], r["missedIngredientCount"])
+        ...  for r in service.search(["all-purpose flour", "egg"])]
+        [(1, 2, 1)]
+        """
+        query_ids = []
+        for name in ingredients:
+            ing_id = self.vocabulary.get(normalize_ingredient(name))
+            if ing_id is not None:
+                query_ids.append(ing_id)
+        query_ids = sorted(set(query_ids))
+        if not query_ids or number <= 0:
+            return []
+
+        # used[r] = number of query ingredients recipe r contains
+        hits = np.concatenate([self.postings[i] for i in query_ids])
+        candidates, used = np.unique(hits, return_counts=True)
+        missed = self.ingredient_counts[candidates] - used
+
+        # ranking=1: maximize used, then minimize missed (ties by corpus order)
+        order = np.lexsort((candidates, missed, -used))[:number]
+
+        query_set = set(query_ids)
+        results = []
+        for idx in order:
+            position = int(candidates[idx])
+            recipe = self.recipes[position]
+            ids = self.recipe_ingredients[position]
+            used_names = [{"name": self.ingredient_names[i]} for i in ids if i in query_set]
+            missed_names = [{"name": self.ingredient_names[i]} for i in ids if i not in query_set]
+            result = {
+                "id": recipe.get("id", position),
+                "title": recipe.get("title", ""),
+                "image": recipe.get("image", ""),
+                "usedIngredientCount": len(used_names),
+                "missedIngredientCount": len(missed_names),
+                "usedIngredients": used_names,
+                "missedIngredients": missed_names,
+                "unusedIngredients": [],
+                "likes": recipe.get("likes", 0),
+            }
+            for field in self.DETAIL_FIELDS:
+                if field in recipe:
+                    result[field] = recipe[field]
+            results.append(result)
+        return results
+
+    async def find_recipes_by_ingredients(self, ingredients: List[str], number: int = 5) -> List[Dict]:
+        if not ingredients:
+            return []
+        return self.search(ingredients, number)
+
+    async def stream_recipes(self, ingredients: List[str], number: int = 5) -> AsyncIterator[Tuple[str, Dict]]:
+        # Local recipes carry their details already, so there is nothing to stream after them
+        yield "recipes", {"recipes": await self.find_recipes_by_ingredients(ingredients, number)}
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {
+            "recipes": len(self.recipes),
+            "ingredients": len(self.ingredient_names),
+        }
+
+
+def load_local_recipes(corpus_path: str = None):
+    """Build the local backend if a corpus file is configured and present."""
+    corpus_path = corpus_path or os.getenv("RECIPE_CORPUS_PATH", "recipes.jsonl")
+    if not corpus_path or not os.path.exists(corpus_path):
+        return None
+    return LocalRecipeService(corpus_path)
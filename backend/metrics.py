@@ -0,0 +1,176 @@
+"""
+Request-path instrumentation: histograms and counters rendered in the
+Prometheus text format (GET /metrics), plus sampled structured logs.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+
+class Histogram:
+    """
+    Minimal thread-safe histogram with fixed upper bounds.
+    Counts are cumulative per bucket (Prometheus style), plus a +Inf bucket.
+    """
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    self._counts[i] += 1
+                    return
+            self._counts[-1] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            cumulative = {}
+            running = 0
+            for upper, count in zip(self.buckets, self._counts):
+                running += count
+                cumulative[str(upper)] = running
+            cumulative["+Inf"] = self._count
+            return {
+                "buckets": cumulative,
+                "count": self._count,
+                "sum": self._sum,
+                "mean": (self._sum / self._count) if self._count else 0.0,
+            }
+
+    def prometheus(self, name: str, labels: Dict[str, str] = None) -> List[str]:
+        """`name_bucket`, `name_sum` and `name_count` sample lines."""
+        snap = self.snapshot()
+        lines = [f"{name}_bucket{_labels({**(labels or {}), 'le': le})} {count}"
+                 for le, count in snap["buckets"].items()]
+        lines.append(f"{name}_sum{_labels(labels)} {snap['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {snap['count']}")
+        return lines
+
+
+def _labels(labels: Dict[str, str] = None) -> str:
+    if not labels:
+        return ""
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in labels.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+class HistogramFamily:
+    """One Histogram per value of a single label (e.g. stage), created on first use."""
+    def __init__(self, name: str, help: str, label: str, buckets: List[float]):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._children: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: str, seconds: float):
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(value, Histogram(self.buckets))
+        child.observe(seconds)
+
+    @contextmanager
+    def time(self, value: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(value, time.perf_counter() - start)
+
+    def prometheus(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, child in sorted(self._children.items()):
+            lines.extend(child.prometheus(self.name, {self.label: value}))
+        return lines
+
+
+class Counter:
+    """Thread-safe counter keyed by a tuple of label values."""
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount: float = 1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def prometheus(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return counter_lines(self.name, self.help, [(dict(zip(self.labels, k)), v) for k, v in items])
+
+
+def counter_lines(name: str, help: str, samples: Iterable[Tuple[Dict[str, str], float]],
+                  kind: str = "counter") -> List[str]:
+    """Render externally kept values (e.g. cache stats) as one metric family."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_labels(labels)} {value:g}" for labels, value in samples)
+    return lines
+
+
+# Hot-path metrics, shared by app.py, services.py and worker_pool.py
+STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+STAGE_SECONDS = HistogramFamily(
+    "visionchef_stage_seconds", "Time spent per request-path stage", "stage", STAGE_BUCKETS)
+REQUESTS = Counter("visionchef_requests_total", "Analysis requests by endpoint and status", ("endpoint", "status"))
+UPSTREAM_RESPONSES = Counter(
+    "visionchef_upstream_responses_total", "Spoonacular responses by endpoint and HTTP status (or timeout/error)",
+    ("endpoint", "status"))
+UPSTREAM_ATTEMPTS = Counter(
+    "visionchef_upstream_attempts_total", "Spoonacular requests sent, by endpoint and kind (first/hedge/retry)",
+    ("endpoint", "kind"))
+
+
+# Structured logs: one JSON object per line on stdout. Info events are sampled at
+# LOG_SAMPLE_RATE; warnings and errors are always written. Formatting and the
+# stdout write happen on a listener thread, off the request path.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+_logger = logging.getLogger("visionchef")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        _logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    """Write `{"ts", "level", "event", **fields}`; info events only for a LOG_SAMPLE_RATE fraction of calls."""
+    if level <= logging.INFO and random.random() >= LOG_SAMPLE_RATE:
+        return
+    if _listener is None:
+        _start_listener()
+    record = {"ts": round(time.time(), 3), "level": logging.getLevelName(level).lower(), "event": event, **fields}
+    _logger.log(level, json.dumps(record, default=str))
@@ -0,0 +1,135 @@
+import io
+import os
+from typing import Tuple
+
+import numpy as np
+
+# Decompression-bomb guard: images above this many pixels are rejected before decoding
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(100_000_000)))
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def open_image(image, max_pixels: int = None):
+    """
+    Open bytes / a file path as a PIL image without decoding the pixel data,
+    rejecting it if it has more than `max_pixels` pixels.
+    """
+    from PIL import Image
+
+    max_pixels = MAX_IMAGE_PIXELS if max_pixels is None else max_pixels
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        img = Image.open(io.BytesIO(image))
+    else:
+        img = Image.open(image)
+    width, height = img.size
+    if max_pixels > 0 and width * height > max_pixels:
+        raise ImageTooLarge(f"Image is {width}x{height}, more than {max_pixels} pixels")
+    return img
+
+
+def oriented_size(img) -> Tuple[int, int]:
+    """(width, height) of `img` as displayed, i.e. after applying its EXIF orientation."""
+    width, height = img.size
+    if img.getexif().get(0x0112, 1) in _TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def _to_bgr(img) -> np.ndarray:
+    rgb = np.asarray(img.convert("RGB"))
+    return np.ascontiguousarray(rgb[:, :, ::-1])
+
+
+def decode_image(image) -> np.ndarray:
+    """
+    Decode raw bytes / a file path / an already decoded array into a
+    contiguous HxWx3 uint8 BGR array (the layout ultralytics expects for
+    numpy inputs), at full resolution and in EXIF orientation.
+    """
+    if isinstance(image, np.ndarray):
+        return np.ascontiguousarray(image, dtype=np.uint8)
+
+    from PIL import ImageOps
+
+    return _to_bgr(ImageOps.exif_transpose(open_image(image)))
+
+
+class PreparedImage:
+    """
+    An image decoded for inference at roughly the model input size.
+    `scale` = (sx, sy) maps box coordinates on `array` back to the original
+    (EXIF-oriented) image, whose size is `original_size`.
+    """
+    __slots__ = ("array", "scale", "original_size")
+
+    def __init__(self, array: np.ndarray, scale: Tuple[float, float], original_size: Tuple[int, int]):
+        self.array = array
+        self.scale = scale
+        self.original_size = original_size
+
+
+def prepare_image(image, target_size: int, max_pixels: int = None) -> PreparedImage:
+    """
+    Decode `image` for a model that letterboxes to `target_size`.
+
+    JPEGs are decoded with draft mode, which lets libjpeg scale by 1/2, 1/4
+    or 1/8 during decoding, so a 12 MP phone photo is never materialized at
+    full size. The result is EXIF-transposed and, if still larger, resized
+    so its longest side is `target_size`.
+    Arrays are used as they are.
+    """
+    if isinstance(image, PreparedImage):
+        return image
+    if isinstance(image, np.ndarray):
+        array = np.ascontiguousarray(image, dtype=np.uint8)
+        return PreparedImage(array, (1.0, 1.0), (array.shape[1], array.shape[0]))
+
+    from PIL import Image, ImageOps
+
+    img = open_image(image, max_pixels)
+    original_w, original_h = oriented_size(img)
+    # Smallest 1/2^n reduction that keeps both sides >= target_size (no-op for non-JPEGs)
+    img.draft("RGB", (target_size, target_size))
+    img = ImageOps.exif_transpose(img)
+
+    width, height = img.size
+    if max(width, height) > target_size:
+        ratio = target_size / max(width, height)
+        img = img.resize((max(1, round(width * ratio)), max(1, round(height * ratio))), Image.BILINEAR)
+        width, height = img.size
+
+    return PreparedImage(_to_bgr(img), (original_w / width, original_h / height), (original_w, original_h))
+
+
+def scale_boxes(data: np.ndarray, prepared: PreparedImage) -> np.ndarray:
+    """Map (N, 6) x1, y1, x2, y2, conf, cls rows from the prepared image back to the original."""
+    sx, sy = prepared.scale
+    if sx == 1.0 and sy == 1.0:
+        return data
+    data = np.array(data, dtype=np.float32)
+    data[:, [0, 2]] = np.clip(data[:, [0, 2]] * sx, 0, prepared.original_size[0])
+    data[:, [1, 3]] = np.clip(data[:, [1, 3]] * sy, 0, prepared.original_size[1])
+    return data
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of a BGR array: compares neighbouring pixels of a
+    (hash_size + 1) x hash_size grayscale thumbnail. Re-encoded or slightly
+    edited copies of a photo land within a few bits of each other.
+    """
+    from PIL import Image
+
+    gray = Image.fromarray(np.ascontiguousarray(image[:, :, ::-1])).convert("L")
+    small = np.asarray(gray.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from cache import LRUCache
+
+
+class RecipeCache:
+    """
+    Two-level cache for Spoonacular results, each level an in-memory LRU in
+    front of a SQLite table so entries survive restarts:
+
+    - searches: canonical ingredient-set key -> findByIngredients result
+      (recipe ids plus the query-relative used/missed ingredient data)
+    - recipes:  recipe id -> the informationBulk fields we return
+
+    Pass db_path=None to keep everything in memory only. Expired entries are
+    kept for another `stale_ttl` seconds and returned by lookups with
+    allow_stale=True, for when Spoonacular is unavailable.
+    """
+    # informationBulk fields merged into each recipe
+    DETAIL_FIELDS = ("sourceUrl", "readyInMinutes", "summary")
+
+    def __init__(self, db_path: Optional[str] = "recipe_cache.sqlite3",
+                 search_ttl: float = 6 * 3600, detail_ttl: float = 7 * 24 * 3600,
+                 memory_entries: int = 1024, stale_ttl: float = 0.0):
+        self.search_ttl = search_ttl
+        self.detail_ttl = detail_ttl
+        self.stale_ttl = stale_ttl
+        self.searches = LRUCache(max_entries=memory_entries, ttl_seconds=search_ttl, stale_seconds=stale_ttl)
+        self.details = LRUCache(max_entries=memory_entries * 4, ttl_seconds=detail_ttl, stale_seconds=stale_ttl)
+        self.disk_hits = 0
+        self.stale_disk_hits = 0
+
+        self._db = None
+        self._lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS recipes (id INTEGER PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+            self.purge_expired()
+
+    @staticmethod
+    def ingredient_key(ingredients: Iterable[str], number: int) -> str:
+        """Order- and case-insensitive key for an ingredient query."""
+        normalized = sorted({i.strip().lower() for i in ingredients if i and i.strip()})
+        return f"{number}|" + ",".join(normalized)
+
+    def _oldest_valid(self, allow_stale: bool) -> float:
+        return time.time() - (self.stale_ttl if allow_stale else 0.0)
+
+    def _remember(self, cache: LRUCache, key, value, expires_at: float):
+        """
+        Keep a row read back from SQLite in memory for its remaining lifetime
+        only. A stale row (allow_stale reads during an outage) goes in already
+        expired, so it stays a stale-only entry and never becomes a fresh hit.
+        """
+        remaining = expires_at - time.time()
+        if remaining > 0:
+            self.disk_hits += 1
+        else:
+            self.stale_disk_hits += 1
+        cache.put(key, value, ttl_seconds=remaining)
+
+    def get_search(self, key: str, allow_stale: bool = False) -> Optional[List[Dict]]:
+        recipes = self.searches.get(key, allow_stale=allow_stale)
+        if recipes is not None or self._db is None:
+            return recipes
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM searches WHERE key = ? AND expires_at > ?",
+                (key, self._oldest_valid(allow_stale)),
+            ).fetchone()
+        if row is None:
+            return None
+        recipes = json.loads(row[0])
+        self._remember(self.searches, key, recipes, row[1])
+        return recipes
+
+    def put_search(self, key: str, recipes: List[Dict]):
+        self.searches.put(key, recipes)
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO searches (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(recipes), time.time() + self.search_ttl),
+            )
+            self._db.commit()
+
+    def get_details(self, recipe_ids: List[int], allow_stale: bool = False) -> Dict[int, Dict]:
+        found = {}
+        missing = []
+        for recipe_id in recipe_ids:
+            detail = self.details.get(recipe_id, allow_stale=allow_stale)
+            if detail is not None:
+                found[recipe_id] = detail
+            else:
+                missing.append(recipe_id)
+
+        if missing and self._db is not None:
+            placeholders = ",".join("?" * len(missing))
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT id, value, expires_at FROM recipes WHERE id IN ({placeholders}) AND expires_at > ?",
+                    (*missing, self._oldest_valid(allow_stale)),
+                ).fetchall()
+            for recipe_id, value, expires_at in rows:
+                detail = json.loads(value)
+                found[recipe_id] = detail
+                self._remember(self.details, recipe_id, detail, expires_at)
+        return found
+
+    def put_details(self, details: List[Dict]):
+        rows = []
+        expires_at = time.time() + self.detail_ttl
+        for d in details:
+            if "id" not in d:
+                continue
+            detail = {field: d.get(field) for field in self.DETAIL_FIELDS}
+            self.details.put(d["id"], detail)
+            rows.append((d["id"], json.dumps(detail), expires_at))
+        if self._db is None or not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO recipes (id, value, expires_at) VALUES (?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def purge_expired(self):
+        if self._db is None:
+            return
+        oldest = self._oldest_valid(allow_stale=True)
+        with self._lock:
+            self._db.execute("DELETE FROM searches WHERE expires_at <= ?", (oldest,))
+            self._db.execute("DELETE FROM recipes WHERE expires_at <= ?", (oldest,))
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict:
+        return {
+            "searches": self.searches.stats(),
+            "details": self.details.stats(),
+            "disk_hits": self.disk_hits,
+            "stale_disk_hits": self.stale_disk_hits,
+            "persistent": self._db is not None,
+        }
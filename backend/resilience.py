@@ -0,0 +1,113 @@
+"""
+Client-side protection for the Spoonacular API: a token bucket that keeps
+us within the plan's request rate, and a circuit breaker that stops calling
+an upstream that keeps failing (quota exhausted, 5xx, timeouts) so requests
+fail fast instead of each waiting out the timeout.
+"""
+import asyncio
+import time
+from typing import Dict
+
+
+class UpstreamUnavailable(Exception):
+    """The call was not sent: circuit open or no rate-limit token before the deadline."""
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, up to `burst` saved up. rate <= 0 disables the
+    limit. Meant for one event loop (no awaits between read and update).
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self.throttled = 0
+        self.rejected = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now."""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self, timeout: float) -> bool:
+        """
+        Wait for a token for at most `timeout` seconds. The token is reserved
+        before sleeping (the balance may go negative), so concurrent callers
+        are served in arrival order.
+        """
+        if self.rate <= 0:
+            return True
+        self._refill()
+        wait = (1 - self._tokens) / self.rate
+        if wait > timeout:
+            self.rejected += 1
+            return False
+        self._tokens -= 1
+        if wait > 0:
+            self.throttled += 1
+            await asyncio.sleep(wait)
+        return True
+
+    def stats(self) -> Dict:
+        if self.rate > 0:
+            self._refill()
+        return {"rate": self.rate, "burst": self.burst, "tokens": self._tokens,
+                "throttled": self.throttled, "rejected": self.rejected}
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures. While open
+    every call is refused; after `reset_timeout` seconds one probe call is let
+    through (half-open), and its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.refused = 0
+        self._changed_at = time.monotonic()
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        # Also re-probes if a half-open probe never reported back
+        if time.monotonic() - self._changed_at >= self.reset_timeout:
+            self._set("half_open")
+            return True
+        self.refused += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != "closed":
+            self._set("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.trips += 1
+            self._set("open")
+
+    def _set(self, state: str):
+        self.state = state
+        self._changed_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips,
+                "refused": self.refused, "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout}
@@ -1,8 +1,22 @@
+import asyncio
+import copy
+import hashlib
+import logging
 import os
-import requests
-from typing import List, Dict
-from ultralytics import YOLO
+import random
+import threading
+import time
+import httpx
+import numpy as np
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from cache import LRUCache
+from metrics import STAGE_SECONDS, UPSTREAM_ATTEMPTS, UPSTREAM_RESPONSES, log_event
+from preprocess import dhash, prepare_image, scale_boxes
+from recipe_cache import RecipeCache
+from resilience import CircuitBreaker, TokenBucket, UpstreamUnavailable
+from taxonomy import LabelTable
+from tiling import merge_detections, needs_tiling, tile_windows
 
 
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
@@ -11,94 +25,544 @@ SPOONACULAR_API_KEY = os.getenv("SPOONACULAR_API_KEY")
 if not SPOONACULAR_API_KEY:
     print("Warning: SPOONACULAR_API_KEY not found in environment variables.")
 
+def find_model_path() -> str:
+    """
+    Locate the trained model if it exists.
+    YOLO_MODEL_PATH (e.g. a distilled student from `train.py --distill`) wins;
+    usually stored in runs/detect/train/weights/best.pt relative to where script is run;
+    otherwise fall back to 'yolov8n.pt'.
+    """
+    if os.getenv("YOLO_MODEL_PATH"):
+        return os.getenv("YOLO_MODEL_PATH")
+    possible_paths = [
+        "runs/weights/best.pt",
+        "../runs/weights/best.pt",
+        "runs/detect/train/weights/best.pt",
+        "../runs/detect/train/weights/best.pt",
+        "yolov8n.pt"  # Fallback
+    ]
+    model_path = "yolov8n.pt"
+    for path in possible_paths:
+        if os.path.exists(path):
+            model_path = path
+            print(f"Found custom model at: {path}")
+            break
+
+    if model_path == "yolov8n.pt":
+         print("Custom model not found. Using generic YOLOv8n (expect poor results for specific fridge items until training is done).")
+    return model_path
+
+def _weights_fingerprint(model_path: str) -> str:
+    """Identifies a weights file by path, size and mtime (changes when it is retrained/replaced)."""
+    try:
+        st = os.stat(model_path)
+    except OSError:
+        return model_path
+    return f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _result_size(result: Dict) -> int:
+    """Rough in-memory size of a detect() result, for the cache byte budget."""
+    return 256 + 200 * len(result["detections"]) + 64 * len(result["ingredients"])
+
+# Post-processing filters applied after NMS (0 disables)
+DETECTION_MIN_CONFIDENCE = float(os.getenv("DETECTION_MIN_CONFIDENCE", "0"))
+DETECTION_TOP_K = int(os.getenv("DETECTION_TOP_K", "0"))
+
+def format_detections(data: np.ndarray, table: LabelTable,
+                      min_confidence: float = None, top_k: int = None) -> Dict:
+    """
+    Build a detect() result from an (N, 6) array of x1, y1, x2, y2, conf, cls rows
+    in bulk: confidence / top-k filtering, the class id -> label lookup and the
+    class id -> canonical ingredient mapping are array operations, and each
+    column is converted to Python once.
+    """
+    min_confidence = DETECTION_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    top_k = DETECTION_TOP_K if top_k is None else top_k
+
+    conf = data[:, 4]
+    if min_confidence > 0:
+        keep = conf >= min_confidence
+        data = data[keep]
+        conf = conf[keep]
+    if top_k > 0 and len(data) > top_k:
+        order = np.argsort(-conf, kind="stable")[:top_k]
+        data = data[order]
+        conf = conf[order]
+
+    class_ids = data[:, 5].astype(np.intp)
+    label_list = table.labels[class_ids].tolist()
+    detected_items = [
+        {"label": label, "bbox": bbox, "confidence": score}
+        for label, bbox, score in zip(label_list, data[:, :4].tolist(), conf.tolist())
+    ]
+    return {
+        "detections": detected_items,
+        "ingredients": table.ingredients(class_ids)
+    }
+
+def columnar_detections(detections: List[Dict]) -> Dict:
+    """Compact response form: one list per field instead of one object per box."""
+    return {
+        "labels": [d["label"] for d in detections],
+        "boxes": [d["bbox"] for d in detections],
+        "confidences": [d["confidence"] for d in detections],
+    }
+
+# Inference backends. Exported models sit next to the .pt weights (see export.py).
+BACKEND_SUFFIXES = {
+    "pytorch": ".pt",
+    "onnx": ".onnx",
+    "openvino": "_openvino_model",
+    "openvino-int8": "_int8_openvino_model",
+}
+
+def backend_model_path(weights_path: str, backend: str) -> str:
+    """Where export.py puts the `backend` version of a .pt weights file."""
+    if backend not in BACKEND_SUFFIXES:
+        raise ValueError(f"Unknown YOLO backend '{backend}', expected one of {list(BACKEND_SUFFIXES)}")
+    stem, _ = os.path.splitext(weights_path)
+    return stem + BACKEND_SUFFIXES[backend]
+
+class DetectionCache:
+    """
+    detect() results keyed by the model fingerprint and the image: "exact"
+    keys on a hash of the image bytes, "perceptual" also matches
+    near-duplicates by dHash, "off" disables it. Used by YoloService and by
+    the worker pool's parent side, so both deployment modes cache alike.
+    """
+    def __init__(self, mode: str = None):
+        self.mode = (mode or os.getenv("DETECTION_CACHE_MODE", "exact")).lower()
+        self.phash_distance = int(os.getenv("DETECTION_CACHE_PHASH_DISTANCE", "4"))
+        self.entries = LRUCache(
+            max_entries=int(os.getenv("DETECTION_CACHE_SIZE", "256")),
+            max_bytes=int(os.getenv("DETECTION_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("DETECTION_CACHE_TTL", "600")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def key(self, image, fingerprint: str, decode_size: int) -> Tuple[tuple, object]:
+        """
+        Returns (cache key, source to run inference on). In perceptual mode
+        the image has to be decoded for hashing, so the prepared image is
+        passed on to avoid decoding twice.
+        """
+        if self.mode == "perceptual":
+            with STAGE_SECONDS.time("decode"):
+                prepared = prepare_image(image, decode_size)
+            key = (fingerprint, "p", prepared.original_size, dhash(prepared.array))
+            return key, prepared
+
+        h = hashlib.blake2b(digest_size=16)
+        if isinstance(image, np.ndarray):
+            h.update(str(image.shape).encode())
+            h.update(np.ascontiguousarray(image).data)
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            h.update(image)
+        else:
+            with open(image, "rb") as f:
+                h.update(f.read())
+        return (fingerprint, "x", h.hexdigest()), image
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        """A private copy of the cached result, or None."""
+        if key[1] != "p":
+            cached = self.entries.get(key)
+        else:
+            fingerprint, _, shape, phash = key
+            cached = self.entries.find(
+                lambda k: k[0] == fingerprint and k[1] == "p" and k[2] == shape
+                and _hamming(k[3], phash) <= self.phash_distance
+            )
+        return copy.deepcopy(cached) if cached is not None else None
+
+    def put(self, key: tuple, result: Dict):
+        self.entries.put(key, copy.deepcopy(result), _result_size(result))
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> Dict:
+        stats = self.entries.stats()
+        stats["mode"] = self.mode
+        return stats
+
+
 class YoloService:
-    def __init__(self):
-        # specific logic to find the trained model if it exists
-        # usually stored in runs/detect/train/weights/best.pt relative to where script is run
-        # We will look for it, otherwise fall back to 'yolov8n.pt'
-        possible_paths = [
-            "runs/weights/best.pt",
-            "../runs/weights/best.pt",
-            "runs/detect/train/weights/best.pt",
-            "../runs/detect/train/weights/best.pt",
-            "yolov8n.pt"  # Fallback
-        ]
-        self.model_path = "yolov8n.pt"
-        for path in possible_paths:
-            if os.path.exists(path):
-                self.model_path = path
-                print(f"Loading custom model from: {path}")
-                break
-        
-        if self.model_path == "yolov8n.pt":
-             print("Custom model not found. Using generic YOLOv8n (expect poor results for specific fridge items until training is done).")
+    def __init__(self, model_path: str = None, cache_mode: str = None, backend: str = None,
+                 tiling: str = None):
+        weights_path = model_path or find_model_path()
+        self.backend = (backend or os.getenv("YOLO_BACKEND", "pytorch")).lower()
+        self.model_path = weights_path
+        if weights_path.endswith(".pt") and self.backend != "pytorch":
+            exported = backend_model_path(weights_path, self.backend)
+            if os.path.exists(exported):
+                self.model_path = exported
+            else:
+                print(f"Warning: {self.backend} model not found at {exported} (run export.py). Using PyTorch weights.")
+                self.backend = "pytorch"
+        self.imgsz = int(os.getenv("YOLO_IMGSZ", "640"))
+
+        # Sliced inference for small items: the image is decoded at tile_input_size
+        # and cut into overlapping imgsz tiles. "always" runs the full image and its
+        # tiles in one batch; "auto" runs tiles only when the full-image pass suggests
+        # small objects were missed (see tiling.needs_tiling); "off" disables it.
+        self.tiling = (tiling or os.getenv("YOLO_TILING", "off")).lower()
+        self.tile_input_size = int(os.getenv("YOLO_TILE_INPUT_SIZE", "1152"))
+        self.tile_overlap = float(os.getenv("YOLO_TILE_OVERLAP", "0.2"))
+        self.tile_small_fraction = float(os.getenv("YOLO_TILE_SMALL_FRACTION", "0.1"))
+
+        self._load_lock = threading.Lock()
+        self._last_weights_check = time.monotonic()
+        self.startup_timings: Dict[str, float] = {}
+        self._load_model()
+        self.startup_timings["warmup_s"] = self.warmup()
+
+        self.cache = DetectionCache(cache_mode)
+        self.cache_mode = self.cache.mode
+
+    def _load_model(self):
+        # ultralytics (and torch) are imported here rather than at module import
+        # so the API process can start serving before the model is needed
+        start = time.perf_counter()
+        from ultralytics import YOLO
+        imported = time.perf_counter()
+
+        print(f"Loading YOLO model ({self.backend}) from: {self.model_path}")
+        self.model = YOLO(self.model_path, task="detect")
+        self.startup_timings["import_s"] = imported - start
+        self.startup_timings["load_s"] = time.perf_counter() - imported
+        self.model_fingerprint = _weights_fingerprint(self.model_path)
+        # Class id -> label / canonical ingredient tables, built once per model
+        self.labels = LabelTable(self.model.names)
+
+    def _check_weights(self):
+        """
+        Reload the model if its weights file changed on disk. Cache keys include
+        the weights fingerprint, so results from the old weights are never served.
+        """
+        now = time.monotonic()
+        if now - self._last_weights_check < 1.0:
+            return
+        self._last_weights_check = now
+        if _weights_fingerprint(self.model_path) == self.model_fingerprint:
+            return
+        with self._load_lock:
+            if _weights_fingerprint(self.model_path) != self.model_fingerprint:
+                print(f"Model weights changed on disk, reloading {self.model_path}")
+                self._load_model()
+                self.cache.clear()
 
-        self.model = YOLO(self.model_path)
+    def warmup(self) -> float:
+        """
+        Run one inference on a synthetic image so the first real request does
+        not pay for lazy initialization. Returns the time taken in seconds.
+        """
+        start = time.perf_counter()
+        self.model(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz, verbose=False)
+        elapsed = time.perf_counter() - start
+        print(f"YOLO warmup ({self.backend}) took {elapsed * 1000:.0f} ms")
+        return elapsed
 
-    def detect(self, image_path: str) -> Dict:
+    def detect(self, image) -> Dict:
         """
         Run inference on an image.
+        `image` may be a file path, raw encoded bytes (e.g. an upload body)
+        or an already decoded BGR array.
         Returns cleaned labels and detection details for visualization.
         """
-        results = self.model(image_path)
-        
-        detected_items = []
-        labels_raw = []
-
-        # Process results
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                # get label name
-                cls_id = int(box.cls[0])
-                label = self.model.names[cls_id]
-                
-                # get coords (xyxy) - normalized or pixels? pixels is default
-                xyxy = box.xyxy[0].tolist()
-                
-                detected_items.append({
-                    "label": label,
-                    "bbox": xyxy,
-                    "confidence": float(box.conf[0])
-                })
-                labels_raw.append(label)
-        
-        unique_ingredients = self._clean_labels(labels_raw)
-        
-        return {
-            "detections": detected_items,
-            "ingredients": unique_ingredients
-        }
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images: List) -> List[Dict]:
+        """
+        Run a single batched forward pass over several images.
+        Returns one detect()-style result per input, in the same order.
+        Images already in the detection cache are not sent to the model.
+        """
+        if not images:
+            return []
+        self._check_weights()
+        if self.cache_mode == "off":
+            return self._infer(images)
+
+        results = [None] * len(images)
+        keys = [None] * len(images)
+        pending = []
+        for i, image in enumerate(images):
+            key, source = self.cache.key(image, self.model_fingerprint, self.decode_size)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                keys[i] = key
+                pending.append((i, source))
+
+        if pending:
+            fresh = self._infer([source for _, source in pending])
+            for (i, _), result in zip(pending, fresh):
+                results[i] = result
+                self.cache.put(keys[i], result)
+        return results
 
-    def _clean_labels(self, labels: List[str]) -> List[str]:
-        """
-        Clean up labels for the API:
-        - Lowercase
-        - Remove underscores
-        - Remove dash suffixes (e.g., "Ash Gourd -Kubhindo-" -> "ash gourd")
-        - Remove duplicates
-        """
-        import re
-        cleaned = set()
-        for label in labels:
-            # normalization
-            l = label.lower().strip()
-            l = l.replace("_", " ")
-            # Remove content after hyphen if it looks like a local name suffix
-            # e.g. "ash gourd -kubhindo-"
-            l = re.sub(r'\s*-.*$', '', l)
-            cleaned.add(l)
-        return list(cleaned)
+    @property
+    def decode_size(self) -> int:
+        # Tiling needs the image at tile-grid resolution, not just the model input size
+        if self.tiling == "off":
+            return self.imgsz
+        return max(self.imgsz, self.tile_input_size)
+
+    def _infer(self, images: List) -> List[Dict]:
+        # Decoded in memory at about the size inference needs; boxes are mapped back to the original
+        with STAGE_SECONDS.time("decode"):
+            prepared = [prepare_image(im, self.decode_size) for im in images]
+        boxes = self.detect_arrays([p.array for p in prepared])
+        with STAGE_SECONDS.time("postprocess"):
+            return [format_detections(scale_boxes(data, p), self.labels) for data, p in zip(boxes, prepared)]
+
+    def detect_arrays(self, arrays: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Raw (x1, y1, x2, y2, conf, cls) boxes per decoded array, in that
+        array's coordinates, with tiling applied. The worker pool's processes
+        run this on images the parent decoded at decode_size.
+        """
+        if self.tiling == "always":
+            # Full images and all of their tiles in one forward pass
+            tiles, owners, offsets = self._make_tiles(arrays, range(len(arrays)))
+            outputs = self._forward(arrays + tiles)
+            boxes, tile_boxes = outputs[:len(arrays)], outputs[len(arrays):]
+        else:
+            boxes = self._forward(arrays)
+            tiles, owners, offsets, tile_boxes = [], [], [], []
+            if self.tiling == "auto":
+                todo = [i for i, (array, data) in enumerate(zip(arrays, boxes))
+                        if needs_tiling(data, array.shape[1], array.shape[0], self.tile_small_fraction)]
+                tiles, owners, offsets = self._make_tiles(arrays, todo)
+                tile_boxes = self._forward(tiles)
+
+        if tile_boxes:
+            with STAGE_SECONDS.time("postprocess"):
+                boxes = self._merge_tiles(boxes, tile_boxes, owners, offsets)
+        return boxes
+
+    def _forward(self, sources: List[np.ndarray]) -> List[np.ndarray]:
+        if not sources:
+            return []
+        with STAGE_SECONDS.time("inference"):
+            results = self.model(sources, batch=len(sources), imgsz=self.imgsz, verbose=False)
+            # One device->host copy of the whole (N, 6) box tensor instead of per-box tensor ops
+            return [r.boxes.data.cpu().numpy() for r in results]
+
+    def _make_tiles(self, arrays: List[np.ndarray], indices):
+        tiles, owners, offsets = [], [], []
+        for i in indices:
+            height, width = arrays[i].shape[:2]
+            if max(width, height) <= self.imgsz:
+                # Already seen at full resolution by the full-image pass
+                continue
+            for x1, y1, x2, y2 in tile_windows(width, height, self.imgsz, self.tile_overlap):
+                tiles.append(np.ascontiguousarray(arrays[i][y1:y2, x1:x2]))
+                owners.append(i)
+                offsets.append((x1, y1))
+        return tiles, owners, offsets
+
+    @staticmethod
+    def _merge_tiles(boxes: List[np.ndarray], tile_boxes: List[np.ndarray], owners: List[int],
+                     offsets: List[Tuple[int, int]]) -> List[np.ndarray]:
+        parts = [[data] for data in boxes]
+        for data, owner, (x, y) in zip(tile_boxes, owners, offsets):
+            if len(data):
+                parts[owner].append(data + np.array([x, y, x, y, 0, 0], dtype=data.dtype))
+        return [merge_detections(np.concatenate(p)) if len(p) > 1 else p[0] for p in parts]
+
+    def cache_stats(self) -> Dict:
+        return self.cache.stats()
+
+# 402 quota, 429 rate limit and 5xx mean the upstream is (for now) unusable;
+# 401/403 are configuration problems and do not open the circuit
+def _is_outage(status_code: int) -> bool:
+    return status_code in (402, 429) or status_code >= 500
+
+# Answers worth sending again (a 402 will not go away by retrying)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 class SpoonacularService:
-    def __init__(self):
-        self.base_url = "https://api.spoonacular.com"
+    """
+    Async Spoonacular client. Calls share one keep-alive connection pool and
+    pass a token bucket (the plan's rate limit) and a circuit breaker that
+    fails fast after consecutive 402/5xx/timeouts. A lookup gets a total time
+    budget that bounds every call's timeout; slow calls are hedged with a
+    second copy and failed ones retried while the budget lasts. When the API
+    is unavailable, expired cache entries are served before the fallback.
+    """
+    def __init__(self, max_connections: int = 20, timeout: float = 10.0, cache: RecipeCache = None,
+                 fallback=None):
+        # Overridable so load tests can point the app at a local stand-in (benchmarks/mock_spoonacular.py)
+        self.base_url = os.getenv("SPOONACULAR_BASE_URL", "https://api.spoonacular.com").rstrip("/")
         self.api_key = SPOONACULAR_API_KEY
+        self.timeout = timeout
+        # One pooled client for the whole app so connections are kept alive
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30.0,
+            ),
+        )
+        # Ingredient-set -> recipe ids, and recipe id -> details, persisted to SQLite
+        self.cache = cache or RecipeCache(
+            db_path=os.getenv("RECIPE_CACHE_PATH", "recipe_cache.sqlite3") or None,
+            search_ttl=float(os.getenv("RECIPE_SEARCH_TTL", str(6 * 3600))),
+            detail_ttl=float(os.getenv("RECIPE_DETAIL_TTL", str(7 * 24 * 3600))),
+            stale_ttl=float(os.getenv("RECIPE_STALE_TTL", str(7 * 24 * 3600))),
+        )
+        # Identical lookups already on their way upstream
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # Optional local backend (e.g. LocalRecipeService) used when the API refuses or fails
+        self.fallback = fallback
+
+        # Total time for one lookup (search + details); each call's timeout is cut to what is left
+        self.budget = float(os.getenv("SPOONACULAR_BUDGET_S", "8"))
+        # A call still unanswered after this long gets a second copy (0 = no hedging)
+        self.hedge_delay = float(os.getenv("SPOONACULAR_HEDGE_MS", "1000")) / 1000
+        self.max_retries = int(os.getenv("SPOONACULAR_RETRIES", "1"))
+        self.rate_limit = TokenBucket(float(os.getenv("SPOONACULAR_RATE_LIMIT", "1")),
+                                      int(os.getenv("SPOONACULAR_RATE_BURST", "5")))
+        self.breaker = CircuitBreaker(int(os.getenv("SPOONACULAR_BREAKER_FAILURES", "5")),
+                                      float(os.getenv("SPOONACULAR_BREAKER_RESET_S", "60")))
+        self.served_stale = 0
+
+    async def aclose(self):
+        await self.client.aclose()
+        self.cache.close()
+
+    def upstream_stats(self) -> Dict:
+        return {
+            "circuit": self.breaker.stats(),
+            "rate_limit": self.rate_limit.stats(),
+            "budget_s": self.budget,
+            "hedge_ms": self.hedge_delay * 1000,
+            "max_retries": self.max_retries,
+            "served_stale": self.served_stale,
+        }
+
+    async def find_recipes_by_ingredients(self, ingredients: List[str], number: int = 5) -> List[Dict]:
+        if not ingredients:
+            return []
+
+        # Coalesce concurrent lookups for the same ingredient set into one upstream call.
+        # shield() keeps one caller's cancellation from cancelling it for the others.
+        key = RecipeCache.ingredient_key(ingredients, number)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._find_recipes(ingredients, number, key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        recipes = await asyncio.shield(task)
+        # Each caller gets its own copy to modify
+        return copy.deepcopy(recipes)
+
+    async def _find_recipes(self, ingredients: List[str], number: int, key: str) -> List[Dict]:
+        deadline = time.monotonic() + self.budget
+        try:
+            initial_recipes = await self._cached_search(ingredients, number, key, deadline)
+            if initial_recipes is None:
+                return await self._use_fallback(ingredients, number)
+
+            if not initial_recipes:
+                return []
+
+            return await self._attach_details(initial_recipes, deadline)
+
+        except Exception as e:
+            log_event("find_recipes_failed", logging.ERROR, error=repr(e))
+            return []
 
-    def find_recipes_by_ingredients(self, ingredients: List[str], number: int = 5) -> List[Dict]:
+    async def stream_recipes(self, ingredients: List[str], number: int = 5) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Progressive version of find_recipes_by_ingredients. Yields:
+        - ("recipes", {"recipes": [...]}) as soon as findByIngredients answers
+          (basic recipe data, no details yet)
+        - ("details", {"id": ..., <DETAIL_FIELDS>}) per recipe, cached ones
+          first, the rest when informationBulk completes
+        """
         if not ingredients:
+            yield "recipes", {"recipes": []}
+            return
+
+        deadline = time.monotonic() + self.budget
+        key = RecipeCache.ingredient_key(ingredients, number)
+        initial_recipes = await self._cached_search(ingredients, number, key, deadline)
+        if initial_recipes is None:
+            # Fallback results already carry their details
+            yield "recipes", {"recipes": await self._use_fallback(ingredients, number)}
+            return
+
+        yield "recipes", {"recipes": initial_recipes}
+        if not initial_recipes:
+            return
+
+        recipe_ids = [r['id'] for r in initial_recipes]
+        details_map = await asyncio.to_thread(self.cache.get_details, recipe_ids)
+        for recipe_id in recipe_ids:
+            if recipe_id in details_map:
+                yield "details", self._detail_event(recipe_id, details_map[recipe_id])
+
+        missing_ids = [i for i in recipe_ids if i not in details_map]
+        if not missing_ids:
+            return
+        # Summaries are already out; recipes without details keep basic data only
+        fetched = await self._missing_details(missing_ids, deadline)
+        for recipe_id in missing_ids:
+            if recipe_id in fetched:
+                yield "details", self._detail_event(recipe_id, fetched[recipe_id])
+
+    @staticmethod
+    def _detail_event(recipe_id: int, detail: Dict) -> Dict:
+        event = {"id": recipe_id}
+        for field in RecipeCache.DETAIL_FIELDS:
+            event[field] = detail.get(field)
+        return event
+
+    async def _cached_search(self, ingredients: List[str], number: int, key: str, deadline: float):
+        """
+        findByIngredients through the search cache. Returns a private copy of the
+        recipe list; if the API refuses or fails, an expired cached copy (within
+        RECIPE_STALE_TTL), or None when there is none.
+        """
+        initial_recipes = await asyncio.to_thread(self.cache.get_search, key)
+        if initial_recipes is None:
+            try:
+                initial_recipes = await self._search_recipes(ingredients, number, deadline)
+            except (httpx.HTTPError, UpstreamUnavailable) as e:
+                log_event("spoonacular_unavailable", logging.WARNING, endpoint="findByIngredients", error=repr(e))
+                initial_recipes = None
+            if initial_recipes is not None:
+                await asyncio.to_thread(self.cache.put_search, key, initial_recipes)
+            else:
+                initial_recipes = await asyncio.to_thread(self.cache.get_search, key, True)
+                if initial_recipes is None:
+                    return None
+                self.served_stale += 1
+        # Don't let the details merge write into cached entries
+        return copy.deepcopy(initial_recipes)
+
+    async def _use_fallback(self, ingredients: List[str], number: int) -> List[Dict]:
+        if self.fallback is None:
             return []
-            
+        log_event("recipe_fallback", logging.WARNING, backend="local")
+        return await self.fallback.find_recipes_by_ingredients(ingredients, number)
+
+    async def _search_recipes(self, ingredients: List[str], number: int, deadline: float):
+        """
+        findByIngredients call. Returns the recipe list, or None when the API
+        refused the request (those responses must not be cached).
+        """
         endpoint = f"{self.base_url}/recipes/findByIngredients"
         ingredients_str = ",".join(ingredients)
         
@@ -109,79 +573,164 @@ class SpoonacularService:
             "ignorePantry": True,
             "ranking": 1  # maximize used ingredients
         }
+        # Keep part of the budget for the informationBulk call that follows
+        search_deadline = time.monotonic() + max(0.0, deadline - time.monotonic()) * 0.6
+        response = await self._get("findByIngredients", "find_by_ingredients", endpoint, params, search_deadline)
+
+        # 401 invalid/expired key, 402 quota exceeded, 403 access denied
+        if response.status_code in (401, 402, 403):
+            log_event("spoonacular_refused", logging.WARNING, endpoint="findByIngredients",
+                      status=response.status_code)
+            return None
+
+        response.raise_for_status()
+        return response.json()
+
+    async def _attach_details(self, initial_recipes: List[Dict], deadline: float) -> List[Dict]:
+        """Merge informationBulk details, only requesting ids that are not cached yet."""
+        recipe_ids = [r['id'] for r in initial_recipes]
+        details_map = await asyncio.to_thread(self.cache.get_details, recipe_ids)
+        missing_ids = [i for i in recipe_ids if i not in details_map]
+
+        if missing_ids:
+            details_map.update(await self._missing_details(missing_ids, deadline))
         
+        final_recipes = []
+        for r in initial_recipes:
+            d = details_map.get(r['id'])
+            if d:
+                # Merge info. details has sourceUrl, instructions, etc.
+                # We keep the used/missed counts from the first call as bulk might not have them relative to my query
+                for field in RecipeCache.DETAIL_FIELDS:
+                    r[field] = d.get(field)
+            # If no details, still include the recipe with basic info
+            final_recipes.append(r)
+        return final_recipes
+
+    async def _missing_details(self, recipe_ids: List[int], deadline: float) -> Dict[int, Dict]:
+        """Details for uncached ids; expired cached details for those the API cannot provide right now."""
         try:
-            print(f"Fetching recipes for ingredients: {ingredients_str}")
-            response = requests.get(endpoint, params=params, timeout=10)
-            print(f"API Response Status: {response.status_code}")
-            
-            if response.status_code == 401:
-                print("Error: Invalid API key or expired")
-                return []
-            elif response.status_code == 402:
-                print("Error: API quota exceeded (payment required)")
-                return []
-            elif response.status_code == 403:
-                print("Error: Access denied by API")
-                return []
-            
-            response.raise_for_status()
-            initial_recipes = response.json()
-            
-            print(f"Found {len(initial_recipes)} initial recipes")
-            
-            if not initial_recipes:
-                print("No recipes found for the detected ingredients")
-                return []
-                
-            # Fetch details for URLs
-            recipe_ids = [str(r['id']) for r in initial_recipes]
-            ids_str = ",".join(recipe_ids)
-            
-            bulk_endpoint = f"{self.base_url}/recipes/informationBulk"
-            bulk_params = {
-                "apiKey": self.api_key,
-                "ids": ids_str
-            }
-            
-            print(f"Fetching detailed information for {len(recipe_ids)} recipes")
-            bulk_response = requests.get(bulk_endpoint, params=bulk_params, timeout=10)
-            print(f"Bulk API Response Status: {bulk_response.status_code}")
-            
-            if bulk_response.status_code == 402:
-                print("Warning: API quota exceeded on bulk request, returning basic recipe data")
-                # Return initial recipes without detailed info
-                return initial_recipes[:number]
-            
-            bulk_response.raise_for_status()
-            details = bulk_response.json()
-            
-            # Map details by ID for easy lookup (though bulk usually returns in order, good to be safe)
-            details_map = {d['id']: d for d in details}
-            
-            final_recipes = []
-            for r in initial_recipes:
-                d = details_map.get(r['id'])
-                if d:
-                    # Merge info. details has sourceUrl, instructions, etc.
-                    # We keep the used/missed counts from the first call as bulk might not have them relative to my query
-                    r['sourceUrl'] = d.get('sourceUrl')
-                    r['readyInMinutes'] = d.get('readyInMinutes')
-                    r['summary'] = d.get('summary')
-                    final_recipes.append(r)
-                else:
-                    # If no details, still include the recipe with basic info
-                    final_recipes.append(r)
-            
-            print(f"Successfully returned {len(final_recipes)} recipes")
-            return final_recipes
-
-        except requests.Timeout:
-            print("Error: API request timed out")
-            return []
-        except requests.RequestException as e:
-            print(f"Error calling Spoonacular API: {e}")
-            return []
-        except Exception as e:
-            print(f"Unexpected error in find_recipes_by_ingredients: {e}")
-            return []
\ No newline at end of file
+            fetched = await self._fetch_details(recipe_ids, deadline)
+        except (httpx.HTTPError, UpstreamUnavailable) as e:
+            log_event("spoonacular_unavailable", logging.WARNING, endpoint="informationBulk", error=repr(e))
+            fetched = None
+        if fetched is not None:
+            return fetched
+        stale = await asyncio.to_thread(self.cache.get_details, recipe_ids, True)
+        if stale:
+            self.served_stale += 1
+        return stale
+
+    async def _fetch_details(self, recipe_ids: List[int], deadline: float):
+        """
+        informationBulk call for `recipe_ids`; caches and returns details by id,
+        or None when the API refused the request.
+        """
+        bulk_endpoint = f"{self.base_url}/recipes/informationBulk"
+        bulk_params = {
+            "apiKey": self.api_key,
+            "ids": ",".join(str(i) for i in recipe_ids)
+        }
+        bulk_response = await self._get("informationBulk", "information_bulk", bulk_endpoint, bulk_params, deadline)
+
+        if bulk_response.status_code in (401, 402, 403):
+            log_event("spoonacular_refused", logging.WARNING, endpoint="informationBulk",
+                      status=bulk_response.status_code)
+            return None
+        bulk_response.raise_for_status()
+        details = bulk_response.json()
+        await asyncio.to_thread(self.cache.put_details, details)
+        # Map details by ID for easy lookup (though bulk usually returns in order, good to be safe)
+        return {d['id']: d for d in details}
+
+    async def _get(self, endpoint: str, stage: str, url: str, params: Dict, deadline: float) -> httpx.Response:
+        """
+        One logical upstream call, timed as `stage`. Refused while the circuit
+        is open; outages and successes are reported to the breaker. Counts the
+        final status (or timeout/error/circuit_open/rate_limited) per endpoint.
+        """
+        if not self.breaker.allow():
+            UPSTREAM_RESPONSES.inc(endpoint, "circuit_open")
+            raise UpstreamUnavailable(f"Spoonacular circuit open ({endpoint})")
+        status = "error"
+        try:
+            with STAGE_SECONDS.time(stage):
+                response = await self._hedged_get(endpoint, url, params, deadline)
+            status = str(response.status_code)
+        except UpstreamUnavailable:
+            status = "rate_limited"
+            raise
+        except httpx.TimeoutException:
+            status = "timeout"
+            self.breaker.record_failure()
+            raise
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            raise
+        finally:
+            UPSTREAM_RESPONSES.inc(endpoint, status)
+
+        if _is_outage(response.status_code):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _hedged_get(self, endpoint: str, url: str, params: Dict, deadline: float) -> httpx.Response:
+        """
+        Send the request; if it is still unanswered after hedge_delay, send one
+        more copy and keep whichever answers first. 429/5xx answers and
+        connection errors are retried with a jittered backoff (up to
+        max_retries) while the deadline allows; timeouts are not, as the
+        budget is spent by then. Returns the last response or raises the last error.
+        """
+        if not await self.rate_limit.acquire(deadline - time.monotonic()):
+            raise UpstreamUnavailable(f"Spoonacular rate limit ({endpoint})")
+        UPSTREAM_ATTEMPTS.inc(endpoint, "first")
+        pending = {asyncio.ensure_future(self._send(url, params, deadline))}
+        hedged = self.hedge_delay <= 0
+        retries = self.max_retries
+        outcome = None
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, timeout=None if hedged else self.hedge_delay,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    # Hedges only use spare tokens, never wait for one
+                    if self.rate_limit.try_acquire():
+                        UPSTREAM_ATTEMPTS.inc(endpoint, "hedge")
+                        pending.add(asyncio.ensure_future(self._send(url, params, deadline)))
+                    continue
+                for task in done:
+                    outcome = task.exception() or task.result()
+                    if isinstance(outcome, httpx.Response) and outcome.status_code not in RETRY_STATUSES:
+                        return outcome
+                if pending:
+                    continue
+
+                retryable = (isinstance(outcome, (httpx.Response, httpx.TransportError))
+                             and not isinstance(outcome, httpx.TimeoutException))
+                backoff = random.uniform(0.05, 0.2) * (self.max_retries - retries + 1)
+                if not retryable or retries <= 0 or time.monotonic() + backoff >= deadline:
+                    break
+                retries -= 1
+                await asyncio.sleep(backoff)
+                if not await self.rate_limit.acquire(deadline - time.monotonic()):
+                    break
+                UPSTREAM_ATTEMPTS.inc(endpoint, "retry")
+                pending = {asyncio.ensure_future(self._send(url, params, deadline))}
+                hedged = self.hedge_delay <= 0
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def _send(self, url: str, params: Dict, deadline: float) -> httpx.Response:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise httpx.TimeoutException("Spoonacular request budget exhausted")
+        return await self.client.get(url, params=params, timeout=min(self.timeout, remaining))
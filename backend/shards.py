@@ -0,0 +1,365 @@
+"""
+Packed, memory-mapped dataset shards for training and evaluation.
+
+`pack_dataset` turns each split of a merge_datasets output into
+
+    merged_data/shards/<split>_<imgsz>.bin       decoded BGR images, resized so the
+                                                 long side is imgsz, back to back
+    merged_data/shards/<split>_<imgsz>.idx.npz   per-image byte offset, resized and
+                                                 original shape, file path, and the
+                                                 remapped labels (class, x, y, w, h)
+
+so an epoch reads pixels straight out of the page cache instead of opening,
+decoding and resizing thousands of JPEGs.
+
+`ShardDetectionTrainer` / `ShardDetectionValidator` are drop-in ultralytics
+trainer / validator classes that use a shard for any split that has one at
+the run's imgsz and fall back to the regular JPEG dataset otherwise:
+
+    model.train(data="merged_data/data.yaml", imgsz=640, trainer=ShardDetectionTrainer)
+    model.val(data="merged_data/data.yaml", split="test", validator=ShardDetectionValidator)
+"""
+import hashlib
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import yaml
+
+IMG_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+SPLIT_KEYS = {"train": "train", "val": "valid", "valid": "valid", "test": "test"}
+
+
+def shard_paths(root, split_dir: str, imgsz: int):
+    base = Path(root) / "shards" / f"{split_dir}_{imgsz}"
+    return base.with_suffix(".bin"), base.with_suffix(".idx.npz")
+
+
+def read_labels(path: Path) -> np.ndarray:
+    """YOLO label file -> (n, 5) class, x, y, w, h; polygon rows are reduced to their box."""
+    rows = []
+    if path.exists():
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 5:
+                    rows.append([float(p) for p in parts])
+                elif len(parts) > 5:
+                    xs = np.array(parts[1::2], dtype=np.float32)
+                    ys = np.array(parts[2::2], dtype=np.float32)
+                    rows.append([float(parts[0]), (xs.min() + xs.max()) / 2, (ys.min() + ys.max()) / 2,
+                                 xs.max() - xs.min(), ys.max() - ys.min()])
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def _load_resized(path: str, imgsz: int):
+    """Decode and resize like ultralytics BaseDataset.load_image (long side to imgsz)."""
+    import cv2
+
+    # imdecode instead of imread so non-ASCII paths work on Windows too
+    im = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+    if im is None:
+        return None
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(im), (h0, w0)
+
+
+def _fingerprint(root: Path, files: List[Path], imgsz: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(imgsz).encode())
+    for f in files:
+        st = f.stat() if f.exists() else None
+        h.update(f"{f.relative_to(root).as_posix()}|{st.st_size if st else -1}|"
+                 f"{st.st_mtime_ns if st else -1}\n".encode())
+    return h.hexdigest()
+
+
+def split_images(root: Path, source: str) -> Optional[List[Path]]:
+    """Images of a data.yaml split entry: a directory, or a .txt list of ./relative paths."""
+    path = root / source
+    if path.suffix == ".txt":
+        if not path.exists():
+            return None
+        with open(path, "r") as f:
+            return [root / line.strip()[2:] if line.startswith("./") else root / line.strip()
+                    for line in f if line.strip()]
+    if not path.is_dir():
+        return None
+    return sorted(p for p in path.iterdir() if p.suffix.lower() in IMG_SUFFIXES)
+
+
+def pack_split(root, source: str, imgsz: int, workers: Optional[int] = None, chunk: int = 64) -> Optional[Path]:
+    """
+    Pack one split (`source` as written in data.yaml, e.g. "valid/images" or
+    "train.txt") into a shard; skipped if its files are unchanged.
+    """
+    root = Path(root)
+    images = split_images(root, source)
+    if images is None:
+        return None
+    # YOLO layout: <split>/images/x.jpg -> <split>/labels/x.txt
+    labels = [p.parent.parent / "labels" / (p.stem + ".txt") for p in images]
+    split_dir = _split_name(source)
+    bin_path, idx_path = shard_paths(root, split_dir, imgsz)
+    fingerprint = _fingerprint(root, images + labels, imgsz)
+
+    if bin_path.exists() and idx_path.exists():
+        with np.load(idx_path) as index:
+            if str(index["fingerprint"]) == fingerprint:
+                print(f"Shard {bin_path} is up to date")
+                return bin_path
+
+    print(f"Packing {len(images)} {split_dir} images at imgsz={imgsz} into {bin_path}...")
+    bin_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = bin_path.with_suffix(".bin.tmp")
+    offsets, shapes, orig_shapes, files, label_arrays = [], [], [], [], []
+    offset = 0
+    with open(tmp_path, "wb") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Bounded chunks keep only a few decoded images in memory at a time
+        for start in range(0, len(images), chunk):
+            batch = images[start:start + chunk]
+            decoded = executor.map(lambda p: _load_resized(str(p), imgsz), batch)
+            for image_path, label_path, result in zip(batch, labels[start:start + chunk], decoded):
+                if result is None:
+                    print(f"  Skipping unreadable image {image_path}")
+                    continue
+                im, orig = result
+                out.write(im.tobytes())
+                offsets.append(offset)
+                offset += im.nbytes
+                shapes.append(im.shape[:2])
+                orig_shapes.append(orig)
+                files.append(image_path.relative_to(root).as_posix())
+                label_arrays.append(read_labels(label_path))
+
+    label_offsets = np.zeros(len(label_arrays) + 1, dtype=np.int64)
+    label_offsets[1:] = np.cumsum([len(a) for a in label_arrays])
+    os.replace(tmp_path, bin_path)
+    np.savez(
+        idx_path,
+        offsets=np.array(offsets, dtype=np.int64),
+        shapes=np.array(shapes, dtype=np.int32).reshape(-1, 2),
+        orig_shapes=np.array(orig_shapes, dtype=np.int32).reshape(-1, 2),
+        files=np.array(files),
+        label_offsets=label_offsets,
+        labels=np.concatenate(label_arrays) if label_arrays else np.zeros((0, 5), dtype=np.float32),
+        imgsz=np.int32(imgsz),
+        fingerprint=np.array(fingerprint),
+    )
+    print(f"  {len(offsets)} images, {offset / 1e9:.2f} GB")
+    return bin_path
+
+
+def resolve_split(data: dict, yaml_dir, source: str) -> Optional[Path]:
+    """
+    A data.yaml split entry as ultralytics' check_det_dataset resolves it:
+    relative to the yaml's `path` (or its own directory when that does not
+    exist here, e.g. the committed Windows path), retried without a leading
+    "../" as Roboflow exports write them. None if it does not exist.
+    """
+    root = Path(data.get("path") or yaml_dir)
+    if not root.is_dir():
+        root = Path(yaml_dir)
+    path = (root / source).resolve()
+    if not path.exists() and source.startswith("../"):
+        path = (root / source[3:]).resolve()
+    return path if path.exists() else None
+
+
+def pack_dataset(data_yaml: str, imgsz: int = 640, splits=("train", "val", "test"), workers: Optional[int] = None):
+    """Pack every split of a merge_datasets output (its data.yaml) at `imgsz`."""
+    yaml_dir = Path(data_yaml).resolve().parent
+    with open(data_yaml, "r") as f:
+        data = yaml.safe_load(f)
+    packed = {}
+    for split in splits:
+        source = resolve_split(data, yaml_dir, data.get(split) or f"{SPLIT_KEYS[split]}/images")
+        if source is None:
+            continue
+        # Shards go next to the split, where find_shard() looks for them
+        root = source.parent if source.suffix == ".txt" else source.parent.parent
+        path = pack_split(root, source.relative_to(root).as_posix(), imgsz, workers=workers)
+        if path is not None:
+            packed[split] = str(path)
+    if not packed:
+        raise FileNotFoundError(f"None of the splits {list(splits)} of {data_yaml} were found")
+    return packed
+
+
+class PackedShard:
+    """Read-only view of a packed split; images are slices of one np.memmap."""
+    def __init__(self, bin_path):
+        bin_path = Path(bin_path)
+        self.bin_path = bin_path
+        self.root = bin_path.parent.parent
+        with np.load(bin_path.with_suffix(".idx.npz")) as index:
+            self.offsets = index["offsets"]
+            self.shapes = index["shapes"]
+            self.orig_shapes = index["orig_shapes"]
+            self.files = index["files"].tolist()
+            self.label_offsets = index["label_offsets"]
+            self.all_labels = index["labels"]
+            self.imgsz = int(index["imgsz"])
+        self.data = np.memmap(bin_path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def image(self, i: int) -> np.ndarray:
+        """(h, w, 3) BGR view into the shard; copy before modifying."""
+        h, w = self.shapes[i]
+        start = self.offsets[i]
+        return self.data[start:start + h * w * 3].reshape(h, w, 3)
+
+    def labels(self, i: int) -> np.ndarray:
+        return self.all_labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+
+def _split_name(source) -> str:
+    """Shard name of a split: "valid/images" -> "valid", "train.txt" -> "train"."""
+    source = Path(source)
+    return source.stem if source.suffix == ".txt" else source.parent.name
+
+
+def find_shard(img_path, imgsz: int) -> Optional[PackedShard]:
+    """
+    The shard for an ultralytics split path like merged_data/train/images or
+    merged_data/train.txt, if one was packed.
+    """
+    if isinstance(img_path, (list, tuple)):
+        return None
+    source = Path(img_path)
+    root = source.parent if source.suffix == ".txt" else source.parent.parent
+    bin_path, idx_path = shard_paths(root, _split_name(source), imgsz)
+    if not (bin_path.exists() and idx_path.exists()):
+        return None
+    return PackedShard(bin_path)
+
+
+def _shard_dataset_class():
+    # ultralytics is only needed by the training side of this module
+    from ultralytics.data.dataset import YOLODataset
+
+    class ShardYOLODataset(YOLODataset):
+        """YOLODataset whose images and labels come from a PackedShard instead of JPEG / txt files."""
+        def __init__(self, *args, shard: PackedShard, **kwargs):
+            self.shard = shard
+            super().__init__(*args, **kwargs)
+
+        def get_img_files(self, img_path):
+            files = [str(self.shard.root / rel) for rel in self.shard.files]
+            count = self.fraction if isinstance(self.fraction, int) else max(1, round(len(files) * self.fraction))
+            return files[:count]
+
+        def get_labels(self):
+            labels = []
+            for i, im_file in enumerate(self.im_files):
+                lb = self.shard.labels(i)
+                labels.append({
+                    "im_file": im_file,
+                    "shape": tuple(int(v) for v in self.shard.orig_shapes[i]),
+                    "cls": lb[:, 0:1].copy(),
+                    "bboxes": lb[:, 1:].copy(),
+                    "segments": [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                })
+            return labels
+
+        def load_image(self, i, rect_mode=True, resize_short=False):
+            if not rect_mode or resize_short or self.shard.imgsz != self.imgsz:
+                return super().load_image(i, rect_mode=rect_mode, resize_short=resize_short)
+            if self.ims[i] is not None:
+                return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+            # Augmentations modify images in place, so hand out a copy of the mapped pixels
+            im = np.array(self.shard.image(i))
+            h0, w0 = (int(v) for v in self.shard.orig_shapes[i])
+            # Same mosaic buffer bookkeeping as BaseDataset.load_image
+            if self.augment:
+                self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    j = self.buffer.pop(0)
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+            return im, (h0, w0), im.shape[:2]
+
+    return ShardYOLODataset
+
+
+def build_shard_dataset(cfg, img_path, batch, data, shard: PackedShard, mode="train", rect=False, stride=32):
+    """build_yolo_dataset for a packed split."""
+    from ultralytics.data.utils import get_split_fraction
+    from ultralytics.utils import colorstr
+
+    split = "train" if mode == "train" else cfg.split or "val"
+    fraction = 1.0 if data.get("complete") else get_split_fraction(cfg.fraction, split)
+
+    return _shard_dataset_class()(
+        shard=shard,
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=None,
+        single_cls=cfg.single_cls or False,
+        stride=stride,
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode} (shard): "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+        fraction=fraction,
+    )
+
+
+def _trainer_classes():
+    from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+    from ultralytics.utils.torch_utils import unwrap_model
+
+    class ShardDetectionValidator(DetectionValidator):
+        def build_dataset(self, img_path, mode="val", batch=None):
+            shard = find_shard(img_path, self.args.imgsz)
+            if shard is None:
+                return super().build_dataset(img_path, mode=mode, batch=batch)
+            return build_shard_dataset(self.args, img_path, batch, self.data, shard, mode=mode, stride=self.stride)
+
+    class ShardDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            shard = find_shard(img_path, self.args.imgsz)
+            if shard is None:
+                return super().build_dataset(img_path, mode=mode, batch=batch)
+            gs = max(int(unwrap_model(self.model).stride.max()), 32)
+            return build_shard_dataset(self.args, img_path, batch, self.data, shard, mode=mode,
+                                       rect=mode == "val", stride=gs)
+
+        def get_validator(self):
+            validator = super().get_validator()
+            return ShardDetectionValidator(
+                self.test_loader, save_dir=self.save_dir, args=copy(self.args), _callbacks=self.callbacks
+            ) if validator is not None else None
+
+    return ShardDetectionTrainer, ShardDetectionValidator
+
+
+def __getattr__(name):
+    # Built lazily so importing this module (e.g. for pack_dataset) does not import ultralytics
+    if name in ("ShardDetectionTrainer", "ShardDetectionValidator"):
+        trainer, validator = _trainer_classes()
+        globals().update(ShardDetectionTrainer=trainer, ShardDetectionValidator=validator)
+        return globals()[name]
+    if name == "ShardYOLODataset":
+        globals()["ShardYOLODataset"] = _shard_dataset_class()
+        return globals()[name]
+    raise AttributeError(name)
@@ -0,0 +1,128 @@
+import re
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+# Local-name suffixes wrapped in hyphens at the end, e.g. "Ash Gourd -Kubhindo-" or "Chayote-iskus-";
+# hyphenated names such as "all-purpose flour" (recipe ingredients) are left alone
+_SUFFIX_RE = re.compile(r"\s*-[^-]+-\s*$")
+
+# Words that look plural but are not (or read better unchanged)
+_KEEP_AS_IS = {"asparagus", "hummus", "couscous", "molasses", "cornflakes", "swiss", "citrus"}
+_IRREGULAR = {"leaves": "leaf", "knives": "knife", "loaves": "loaf", "halves": "half"}
+
+# Different names for the same ingredient -> the name Spoonacular knows best
+SYNONYMS = {
+    "aubergine": "eggplant",
+    "brinjal": "eggplant",
+    "green brinjal": "eggplant",
+    "courgette": "zucchini",
+    "capsicum": "bell pepper",
+    "yoghurt": "yogurt",
+    "sweetcorn": "corn",
+    "spring onion": "green onion",
+    "onion leaf": "green onion",
+    "coriander": "cilantro",
+    "green mint": "mint",
+    "palak": "spinach",
+    "palungo": "spinach",
+    "akabare khursani": "chili pepper",
+    "green chily": "green chili",
+    "chili": "chili pepper",
+    "minced meat": "ground meat",
+    "buff meat": "buffalo meat",
+    "wallnut": "walnut",
+    "water melon": "watermelon",
+    "jack fruit": "jackfruit",
+    "tree tomato": "tamarillo",
+    "soyabean": "soybean",
+    "green soyabean": "edamame",
+    "nutrela": "soy chunks",
+    "sajjyun": "moringa drumstick",
+    "garden pea": "pea",
+    "green pea": "pea",
+    "chowmein noodle": "noodle",
+    "thukpa noodle": "noodle",
+    "mineral water": "water",
+}
+
+
+def _singular(word: str) -> str:
+    if word in _KEEP_AS_IS or len(word) <= 3:
+        return word
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonical_name(label: str) -> str:
+    """
+    Canonical ingredient name for a detector class label or a recipe
+    ingredient: lowercase, underscores to spaces, local-name suffix stripped,
+    last word singularized, synonyms merged.
+
+    >>> [canonical_name(n) for n in ("Tomatoes", "Ash Gourd -Kubhindo-", "green_beans", "Aubergine")]
+    ['tomato', 'ash gourd', 'green bean', 'eggplant']
+    >>> [canonical_name(n) for n in ("all-purpose flour", "extra-virgin olive oil", "half-and-half", "loaves")]
+    ['all-purpose flour', 'extra-virgin olive oil', 'half-and-half', 'loaf']
+    """
+    name = label.lower().replace("_", " ").strip()
+    name = _SUFFIX_RE.sub("", name)
+    words = name.split()
+    if not words:
+        return ""
+    words[-1] = _singular(words[-1])
+    name = " ".join(words)
+    return SYNONYMS.get(name, name)
+
+
+class LabelTable:
+    """
+    Lookup tables built once per model from model.names:
+    - labels:          class id -> raw class label
+    - canonical_ids:   class id -> canonical ingredient id
+    - canonical_names: canonical ingredient id -> name
+    - canonical(label): raw class label -> canonical name
+
+    Turning detected class ids into the ingredient list is then an array
+    index plus a unique, with no string processing per request.
+    """
+    def __init__(self, names: Union[Dict[int, str], Sequence[str]]):
+        if isinstance(names, dict):
+            names = [names[i] for i in range(len(names))]
+        self.labels = np.array(list(names), dtype=object)
+
+        self.canonical_names: List[str] = []
+        index: Dict[str, int] = {}
+        ids = []
+        for label in names:
+            canon = canonical_name(label)
+            if canon not in index:
+                index[canon] = len(self.canonical_names)
+                self.canonical_names.append(canon)
+            ids.append(index[canon])
+        self.canonical_ids = np.array(ids, dtype=np.intp)
+        self._canonical_array = np.array(self.canonical_names, dtype=object)
+        self._by_label = {label: self.canonical_names[i] for label, i in zip(names, ids)}
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def canonical(self, label: str) -> str:
+        """Canonical ingredient name of a class label from detect() output."""
+        name = self._by_label.get(label)
+        return name if name is not None else canonical_name(label)
+
+    def ingredients(self, class_ids: np.ndarray) -> List[str]:
+        """Unique canonical ingredient names for an array of class ids."""
+        if len(class_ids) == 0:
+            return []
+        return self._canonical_array[np.unique(self.canonical_ids[class_ids])].tolist()
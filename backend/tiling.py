@@ -0,0 +1,68 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+def tile_windows(width: int, height: int, tile: int, overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """
+    Overlapping tile x tile windows (x1, y1, x2, y2) covering a width x height
+    image: the fewest tiles per axis that overlap by at least `overlap`, spread
+    evenly from border to border, so every tile has the full size unless the
+    image is smaller than a tile.
+    """
+    step = max(1, int(tile * (1 - overlap)))
+
+    def starts(length: int) -> List[int]:
+        if length <= tile:
+            return [0]
+        count = -(-(length - tile) // step) + 1
+        return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def needs_tiling(data: np.ndarray, width: int, height: int, small_fraction: float = 0.1) -> bool:
+    """
+    Decide from a full-image pass whether tiles are worth running: when nothing
+    was found, or when some objects are small (short side below `small_fraction`
+    of the image's short side), since others of that size are the ones a
+    downscaled pass misses.
+    """
+    if len(data) == 0:
+        return True
+    sides = np.minimum(data[:, 2] - data[:, 0], data[:, 3] - data[:, 1])
+    return bool((sides < small_fraction * min(width, height)).any())
+
+
+def merge_detections(data: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+    """
+    Greedy class-aware suppression over (N, 6) x1, y1, x2, y2, conf, cls rows
+    collected from the full image and its tiles.
+
+    Overlap is measured as intersection over the smaller box rather than IoU:
+    an object cut by a tile border leaves a partial box that lies almost
+    entirely inside the full one, yet has a low IoU with it.
+    """
+    if len(data) <= 1:
+        return data
+    order = np.argsort(-data[:, 4], kind="stable")
+    data = data[order]
+    x1, y1, x2, y2, cls = data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 5]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+
+    keep = []
+    suppressed = np.zeros(len(data), dtype=bool)
+    for i in range(len(data)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        rest = np.arange(i + 1, len(data))
+        rest = rest[~suppressed[rest] & (cls[rest] == cls[i])]
+        if len(rest) == 0:
+            continue
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        smaller = np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        suppressed[rest[(w * h) / smaller > threshold]] = True
+    return data[keep]
@@ -1,31 +1,158 @@
+"""
+Model training.
+
+    # Local Food-in-Fridge dataset if present, else download + merge the Roboflow datasets
+    python train.py
+
+    # Knowledge distillation: a trained medium teacher trains a nano / small student on
+    # merged_data; teacher and student test mAP and CPU latency are compared in a report
+    python train.py --distill --student yolov8n.pt --epochs 50
+
+    # Fit training into a nightly CPU window: 320 -> 480 -> 640 px stages within 6 hours,
+    # resumable, with a per-stage throughput profile (dataloading / forward / backward)
+    python train.py --schedule --budget-hours 6 --imgsz 640
+"""
 from roboflow import Roboflow
 from ultralytics import YOLO
 from dotenv import load_dotenv
+import argparse
 import os
 import yaml
+import hashlib
+import json
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from dedup import duplicate_report, find_duplicate_groups, hash_images, plan_drops
+from taxonomy import canonical_name
 
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
-def merge_datasets(dataset_paths, output_dir="merged_dataset"):
+MANIFEST_NAME = ".merge_manifest.json"
+DEDUP_REPORT_NAME = "dedup_report.json"
+SPLITS = ['train', 'valid', 'test']
+# Where train_model_local() saves the medium model, and where its merged_data fine-tune goes
+# (distillation runs pass an absolute project dir so ultralytics' runs_dir setting cannot move them)
+LOCAL_WEIGHTS = os.path.join("runs", "detect", "train_enhanced", "weights", "best.pt")
+TEACHER_WEIGHTS = os.path.join("runs", "detect", "teacher", "weights", "best.pt")
+# Augmentation and optimizer settings of train_model_local(), shared with scheduled runs
+LOCAL_HYPERPARAMS = dict(
+    # --- Enable and configure augmentations ---
+    augment=True,         # Enable built-in augmentations
+    hsv_h=0.015,         # Randomly adjust image hue
+    hsv_s=0.7,           # Randomly adjust image saturation
+    hsv_v=0.4,           # Randomly adjust image value (brightness)
+    degrees=10.0,        # Random image rotation (+/- degrees)
+    translate=0.1,       # Random image translation (+/- fraction)
+    scale=0.5,           # Random image scaling (+/- gain)
+    shear=2.0,           # Random image shear (+/- degrees)
+    # --- Tuning other hyperparameters ---
+    lr0=0.01,            # Initial learning rate (SGD)
+    lrf=0.01,            # Final learning rate factor = lr0 * lrf
+    momentum=0.937,      # SGD momentum
+    weight_decay=0.0005, # Optimizer weight decay
+    warmup_epochs=3.0,   # Learning rate warmup epochs
+    warmup_momentum=0.8, # Warmup initial momentum
+    box=7.5,             # Box loss gain
+    cls=0.5,             # Class loss gain
+    dfl=1.5,             # Distribution Focal Loss gain
+)
+_FICLONE = 0x40049409  # Linux ioctl: copy-on-write clone (btrfs, XFS, ...)
+
+
+def _file_hash(path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _link_or_copy(src: Path, dst: Path) -> str:
+    """Hardlink `src` to `dst`, else reflink it, else copy it. Returns the method used."""
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+        return "linked"
+    except OSError:
+        pass
+    try:
+        import fcntl
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return "reflinked"
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(src, dst)
+    return "copied"
+
+
+def _remap_label(src: Path, dst: Path, id_map: dict):
+    new_lines = []
+    with open(src, 'r') as f:
+        for line in f:
+            parts = line.strip().split()
+            if not parts:
+                continue
+            old_id = int(parts[0])
+            # Map ID
+            if old_id in id_map:
+                new_lines.append(f"{id_map[old_id]} {' '.join(parts[1:])}\n")
+    with open(dst, 'w') as f:
+        f.writelines(new_lines)
+
+
+def _load_manifest(output_path: Path):
+    manifest_path = output_path / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def merge_datasets(dataset_paths, output_dir="merged_dataset", canonicalize=False, workers=None,
+                   dedup="off", dedup_distance=16):
     """
     Merges multiple YOLOv8 datasets into one.
     - dataset_paths: list of paths to downloaded datasets (objects with .location attribute)
     - output_dir: path to create the merged dataset
+    - canonicalize: collapse duplicate classes ("apple"/"apples"/"Apple") into one
+      canonical ingredient class using the same taxonomy the API uses
+    - workers: threads used for linking images and remapping labels
+    - dedup: "off", "report" (write dedup_report.json listing near-duplicate
+      groups and cross-split leakage) or "drop" (also train on train.txt, a
+      list without the redundant / leaked train images; valid and test are
+      left as they are)
+    - dedup_distance: max Hamming distance between 256-bit dHashes of near-duplicates
+
+    The merge is incremental: a manifest in output_dir records each source
+    file's size and mtime (plus a content hash for labels), so a re-run only
+    re-links images and rewrites labels whose source or class mapping changed,
+    and deletes outputs whose source is gone. Images are hardlinked (or
+    reflinked, or copied as a last resort) rather than copied.
     """
+    start = time.perf_counter()
     output_path = Path(output_dir)
-    if output_path.exists():
+    manifest = _load_manifest(output_path)
+    if manifest is None and output_path.exists():
+        # Contents of unknown origin: start over like a full merge
         print(f"Removing existing {output_dir}...")
         shutil.rmtree(output_path)
-    
+    manifest = manifest or {"datasets": {}, "files": {}}
+
     # Create structure
-    for split in ['train', 'valid', 'test']:
+    for split in SPLITS:
         (output_path / split / 'images').mkdir(parents=True, exist_ok=True)
         (output_path / split / 'labels').mkdir(parents=True, exist_ok=True)
 
     # 1. Collect all class names
     all_classes = []
+    class_index = {}
     dataset_info = []
 
     print("Analyzing datasets...")
@@ -40,79 +167,133 @@ def merge_datasets(dataset_paths, output_dir="merged_dataset"):
             # Sort by key to ensure order if dict provided
             sorted_keys = sorted(names.keys())
             names = [names[k] for k in sorted_keys]
-            
+        if canonicalize:
+            names = [canonical_name(name) for name in names]
+
         dataset_info.append({
             'location': Path(ds.location),
             'names': names
         })
-        
+
         # Add new classes to master list
         for name in names:
-            if name not in all_classes:
+            if name not in class_index:
+                class_index[name] = len(all_classes)
                 all_classes.append(name)
     
     print(f"Total unique classes found: {len(all_classes)}")
     
-    # 2. Process Datasets
+    # 2. Plan: compare every source file with the manifest
+    old_files = manifest["files"]
+    new_files = {}
+    tasks = []
     for ds_idx, info in enumerate(dataset_info):
         src_root = info['location']
-        src_names = info['names']
-        
         # Map src_id -> dest_id
-        id_map = {}
-        for idx, name in enumerate(src_names):
-            if name in all_classes:
-                id_map[idx] = all_classes.index(name)
-            else:
-                # Should not happen as we just built all_classes
-                print(f"Warning: Class {name} mismatch.")
-
-        print(f"Processing dataset {ds_idx + 1}/{len(dataset_info)} from {src_root}...")
-        
-        for split in ['train', 'valid', 'test']:
+        id_map = {idx: class_index[name] for idx, name in enumerate(info['names'])}
+        # Labels need rewriting when the class mapping changed, even if the file did not
+        ds_key = str(ds_idx)
+        map_changed = manifest["datasets"].get(ds_key) != {str(k): v for k, v in id_map.items()}
+        manifest["datasets"][ds_key] = {str(k): v for k, v in id_map.items()}
+
+        for split in SPLITS:
             src_split_dir = src_root / split
             if not src_split_dir.exists():
-                print(f"  Skipping split {split} (not found)")
+                print(f"  Skipping split {split} of dataset {ds_idx + 1} (not found)")
                 continue
 
-            # Copy Images & Rewrite Labels
             # We assume structure: split/images/file.jpg and split/labels/file.txt
-            src_images = list((src_split_dir / 'images').glob('*'))
-            
-            for img_path in src_images:
-                # Copy Image
+            for img_path in (src_split_dir / 'images').iterdir():
                 # Prefix filename with ds_idx to avoid collisions (e.g. 0_image.jpg)
-                new_filename = f"ds{ds_idx}_{img_path.name}"
-                dest_img_path = output_path / split / 'images' / new_filename
-                shutil.copy2(img_path, dest_img_path)
-                
-                # Process Label
-                label_name = img_path.stem + ".txt"
-                src_label_path = src_split_dir / 'labels' / label_name
-                dest_label_path = output_path / split / 'labels' / f"ds{ds_idx}_{label_name}"
-                
+                items = [('image', img_path, f"{split}/images/ds{ds_idx}_{img_path.name}")]
+                src_label_path = src_split_dir / 'labels' / (img_path.stem + ".txt")
                 if src_label_path.exists():
-                    with open(src_label_path, 'r') as f:
-                        lines = f.readlines()
-                    
-                    new_lines = []
-                    for line in lines:
-                        parts = line.strip().split()
-                        if not parts: continue
-                        
-                        old_id = int(parts[0])
-                        # Map ID
-                        if old_id in id_map:
-                            new_id = id_map[old_id]
-                            new_lines.append(f"{new_id} {' '.join(parts[1:])}\n")
-                    
-                    with open(dest_label_path, 'w') as f:
-                        f.writelines(new_lines)
-
-    # 3. Create merged data.yaml
+                    items.append(('label', src_label_path, f"{split}/labels/ds{ds_idx}_{src_label_path.name}"))
+
+                for kind, src, rel in items:
+                    st = src.stat()
+                    entry = {"src": str(src), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+                    old = old_files.get(rel)
+                    unchanged = (old is not None and old["src"] == entry["src"]
+                                 and old["size"] == entry["size"] and old["mtime_ns"] == entry["mtime_ns"]
+                                 and (output_path / rel).exists())
+                    if kind == 'label':
+                        entry["hash"] = old["hash"] if unchanged else None
+                    elif unchanged and "dhash" in old:
+                        entry["dhash"] = old["dhash"]
+                    if unchanged and (kind == 'image' or not map_changed):
+                        new_files[rel] = entry
+                    else:
+                        tasks.append((kind, src, rel, entry, id_map, old, map_changed))
+
+    # 3. Link images / remap labels in parallel
+    def process(task):
+        kind, src, rel, entry, id_map, old, map_changed = task
+        dst = output_path / rel
+        if kind == 'image':
+            return rel, entry, _link_or_copy(src, dst)
+        entry["hash"] = entry["hash"] or _file_hash(src)
+        if not map_changed and old is not None and old.get("hash") == entry["hash"] and dst.exists():
+            # Touched (e.g. re-downloaded) but identical content
+            return rel, entry, "touched"
+        _remap_label(src, dst, id_map)
+        return rel, entry, "relabeled"
+
+    counts = {}
+    if tasks:
+        print(f"Processing {len(tasks)} new or changed files...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for rel, entry, action in executor.map(process, tasks):
+                new_files[rel] = entry
+                counts[action] = counts.get(action, 0) + 1
+
+    # 4. Drop outputs whose source disappeared
+    removed = 0
+    for rel in set(old_files) - set(new_files):
+        stale = output_path / rel
+        if stale.exists():
+            stale.unlink()
+            removed += 1
+
+    # 5. Near-duplicates (perceptual hashes are cached in the manifest)
+    train_source = 'train/images'
+    train_list = output_path / "train.txt"
+    if dedup != "off":
+        images = [rel for rel in new_files if '/images/' in rel]
+        missing = [rel for rel in images if "dhash" not in new_files[rel]]
+        if missing:
+            print(f"Hashing {len(missing)} images for near-duplicate detection...")
+            for rel, value in zip(missing, hash_images([output_path / rel for rel in missing], workers)):
+                if value is not None:
+                    new_files[rel]["dhash"] = format(value, "x")
+        hashes = {rel: int(new_files[rel]["dhash"], 16) if "dhash" in new_files[rel] else None
+                  for rel in images}
+        groups = find_duplicate_groups(hashes, dedup_distance)
+        dropped = plan_drops(groups) if dedup == "drop" else []
+        report = duplicate_report(groups, len(images), dedup_distance, dropped)
+        with open(output_path / DEDUP_REPORT_NAME, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Near-duplicates: {report['duplicate_images']} images in {report['duplicate_groups']} groups, "
+              f"{report['cross_split_groups']} groups span splits (leaking "
+              f"{report['leaked_eval_images']['valid']} valid / {report['leaked_eval_images']['test']} test "
+              f"images); report: {output_path / DEDUP_REPORT_NAME}")
+
+        if dedup == "drop":
+            dropped = set(dropped)
+            kept = sorted(rel for rel in images if rel.startswith('train/') and rel not in dropped)
+            with open(train_list, 'w') as f:
+                f.writelines(f"./{rel}\n" for rel in kept)
+            train_source = 'train.txt'
+            print(f"Dropped {len(dropped)} train images, training on {len(kept)} (listed in {train_list})")
+    if train_source != 'train.txt' and train_list.exists():
+        train_list.unlink()
+    if dedup == "off" and (output_path / DEDUP_REPORT_NAME).exists():
+        (output_path / DEDUP_REPORT_NAME).unlink()
+
+    # 6. Create merged data.yaml
     merged_yaml = {
         'path': str(output_path.absolute()),
-        'train': 'train/images',
+        'train': train_source,
         'val': 'valid/images',
         'test': 'test/images',
         'nc': len(all_classes),
@@ -121,11 +302,30 @@ def merge_datasets(dataset_paths, output_dir="merged_dataset"):
     
     with open(output_path / "data.yaml", 'w') as f:
         yaml.dump(merged_yaml, f, sort_keys=False)
-        
-    print(f"Merged dataset created at {output_path}")
+
+    manifest["files"] = new_files
+    manifest["datasets"] = {k: v for k, v in manifest["datasets"].items() if int(k) < len(dataset_info)}
+    with open(output_path / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f)
+
+    unchanged = len(new_files) - len(tasks)
+    summary = ", ".join(f"{count} {action}" for action, count in sorted(counts.items())) or "nothing to do"
+    print(f"Merged dataset created at {output_path} ({summary}; {unchanged} up to date, "
+          f"{removed} removed) in {time.perf_counter() - start:.1f}s")
     return str(output_path / "data.yaml")
 
 
+def _packed_trainer(data_yaml_path, imgsz):
+    """Trainer kwargs for PACKED_DATASET=1 (memory-mapped shards), else none."""
+    if os.getenv("PACKED_DATASET", "0") != "1":
+        return {}
+    from shards import ShardDetectionTrainer, pack_dataset
+
+    print("Packing merged dataset into memory-mapped shards...")
+    pack_dataset(data_yaml_path, imgsz=imgsz)
+    return {"trainer": ShardDetectionTrainer}
+
+
 def train_model_local():
     """Train YOLO model on local Food-in-Fridge dataset."""
     print("\n" + "=" * 60)
@@ -161,25 +361,7 @@ def train_model_local():
         batch=16,             # Set explicitly - use largest value your GPU VRAM allows (e.g., -1 for auto on GPU)
         patience=30,          # Increased from 10
         device="cpu",           # Use GPU ("0" for first GPU, "cpu" for CPU)
-        # --- Enable and configure augmentations ---
-        augment=True,         # Enable built-in augmentations
-        hsv_h=0.015,         # Randomly adjust image hue
-        hsv_s=0.7,           # Randomly adjust image saturation
-        hsv_v=0.4,           # Randomly adjust image value (brightness)
-        degrees=10.0,        # Random image rotation (+/- degrees)
-        translate=0.1,       # Random image translation (+/- fraction)
-        scale=0.5,           # Random image scaling (+/- gain)
-        shear=2.0,           # Random image shear (+/- degrees)
-        # --- Tuning other hyperparameters ---
-        lr0=0.01,            # Initial learning rate (SGD)
-        lrf=0.01,            # Final learning rate factor = lr0 * lrf
-        momentum=0.937,      # SGD momentum
-        weight_decay=0.0005, # Optimizer weight decay
-        warmup_epochs=3.0,   # Learning rate warmup epochs
-        warmup_momentum=0.8, # Warmup initial momentum
-        box=7.5,             # Box loss gain
-        cls=0.5,             # Class loss gain
-        dfl=1.5,             # Distribution Focal Loss gain
+        **LOCAL_HYPERPARAMS,  # Augmentations and tuned hyperparameters
         project="runs/detect",
         name="train_enhanced",
         verbose=True
@@ -210,19 +392,190 @@ def train_model_roboflow():
     d2 = p2.version(1).download("yolov8")
 
     print("Merging datasets...")
-    data_yaml_path = merge_datasets([d1, d2], output_dir="merged_data")
+    data_yaml_path = merge_datasets(
+        [d1, d2], output_dir="merged_data",
+        canonicalize=os.getenv("CANONICAL_CLASSES", "0") == "1",
+        dedup=os.getenv("MERGE_DEDUP", "report"),
+        dedup_distance=int(os.getenv("MERGE_DEDUP_DISTANCE", "16")),
+    )
+
+    train_kwargs = _packed_trainer(data_yaml_path, imgsz=640)
 
     print("Starting YOLOv8 training on merged dataset...")
     # Load a model
     model = YOLO("yolov8n.pt") 
 
     # Train
-    results = model.train(data=data_yaml_path, epochs=20, imgsz=640)
+    results = model.train(data=data_yaml_path, epochs=20, imgsz=640, **train_kwargs)
     
     print("Training complete.")
     print(f"Best model weights should be saved in: {results.save_dir}/weights/best.pt")
 
 
+def _local_data_yaml(data_yaml, run_dir):
+    """
+    The committed merged_data/data.yaml carries the `path` of the machine that
+    merged it; if that does not exist here, train from a copy pointing at the
+    yaml's own directory.
+    """
+    with open(data_yaml, 'r') as f:
+        data = yaml.safe_load(f)
+    if data.get('path') and os.path.isdir(data['path']):
+        return data_yaml
+    data['path'] = os.path.dirname(os.path.abspath(data_yaml))
+    os.makedirs(run_dir, exist_ok=True)
+    local_yaml = os.path.join(run_dir, "data.yaml")
+    with open(local_yaml, 'w') as f:
+        yaml.dump(data, f, sort_keys=False)
+    return local_yaml
+
+
+def _class_names(weights):
+    names = YOLO(weights).names
+    return [names[k] for k in sorted(names)]
+
+
+def _distill_teacher(data_yaml, names, teacher, imgsz, epochs, train_kwargs):
+    """
+    Teacher and student must predict the same classes. train_model_local()'s
+    medium model only knows the Food-in-Fridge classes, so unless a teacher
+    for merged_data exists it is fine-tuned on merged_data first (once;
+    TEACHER_WEIGHTS is reused by later runs).
+    """
+    candidates = [teacher] if teacher else [TEACHER_WEIGHTS, LOCAL_WEIGHTS]
+    for path in candidates:
+        if os.path.exists(path) and _class_names(path) == names:
+            print(f"✓ Teacher: {path}")
+            return path
+
+    base = next((path for path in candidates if os.path.exists(path)), "yolov8m.pt")
+    print(f"🎓 Fine-tuning teacher {base} on {data_yaml} ({len(names)} classes) for {epochs} epochs...")
+    results = YOLO(base).train(data=data_yaml, epochs=epochs, imgsz=imgsz, project=os.path.abspath("runs/detect"),
+                               name="teacher", exist_ok=True, **train_kwargs)
+    return os.path.join(str(results.save_dir), "weights", "best.pt")
+
+
+def _model_summary(weights, report):
+    """Test-set accuracy and single-image CPU latency from an evaluate_offline() report."""
+    import torch
+
+    model = torch.load(weights, map_location="cpu", weights_only=False)
+    model = (model.get("ema") or model["model"]) if isinstance(model, dict) else model
+    # Empty if the latency benchmark was skipped (e.g. no test images to time)
+    latency = report.get("latency", {}).get("pytorch", {}).get("1", {})
+    return {
+        "weights": weights,
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "map50_95": report["metrics"]["map50_95"],
+        "map50": report["metrics"]["map50"],
+        "cpu_latency_p50_ms": latency.get("end_to_end", {}).get("p50_ms"),
+        "cpu_latency_p95_ms": latency.get("end_to_end", {}).get("p95_ms"),
+        "cpu_throughput_ips": latency.get("throughput_ips"),
+    }
+
+
+def train_model_distill(data_yaml="merged_data/data.yaml", teacher=None, student="yolov8n.pt", epochs=50,
+                        imgsz=640, dis=6.0, teacher_epochs=30, latency_images=32):
+    """
+    Knowledge distillation with ultralytics' DistillationModel: the student's
+    neck features and head outputs are pulled towards the frozen teacher's
+    (loss weight `dis`) on top of the usual detection loss. Afterwards both
+    models are scored on the test split and timed on the CPU, and the
+    comparison is saved next to the student weights as distill_report.json.
+    """
+    from evaluate import evaluate_offline, load_local_dataset
+
+    print("\n" + "=" * 60)
+    print("🧪 YOLO TRAINING - KNOWLEDGE DISTILLATION")
+    print("=" * 60)
+    if not os.path.exists(data_yaml):
+        raise FileNotFoundError(f"{data_yaml} not found (run train.py without --distill to build merged_data)")
+    # Packed from the original yaml: split paths in the run-dir copy are relative to another directory
+    train_kwargs = _packed_trainer(data_yaml, imgsz)
+    data_yaml = _local_data_yaml(data_yaml, os.path.join("runs", "detect", "distill_data"))
+    names = load_local_dataset(data_yaml)['names']
+
+    teacher = _distill_teacher(data_yaml, names, teacher, imgsz, teacher_epochs, train_kwargs)
+
+    print(f"🔥 Distilling {teacher} into {student}...")
+    results = YOLO(student).train(data=data_yaml, epochs=epochs, imgsz=imgsz, distill_model=teacher, dis=dis,
+                                  project=os.path.abspath("runs/detect"), name="distill", **train_kwargs)
+    student_weights = os.path.join(str(results.save_dir), "weights", "best.pt")
+
+    # Same test split, input size and single-image CPU timing for both
+    summaries = {}
+    for role, weights in (("teacher", teacher), ("student", student_weights)):
+        print(f"\n📏 Evaluating {role}...")
+        report = evaluate_offline(data_yaml, weights=weights, split="test", batch_sizes=(1,),
+                                  latency_images=latency_images, device="cpu", imgsz=imgsz,
+                                  output=os.path.join(str(results.save_dir), f"eval_{role}.json"))
+        summaries[role] = _model_summary(weights, report)
+
+    t, st = summaries["teacher"], summaries["student"]
+    comparison = {
+        "teacher": t,
+        "student": st,
+        "imgsz": imgsz,
+        "dis": dis,
+        "map50_95_retained": st["map50_95"] / t["map50_95"] if t["map50_95"] else None,
+        "cpu_speedup": (t["cpu_latency_p50_ms"] / st["cpu_latency_p50_ms"]
+                        if t["cpu_latency_p50_ms"] and st["cpu_latency_p50_ms"] else None),
+    }
+    report_path = os.path.join(str(results.save_dir), "distill_report.json")
+    with open(report_path, 'w') as f:
+        json.dump(comparison, f, indent=2)
+
+    print("=" * 60)
+    print(f"{'':<8} {'params':>10} {'mAP50-95':>9} {'mAP50':>7} {'CPU p50 ms':>11}")
+    for role, m in (("teacher", t), ("student", st)):
+        latency = f"{m['cpu_latency_p50_ms']:>11.1f}" if m["cpu_latency_p50_ms"] is not None else f"{'n/a':>11}"
+        print(f"{role:<8} {m['parameters']:>10,} {m['map50_95']:>9.4f} {m['map50']:>7.4f} {latency}")
+    if comparison["map50_95_retained"] is not None:
+        print(f"Student keeps {comparison['map50_95_retained'] * 100:.0f}% of the teacher's mAP50-95")
+    if comparison["cpu_speedup"] is not None:
+        print(f"Student is {comparison['cpu_speedup']:.1f}x faster on the CPU")
+    else:
+        print("CPU speedup: n/a (latency benchmark did not run)")
+    print(f"📄 Report: {report_path}")
+    print(f"🚀 Serve it with YOLO_MODEL_PATH={student_weights}")
+    print("=" * 60)
+    return comparison
+
+
+def train_model_scheduled(budget_hours, data_yaml=None, model="yolov8m.pt", imgsz=1280,
+                          stages="0.5:0.3,0.75:0.3,1:0.4", name="schedule", batch=16, device="cpu"):
+    """
+    train_model_local()'s training fitted into a wall-clock budget (e.g. a
+    nightly CPU window) with progressive resizing; see train_schedule.py.
+    Re-running with the same settings resumes an interrupted schedule.
+    """
+    from train_schedule import parse_stages, run_schedule
+
+    if data_yaml is None:
+        data_yaml = ("Food-in-Fridge-1/data.yaml" if os.path.exists("Food-in-Fridge-1/data.yaml")
+                     else os.path.join("merged_data", "data.yaml"))
+    run_dir = os.path.abspath(os.path.join("runs", "detect", name))
+    # Shards for every stage size, packed once from the original yaml (not the run-dir copy)
+    stage_trainers = {size: _packed_trainer(data_yaml, size)
+                      for size in sorted({stage["imgsz"] for stage in parse_stages(stages, imgsz)})}
+    data_yaml = _local_data_yaml(data_yaml, run_dir)
+
+    print("\n" + "=" * 60)
+    print(f"⏱️  YOLO TRAINING - {budget_hours:g} h BUDGET, PROGRESSIVE RESIZING TO {imgsz}")
+    print("=" * 60)
+    print(f"📊 Dataset: {data_yaml}")
+    print(f"📦 Model: {model}, stages (size scale:budget share): {stages}")
+    state = run_schedule(model, data_yaml, budget_hours, imgsz, stages=stages, run_dir=run_dir,
+                         stage_kwargs=stage_trainers.get,
+                         batch=batch, patience=30, device=device, **LOCAL_HYPERPARAMS)
+    print("=" * 60)
+    print(f"📄 Schedule and throughput profile: {os.path.join(run_dir, 'schedule.json')}")
+    if state["weights"]:
+        print(f"🚀 Serve it with YOLO_MODEL_PATH={state['weights']}")
+    print("=" * 60)
+    return state
+
+
 def train_model():
     """Main training function - tries local first, then Roboflow."""
     # Try local dataset first
@@ -234,5 +587,40 @@ def train_model():
         train_model_roboflow()
 
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--distill", action="store_true", help="Distill a trained teacher into a small student")
+    parser.add_argument("--schedule", action="store_true",
+                        help="Time-budgeted training with progressive image sizes (resumable)")
+    parser.add_argument("--data", default=None,
+                        help="Dataset yaml (default: merged_data/data.yaml; --schedule prefers Food-in-Fridge-1)")
+    parser.add_argument("--teacher", default=None,
+                        help=f"Teacher weights (default: {TEACHER_WEIGHTS}, else fine-tuned from {LOCAL_WEIGHTS})")
+    parser.add_argument("--student", default="yolov8n.pt", help="Student model, e.g. yolov8n.pt or yolov8s.pt")
+    parser.add_argument("--epochs", type=int, default=50, help="Student epochs")
+    parser.add_argument("--teacher-epochs", type=int, default=30, help="Epochs if the teacher must be fine-tuned")
+    parser.add_argument("--imgsz", type=int, default=None, help="Image size (default: 640, --schedule: 1280)")
+    parser.add_argument("--dis", type=float, default=6.0, help="Distillation loss weight")
+    parser.add_argument("--budget-hours", type=float, default=8.0, help="Wall-clock budget of a --schedule run")
+    parser.add_argument("--stages", default="0.5:0.3,0.75:0.3,1:0.4",
+                        help="Schedule stages as image size scale:budget share, ending at scale 1")
+    parser.add_argument("--model", default="yolov8m.pt", help="Model a --schedule run starts from")
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--name", default="schedule", help="Run name; the same name resumes a schedule")
+    args = parser.parse_args()
+
+    if args.schedule:
+        train_model_scheduled(args.budget_hours, args.data, model=args.model, imgsz=args.imgsz or 1280,
+                              stages=args.stages, name=args.name, batch=args.batch, device=args.device)
+        return
+    if not args.distill:
+        train_model()
+        return
+    train_model_distill(args.data or os.path.join("merged_data", "data.yaml"), teacher=args.teacher,
+                        student=args.student, epochs=args.epochs,
+                        imgsz=args.imgsz or 640, dis=args.dis, teacher_epochs=args.teacher_epochs)
+
+
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    main()
\ No newline at end of file
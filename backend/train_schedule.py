@@ -0,0 +1,266 @@
+"""
+Time-budgeted, progressive-resolution training.
+
+A wall-clock budget is split over stages that train at increasing image
+sizes (e.g. 640 -> 960 -> 1280 for a 1280 target), each stage starting from
+the previous stage's last.pt. Stages use ultralytics' `time` argument, so
+the number of epochs follows from the measured epoch time; time a stage
+leaves unused (early stopping) or overruns is carried over to the rest.
+
+State is kept in <run_dir>/schedule.json after every stage, so an
+interrupted run picks up where it stopped: finished stages are skipped and
+an interrupted stage is started again from its last.pt with what is left
+of its budget. Only the weights carry over; that new run has a fresh
+optimizer, LR schedule and epoch count (a real ultralytics resume keeps
+the checkpoint's arguments and counts its `time` budget from epoch 0).
+
+Every stage is profiled with ThroughputProfiler: images/sec, and step time
+split into dataloading, forward and backward, plus the time spent on
+validation and checkpoints between epochs.
+"""
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+PARTS = ("dataloading", "forward", "backward")
+STATE_NAME = "schedule.json"
+MIN_STAGE_SECONDS = 60
+# What to try when a part dominates the profile
+HINTS = {
+    "dataloading": "more DataLoader workers, cache='ram'/'disk' or PACKED_DATASET=1",
+    "forward": "a smaller model or smaller early-stage image sizes",
+    "backward": "a smaller model or freezing the backbone (freeze=10)",
+    "epoch_end": "a smaller validation split (this also covers saving last.pt after every epoch)",
+}
+
+
+class ThroughputProfiler:
+    """
+    Splits training step time, from trainer callbacks plus a forward hook on
+    the model, into:
+
+        dataloading   waiting for the next batch from the DataLoader
+        forward       batch preprocessing, forward pass and loss
+        backward      backward pass and optimizer step
+
+    Validation and checkpoint saving between epochs are timed as epoch_end.
+    `previous` is an earlier report() to add to (a restarted stage).
+    """
+    def __init__(self, previous: Optional[Dict] = None):
+        previous = previous or {}
+        self.seconds = {part: 0.0 for part in (*PARTS, "epoch_end")}
+        self.seconds.update(previous.get("seconds", {}))
+        self.images = previous.get("images", 0)
+        self.batches = previous.get("batches", 0)
+        self.epochs = previous.get("epochs", 0)
+        self._mark = None
+        self._hook = None
+        self._sync = None
+
+    def attach(self, model):
+        """Register the callbacks on an ultralytics YOLO model before calling train()."""
+        for event, callback in (("on_train_start", self._on_train_start),
+                                ("on_train_epoch_start", self._on_epoch_start),
+                                ("on_train_batch_start", self._on_batch_start),
+                                ("on_train_batch_end", self._on_batch_end),
+                                ("on_train_epoch_end", self._on_epoch_end),
+                                ("on_fit_epoch_end", self._on_fit_epoch_end),
+                                ("on_train_end", self._on_train_end)):
+            model.add_callback(event, callback)
+
+    def _now(self) -> float:
+        if self._sync is not None:
+            self._sync()  # GPU work is asynchronous; CPU timings need no sync
+        return time.perf_counter()
+
+    def _lap(self, part: str):
+        now = self._now()
+        if self._mark is not None:
+            self.seconds[part] += now - self._mark
+        self._mark = now
+
+    def _on_train_start(self, trainer):
+        if trainer.device.type == "cuda":
+            import torch
+            self._sync = torch.cuda.synchronize
+        self._hook = trainer.model.register_forward_hook(self._on_forward)
+
+    def _on_epoch_start(self, trainer):
+        self._mark = self._now()
+
+    def _on_batch_start(self, trainer):
+        self._lap("dataloading")
+
+    def _on_forward(self, module, args, output):
+        if not module.training:
+            return
+        self._lap("forward")
+        batch = args[0] if args else None
+        self.images += len(batch["img"]) if isinstance(batch, dict) else len(batch)
+
+    def _on_batch_end(self, trainer):
+        self._lap("backward")
+        self.batches += 1
+
+    def _on_epoch_end(self, trainer):
+        self.epochs += 1
+        self._mark = self._now()
+
+    def _on_fit_epoch_end(self, trainer):
+        self._lap("epoch_end")
+
+    def _on_train_end(self, trainer):
+        if self._hook is not None:
+            self._hook.remove()
+            self._hook = None
+
+    def report(self) -> Dict:
+        step = sum(self.seconds[part] for part in PARTS)
+        return {
+            "epochs": self.epochs,
+            "batches": self.batches,
+            "images": self.images,
+            "images_per_s": self.images / step if step else 0.0,
+            "seconds": dict(self.seconds),
+            "step_share": {part: self.seconds[part] / step if step else 0.0 for part in PARTS},
+            # Throughput if that part were the only cost
+            "images_per_s_by_part": {part: self.images / self.seconds[part] if self.seconds[part] else None
+                                     for part in PARTS},
+        }
+
+
+def parse_stages(spec: str, target_imgsz: int) -> List[Dict]:
+    """
+    '0.5:0.3,0.75:0.3,1:0.4' -> image size as a fraction of the target (rounded
+    to a multiple of 32) : share of the time budget, per stage.
+    """
+    stages = []
+    for item in spec.split(","):
+        scale, _, share = item.partition(":")
+        imgsz = max(32, int(round(float(scale) * target_imgsz / 32)) * 32)
+        stages.append({"imgsz": imgsz, "share": float(share or 1)})
+    if stages[-1]["imgsz"] != target_imgsz:
+        raise ValueError(f"The last stage must train at the target size {target_imgsz}, got {stages[-1]['imgsz']}")
+    return stages
+
+
+def _load_state(path: str, config: Dict) -> Dict:
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if state["config"] != config:
+            raise ValueError(f"{path} belongs to a run with different settings ({state['config']}); "
+                             "use another run name to start a new schedule")
+        print(f"↩️  Resuming schedule from {path}")
+        return state
+    return {"config": config, "stages": [dict(stage, status="pending", elapsed_s=0.0) for stage in config["stages"]]}
+
+
+def _save_state(path: str, state: Dict):
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _print_profile(state: Dict):
+    print(f"\n{'stage':<6} {'imgsz':>5} {'epochs':>6} {'time s':>8} {'img/s':>7} "
+          f"{'data':>6} {'fwd':>6} {'bwd':>6} {'end s':>7}  status")
+    for i, stage in enumerate(state["stages"]):
+        p = stage.get("profile")
+        if p is None:
+            print(f"{i + 1:<6} {stage['imgsz']:>5} {'-':>6} {stage['elapsed_s']:>8.0f} {'-':>7} "
+                  f"{'-':>6} {'-':>6} {'-':>6} {'-':>7}  {stage['status']}")
+            continue
+        share = p["step_share"]
+        print(f"{i + 1:<6} {stage['imgsz']:>5} {p['epochs']:>6} {stage['elapsed_s']:>8.0f} {p['images_per_s']:>7.1f} "
+              f"{share['dataloading']:>6.0%} {share['forward']:>6.0%} {share['backward']:>6.0%} "
+              f"{p['seconds']['epoch_end']:>7.0f}  {stage['status']}")
+
+
+def run_schedule(model: str, data: str, budget_hours: float, target_imgsz: int,
+                 stages: str = "0.5:0.3,0.75:0.3,1:0.4", run_dir: str = os.path.join("runs", "detect", "schedule"),
+                 epochs: int = 150, stage_kwargs: Optional[Callable[[int], Dict]] = None, **train_args) -> Dict:
+    """
+    Train `model` on `data` within `budget_hours` of wall-clock time through the
+    progressive-resolution `stages`; `train_args` go to every model.train() call
+    and `stage_kwargs(imgsz)` can add per-size ones (e.g. a shard trainer).
+    Returns the schedule state; the final weights are in state["weights"].
+    """
+    from ultralytics import YOLO
+
+    run_dir = os.path.abspath(run_dir)
+    os.makedirs(run_dir, exist_ok=True)
+    state_path = os.path.join(run_dir, STATE_NAME)
+    config = {"model": model, "data": os.path.abspath(data), "budget_hours": budget_hours,
+              "target_imgsz": target_imgsz, "stages": parse_stages(stages, target_imgsz), "epochs": epochs}
+    state = _load_state(state_path, config)
+    budget_s = budget_hours * 3600
+
+    weights = model
+    for i, stage in enumerate(state["stages"]):
+        last = i == len(state["stages"]) - 1
+        stage_dir = os.path.join(run_dir, f"stage{i}_{stage['imgsz']}")
+        if stage["status"] == "done":
+            weights = stage["last"]
+            continue
+
+        # An interrupted stage restarts from its own last.pt (weights only: optimizer,
+        # LR schedule and epochs start over) with what is left of its share
+        resume_from = os.path.join(stage_dir, "weights", "last.pt")
+        resumed = stage["status"] == "running" and os.path.exists(resume_from)
+        start = resume_from if resumed else weights
+        remaining = budget_s - sum(s["elapsed_s"] for s in state["stages"][:i])
+        shares = sum(s["share"] for s in state["stages"][i:])
+        stage_budget = remaining * stage["share"] / shares - stage["elapsed_s"]
+        if stage_budget < MIN_STAGE_SECONDS:
+            print(f"⏭️  Stage {i + 1} ({stage['imgsz']} px): {max(stage_budget, 0):.0f}s of budget left, skipped")
+            stage["status"] = "skipped"
+            _save_state(state_path, state)
+            weights = start
+            continue
+
+        print(f"\n📐 Stage {i + 1}/{len(state['stages'])}: {stage['imgsz']} px for up to "
+              f"{stage_budget / 60:.1f} min, from {start}")
+        stage["status"] = "running"
+        _save_state(state_path, state)
+
+        profiler = ThroughputProfiler(stage.get("profile"))
+        yolo = YOLO(start)
+        profiler.attach(yolo)
+        args = dict(train_args)
+        if i > 0 or start != model:
+            args["warmup_epochs"] = 0  # continuing from trained weights
+        if not last:
+            args.update(close_mosaic=0, val=False)  # mosaic until the final stage; validate at its end only
+        args.update(stage_kwargs(stage["imgsz"]) if stage_kwargs else {})
+
+        started = time.perf_counter()
+        try:
+            results = yolo.train(data=data, imgsz=stage["imgsz"], epochs=epochs, time=stage_budget / 3600,
+                                 project=run_dir, name=os.path.basename(stage_dir), exist_ok=True, **args)
+        finally:
+            stage["elapsed_s"] += time.perf_counter() - started
+            stage["profile"] = profiler.report()
+            _save_state(state_path, state)
+
+        weights = os.path.join(str(results.save_dir), "weights", "last.pt")
+        stage.update(status="done", last=weights, best=os.path.join(str(results.save_dir), "weights", "best.pt"),
+                     metrics={k: float(v) for k, v in getattr(results, "results_dict", {}).items()})
+        _save_state(state_path, state)
+
+    done = [s for s in state["stages"] if s["status"] == "done"]
+    state["weights"] = done[-1]["best"] if done else None
+    state["elapsed_s"] = sum(s["elapsed_s"] for s in state["stages"])
+    _save_state(state_path, state)
+
+    _print_profile(state)
+    print(f"Total {state['elapsed_s'] / 3600:.2f} h of {budget_hours:.2f} h budget; weights: {state['weights']}")
+    profiled = [s["profile"] for s in state["stages"] if s.get("profile")]
+    if profiled:
+        totals = {part: sum(p["seconds"][part] for p in profiled) for part in (*PARTS, "epoch_end")}
+        slowest = max(totals, key=totals.get)
+        print(f"Most time went to {slowest} ({totals[slowest] / max(sum(totals.values()), 1e-9):.0%}); "
+              f"to speed it up try {HINTS[slowest]}.")
+    return state
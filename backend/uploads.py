@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from typing import Dict
+
+
+class UploadStore:
+    """
+    Opt-in debug store for uploaded images.
+
+    Uploads are normally decoded straight from memory and never touch the
+    disk. When enabled, each upload is also written to `directory`, and the
+    directory is trimmed after every write: files older than `max_age_seconds`
+    are deleted first, then the oldest remaining files until the total size
+    is under `max_bytes`.
+    """
+    def __init__(self, directory: str = "temp_uploads", max_bytes: int = 500 * 1024 * 1024,
+                 max_age_seconds: float = 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def save(self, filename: str, data: bytes) -> str:
+        path = os.path.join(self.directory, os.path.basename(filename))
+        with open(path, "wb") as f:
+            f.write(data)
+        self.evict()
+        return path
+
+    def evict(self) -> Dict:
+        """Apply the age and size limits. Returns what was removed."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+            entries.sort()  # oldest first
+
+            removed_files = 0
+            removed_bytes = 0
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                too_old = now - mtime > self.max_age_seconds
+                too_big = total > self.max_bytes
+                if not (too_old or too_big):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed_files += 1
+                removed_bytes += size
+
+            return {"removed_files": removed_files, "removed_bytes": removed_bytes}
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that rejects request bodies larger than `max_bytes` with
+    413 before they are buffered: a too-large Content-Length is refused
+    without reading the body, and chunked bodies are counted as they stream
+    in and cut off as soon as they pass the limit.
+    """
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.exceptions import HTTPException
+        from starlette.responses import JSONResponse
+
+        detail = f"Upload too large (limit {self.max_bytes} bytes)"
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside body parsing, so FastAPI turns it into the response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
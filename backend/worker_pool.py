@@ -0,0 +1,398 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+from preprocess import prepare_image, scale_boxes
+
+
+def _worker_main(worker_id: int, conn, model_path: str, cores: Optional[List[int]]):
+    """Entry point of a pool process: load the model once, then serve requests."""
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            print(f"Worker {worker_id}: could not pin to cores {cores}: {e}")
+    if cores:
+        # Keep intra-op threads within this worker's core slice
+        try:
+            import torch
+            torch.set_num_threads(len(cores))
+        except ImportError:
+            pass
+
+    from services import YoloService
+    # The detection cache lives in the parent (in front of all workers)
+    service = YoloService(model_path, cache_mode="off")
+    conn.send(("ready", dict(service.model.names), service.decode_size, service.model_fingerprint,
+               service.model_path))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        kind = msg[0]
+        if kind == "stop":
+            break
+        if kind == "ping":
+            conn.send(("pong",))
+            continue
+
+        _, task_id, shm_name, shape = msg
+        try:
+            # Picks up replaced weights like in-process YoloService.detect() does
+            service._check_weights()
+            # Attaching re-registers the block with the resource tracker the
+            # parent shares with us; the parent still owns and unlinks it.
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+                # Same path as in-process inference (including YOLO_TILING);
+                # x1, y1, x2, y2, conf, cls per row
+                data = service.detect_arrays([image])[0].astype(np.float32)
+                del image
+            finally:
+                shm.close()
+            conn.send(("result", task_id, data, service.model_fingerprint))
+        except Exception as e:
+            conn.send(("error", task_id, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """Parent-side handle: owns one process and the thread that feeds it."""
+    def __init__(self, pool: "YoloWorkerPool", worker_id: int, cores: Optional[List[int]]):
+        self.pool = pool
+        self.worker_id = worker_id
+        self.cores = cores
+        self.process = None
+        self.conn = None
+        self.thread = None
+        self.restarts = 0
+        self.tasks_done = 0
+        self.last_health_check = None
+        self.healthy = False
+
+    def spawn(self):
+        self.launch()
+        self.wait_ready()
+
+    def launch(self):
+        parent_conn, child_conn = self.pool.ctx.Pipe()
+        self.process = self.pool.ctx.Process(
+            target=_worker_main,
+            args=(self.worker_id, child_conn, self.pool.model_path, self.cores),
+            name=f"yolo-worker-{self.worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def wait_ready(self):
+        if not self.conn.poll(self.pool.startup_timeout):
+            raise RuntimeError(f"Worker {self.worker_id} did not load the model in time")
+        msg = self.conn.recv()
+        if msg[0] != "ready":
+            raise RuntimeError(f"Worker {self.worker_id} failed to start: {msg}")
+        self.pool.names, self.pool.decode_size, _, self.pool.weights_path = msg[1:]
+        self.pool.update_fingerprint(msg[3])
+        self.healthy = True
+        print(f"YOLO worker {self.worker_id} ready (pid={self.process.pid}, cores={self.cores})")
+
+    def kill(self):
+        self.healthy = False
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=5)
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def restart(self, reason: str):
+        print(f"Restarting YOLO worker {self.worker_id}: {reason}")
+        self.kill()
+        self.restarts += 1
+        while self.pool.running:
+            try:
+                self.spawn()
+                return
+            except Exception as e:
+                print(f"YOLO worker {self.worker_id} failed to restart: {e!r}")
+                self.kill()
+                time.sleep(1.0)
+
+    def _wait_reply(self, timeout: float):
+        """Wait for one message, or None on timeout / dead process."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                if self.conn.poll(min(remaining, 0.5)):
+                    return self.conn.recv()
+            except (EOFError, OSError):
+                return None
+            if not self.process.is_alive():
+                return None
+
+    def health_check(self):
+        try:
+            self.conn.send(("ping",))
+        except (BrokenPipeError, OSError):
+            self.restart("pipe closed")
+            return
+        reply = self._wait_reply(self.pool.health_timeout)
+        self.last_health_check = time.time()
+        if reply is None or reply[0] != "pong":
+            self.restart("failed health check")
+
+    def run(self):
+        while self.pool.running:
+            try:
+                item = self.pool.tasks.get(timeout=self.pool.health_interval)
+            except queue.Empty:
+                self.health_check()
+                continue
+            if item is None:
+                break
+
+            image, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._run_cached(image, future)
+
+    def _run_cached(self, image, future: Future):
+        """Serve from the pool's detection cache, else run the task and cache its result."""
+        cache = self.pool.cache
+        if not cache.enabled:
+            self._run_task(image, future)
+            return
+        self.pool.check_weights()
+        try:
+            key, source = cache.key(image, self.pool.model_fingerprint, self.pool.decode_size)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        cached = cache.get(key)
+        if cached is not None:
+            future.set_result(cached)
+            return
+        self._run_task(source, future, key)
+
+    def _run_task(self, image, future: Future, cache_key: tuple = None):
+        if not self.process.is_alive():
+            self.restart("process exited")
+        try:
+            with STAGE_SECONDS.time("decode"):
+                # At the workers' decode size: larger than imgsz when tiling is on
+                prepared = prepare_image(image, self.pool.decode_size)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        # Images are decoded at about the size inference needs, which also keeps the shared block small
+        array = prepared.array
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        try:
+            np.ndarray(array.shape, dtype=np.uint8, buffer=shm.buf)[...] = array
+            task_id = id(future)
+            # Includes the round trip to the worker process
+            start = time.perf_counter()
+            try:
+                self.conn.send(("detect", task_id, shm.name, array.shape))
+            except (BrokenPipeError, OSError):
+                future.set_exception(RuntimeError(f"YOLO worker {self.worker_id} is down"))
+                self.restart("pipe closed")
+                return
+
+            reply = self._wait_reply(self.pool.task_timeout)
+            STAGE_SECONDS.observe("inference", time.perf_counter() - start)
+            if reply is None:
+                future.set_exception(RuntimeError(f"YOLO worker {self.worker_id} crashed or timed out"))
+                self.restart("no reply to detect request")
+                return
+            if reply[0] == "error":
+                future.set_exception(RuntimeError(reply[2]))
+                return
+
+            self.tasks_done += 1
+            with STAGE_SECONDS.time("postprocess"):
+                result = self.pool.format_result(scale_boxes(reply[2], prepared))
+            self.pool.update_fingerprint(reply[3])
+            # Not cached if the weights changed under this task (or this worker has not reloaded yet)
+            if cache_key is not None and cache_key[0] == reply[3] == self.pool.model_fingerprint:
+                self.pool.cache.put(cache_key, result)
+            future.set_result(result)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def stats(self) -> Dict:
+        return {
+            "worker_id": self.worker_id,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": bool(self.process is not None and self.process.is_alive()),
+            "healthy": self.healthy,
+            "cores": self.cores,
+            "restarts": self.restarts,
+            "tasks_done": self.tasks_done,
+            "last_health_check": self.last_health_check,
+        }
+
+
+class YoloWorkerPool:
+    """
+    Runs YOLO in N separate processes so inference is not bound by one
+    interpreter's GIL. Each process loads the model once at startup.
+
+    Images are decoded in the parent and handed to a worker through a
+    shared memory block; the worker runs the same detection path as
+    YoloService (tiling included) and returns the raw box array
+    (x1, y1, x2, y2, conf, cls), which is turned into the usual detect()
+    result here. The detection cache sits in the parent, in front of the
+    workers.
+    """
+    def __init__(self, num_workers: int, model_path: str = None, pin_cores: bool = True,
+                 health_interval: float = 5.0, health_timeout: float = 5.0,
+                 task_timeout: float = 60.0, startup_timeout: float = 120.0):
+        from services import DetectionCache, find_model_path
+
+        self.num_workers = max(1, int(num_workers))
+        self.model_path = model_path or find_model_path()
+        self.pin_cores = pin_cores
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.task_timeout = task_timeout
+        self.startup_timeout = startup_timeout
+        # Reported by the workers once their YoloService is loaded
+        self.decode_size = int(os.getenv("YOLO_IMGSZ", "640"))
+        self.weights_path = self.model_path
+        self.model_fingerprint = None
+        self.cache = DetectionCache()
+        # Fingerprints of replaced weights, so a worker that has not reloaded yet cannot switch back
+        self._retired_fingerprints = set()
+        self._fingerprint_lock = threading.Lock()
+        self._last_weights_check = time.monotonic()
+
+        # spawn: never fork a process that already has torch threads running
+        self.ctx = mp.get_context("spawn")
+        self.tasks: "queue.Queue" = queue.Queue()
+        self.names: Dict[int, str] = {}
+        self._labels = None
+        self.running = False
+        self.workers: List[_Worker] = []
+
+    def _core_slices(self) -> List[Optional[List[int]]]:
+        if not self.pin_cores or not hasattr(os, "sched_getaffinity"):
+            return [None] * self.num_workers
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) < self.num_workers:
+            return [None] * self.num_workers
+        per_worker = len(cores) // self.num_workers
+        return [cores[i * per_worker:(i + 1) * per_worker] for i in range(self.num_workers)]
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.workers = [_Worker(self, i, cores) for i, cores in enumerate(self._core_slices())]
+        # Load the model in all processes concurrently
+        for worker in self.workers:
+            worker.launch()
+        for worker in self.workers:
+            worker.wait_ready()
+            worker.thread = threading.Thread(target=worker.run, name=f"yolo-pool-{worker.worker_id}", daemon=True)
+            worker.thread.start()
+        print(f"YOLO worker pool started with {self.num_workers} processes")
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            if worker.thread is not None:
+                worker.thread.join(timeout=self.task_timeout)
+            try:
+                worker.conn.send(("stop",))
+            except Exception:
+                pass
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+            worker.kill()
+
+        while True:
+            try:
+                item = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("YOLO worker pool stopped"))
+
+    def submit(self, image) -> Future:
+        """Queue an image (path, bytes or BGR array); resolves to a detect() result."""
+        future = Future()
+        if not self.running:
+            future.set_exception(RuntimeError("YOLO worker pool is not running"))
+            return future
+        self.tasks.put((image, future))
+        return future
+
+    @property
+    def labels(self):
+        """LabelTable for the workers' model (rebuilt if a restarted worker reports other classes)."""
+        from taxonomy import LabelTable
+
+        if self._labels is None or len(self._labels) != len(self.names):
+            self._labels = LabelTable(self.names)
+        return self._labels
+
+    def format_result(self, data: np.ndarray) -> Dict:
+        from services import format_detections
+
+        return format_detections(data, self.labels)
+
+    def check_weights(self):
+        """
+        Cache hits never reach a worker, so the parent also watches the weights
+        file (at most once a second, like YoloService._check_weights).
+        """
+        from services import _weights_fingerprint
+
+        now = time.monotonic()
+        if now - self._last_weights_check < 1.0:
+            return
+        self._last_weights_check = now
+        self.update_fingerprint(_weights_fingerprint(self.weights_path))
+
+    def update_fingerprint(self, fingerprint: str):
+        """Adopt new weights: cached detections of the old ones are dropped."""
+        with self._fingerprint_lock:
+            if fingerprint == self.model_fingerprint or fingerprint in self._retired_fingerprints:
+                return
+            if self.model_fingerprint is not None:
+                print(f"Model weights changed on disk ({fingerprint}), clearing the pool's detection cache")
+                self._retired_fingerprints.add(self.model_fingerprint)
+                self.cache.clear()
+            self.model_fingerprint = fingerprint
+
+    def cache_stats(self) -> Dict:
+        return self.cache.stats()
+
+    def stats(self) -> Dict:
+        return {
+            "num_workers": self.num_workers,
+            "queue_depth": self.tasks.qsize(),
+            "workers": [worker.stats() for worker in self.workers],
+        }